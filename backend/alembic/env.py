@@ -0,0 +1,52 @@
+# File: env.py
+# Alembic environment - runs the migrations in alembic/versions against the app database
+# Author: Caitlin Coulombe
+# Last Updated: 2025-07-20
+
+from logging.config import fileConfig
+from alembic import context
+from sqlalchemy import create_engine, pool
+from sqlalchemy.engine import URL
+from app.config import settings
+
+config = context.config
+
+if config.config_file_name is not None:
+    fileConfig(config.config_file_name)
+
+# the migrations are written in plain SQL so there is no metadata to autogenerate from
+target_metadata = None
+
+database_url = URL.create(
+    "postgresql+psycopg",
+    username=settings.database_username,
+    password=settings.database_password,
+    host=settings.database_hostname,
+    port=int(settings.database_port),
+    database=settings.database_name,
+)
+
+
+# emit the SQL to stdout instead of running it (alembic upgrade head --sql)
+def run_migrations_offline():
+    context.configure(url=database_url.render_as_string(hide_password=False), target_metadata=target_metadata, literal_binds=True)
+
+    with context.begin_transaction():
+        context.run_migrations()
+
+
+# run the migrations against the database
+def run_migrations_online():
+    connectable = create_engine(database_url, poolclass=pool.NullPool)
+
+    with connectable.connect() as connection:
+        context.configure(connection=connection, target_metadata=target_metadata)
+
+        with context.begin_transaction():
+            context.run_migrations()
+
+
+if context.is_offline_mode():
+    run_migrations_offline()
+else:
+    run_migrations_online()
@@ -0,0 +1,68 @@
+"""baseline schema
+
+Creates the tables the routers query. Every statement uses IF NOT EXISTS so the
+migration can be stamped onto the existing production database without changes.
+
+Revision ID: 0001
+Revises:
+Create Date: 2025-07-20
+
+"""
+from alembic import op
+
+revision = "0001"
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute("""CREATE TABLE IF NOT EXISTS users (
+                  id SERIAL PRIMARY KEY,
+                  email VARCHAR NOT NULL UNIQUE,
+                  password VARCHAR NOT NULL,
+                  display_name VARCHAR NOT NULL,
+                  created_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW())""")
+
+    op.execute("""CREATE TABLE IF NOT EXISTS posts (
+                  id SERIAL PRIMARY KEY,
+                  content VARCHAR NOT NULL,
+                  published BOOLEAN NOT NULL DEFAULT TRUE,
+                  created_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW(),
+                  user_id INTEGER NOT NULL REFERENCES users (id) ON DELETE CASCADE)""")
+
+    op.execute("""CREATE TABLE IF NOT EXISTS likes (
+                  post_id INTEGER NOT NULL REFERENCES posts (id) ON DELETE CASCADE,
+                  user_id INTEGER NOT NULL REFERENCES users (id) ON DELETE CASCADE,
+                  PRIMARY KEY (post_id, user_id))""")
+
+    op.execute("""CREATE TABLE IF NOT EXISTS comments (
+                  id SERIAL PRIMARY KEY,
+                  content VARCHAR NOT NULL,
+                  post_id INTEGER NOT NULL REFERENCES posts (id) ON DELETE CASCADE,
+                  user_id INTEGER NOT NULL REFERENCES users (id) ON DELETE CASCADE,
+                  parent_id INTEGER REFERENCES comments (id) ON DELETE CASCADE,
+                  created_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW())""")
+
+    op.execute("""CREATE TABLE IF NOT EXISTS files (
+                  id SERIAL PRIMARY KEY,
+                  filename VARCHAR NOT NULL,
+                  filepath VARCHAR NOT NULL,
+                  uploaded_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW(),
+                  post_id INTEGER NOT NULL REFERENCES posts (id) ON DELETE CASCADE)""")
+
+    op.execute("""CREATE TABLE IF NOT EXISTS profile_pictures (
+                  id SERIAL PRIMARY KEY,
+                  filename VARCHAR NOT NULL,
+                  filepath VARCHAR NOT NULL,
+                  uploaded_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW(),
+                  user_id INTEGER NOT NULL REFERENCES users (id) ON DELETE CASCADE)""")
+
+
+def downgrade():
+    op.execute("DROP TABLE IF EXISTS profile_pictures")
+    op.execute("DROP TABLE IF EXISTS files")
+    op.execute("DROP TABLE IF EXISTS comments")
+    op.execute("DROP TABLE IF EXISTS likes")
+    op.execute("DROP TABLE IF EXISTS posts")
+    op.execute("DROP TABLE IF EXISTS users")
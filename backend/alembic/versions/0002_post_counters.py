@@ -0,0 +1,28 @@
+"""denormalized like and comment counters on posts
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2025-07-20
+
+"""
+from alembic import op
+
+revision = "0002"
+down_revision = "0001"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute("""ALTER TABLE posts
+                  ADD COLUMN IF NOT EXISTS like_count INTEGER NOT NULL DEFAULT 0,
+                  ADD COLUMN IF NOT EXISTS comment_count INTEGER NOT NULL DEFAULT 0""")
+
+    # backfill the counters from the existing likes and comments
+    op.execute("""UPDATE posts SET
+                  like_count = (SELECT COUNT(*) FROM likes WHERE likes.post_id = posts.id),
+                  comment_count = (SELECT COUNT(*) FROM comments WHERE comments.post_id = posts.id)""")
+
+
+def downgrade():
+    op.execute("""ALTER TABLE posts DROP COLUMN IF EXISTS like_count, DROP COLUMN IF EXISTS comment_count""")
@@ -0,0 +1,25 @@
+"""resized image variants for post media and profile pictures
+
+Each row stores a JSON list of {key, url, width, format} for the variants generated on upload.
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2025-07-25
+
+"""
+from alembic import op
+
+revision = "0003"
+down_revision = "0002"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute("""ALTER TABLE files ADD COLUMN IF NOT EXISTS variants JSONB NOT NULL DEFAULT '[]'::jsonb""")
+    op.execute("""ALTER TABLE profile_pictures ADD COLUMN IF NOT EXISTS variants JSONB NOT NULL DEFAULT '[]'::jsonb""")
+
+
+def downgrade():
+    op.execute("""ALTER TABLE profile_pictures DROP COLUMN IF EXISTS variants""")
+    op.execute("""ALTER TABLE files DROP COLUMN IF EXISTS variants""")
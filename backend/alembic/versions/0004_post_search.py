@@ -0,0 +1,26 @@
+"""full text search on post content
+
+Postgres keeps the generated tsvector column up to date on every insert and update.
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2025-07-26
+
+"""
+from alembic import op
+
+revision = "0004"
+down_revision = "0003"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute("""ALTER TABLE posts ADD COLUMN IF NOT EXISTS search_vector tsvector
+                  GENERATED ALWAYS AS (to_tsvector('english', COALESCE(content, ''))) STORED""")
+    op.execute("""CREATE INDEX IF NOT EXISTS posts_search_vector_idx ON posts USING GIN (search_vector)""")
+
+
+def downgrade():
+    op.execute("""DROP INDEX IF EXISTS posts_search_vector_idx""")
+    op.execute("""ALTER TABLE posts DROP COLUMN IF EXISTS search_vector""")
@@ -0,0 +1,28 @@
+"""outbox of s3 objects waiting to be deleted
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2025-07-31
+
+"""
+from alembic import op
+
+revision = "0005"
+down_revision = "0004"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute("""CREATE TABLE IF NOT EXISTS s3_deletions (
+                  id BIGSERIAL PRIMARY KEY,
+                  key VARCHAR NOT NULL,
+                  attempts INTEGER NOT NULL DEFAULT 0,
+                  last_error VARCHAR,
+                  available_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW(),
+                  created_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW())""")
+    op.execute("""CREATE INDEX IF NOT EXISTS s3_deletions_available_at_idx ON s3_deletions (available_at)""")
+
+
+def downgrade():
+    op.execute("""DROP TABLE IF EXISTS s3_deletions""")
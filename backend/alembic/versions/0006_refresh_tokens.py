@@ -0,0 +1,34 @@
+"""refresh tokens
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2025-08-03
+
+"""
+from alembic import op
+
+revision = "0006"
+down_revision = "0005"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # only a hash of each token is stored; every token issued from one login shares a family, so reusing an old token
+    # can revoke the whole chain
+    op.execute("""CREATE TABLE IF NOT EXISTS refresh_tokens (
+                  id BIGSERIAL PRIMARY KEY,
+                  token_hash CHAR(64) NOT NULL UNIQUE,
+                  family UUID NOT NULL,
+                  user_id INTEGER NOT NULL REFERENCES users (id) ON DELETE CASCADE,
+                  expires_at TIMESTAMP WITH TIME ZONE NOT NULL,
+                  used_at TIMESTAMP WITH TIME ZONE,
+                  revoked_at TIMESTAMP WITH TIME ZONE,
+                  created_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW())""")
+    op.execute("""CREATE INDEX IF NOT EXISTS refresh_tokens_family_idx ON refresh_tokens (family)""")
+    op.execute("""CREATE INDEX IF NOT EXISTS refresh_tokens_user_id_idx ON refresh_tokens (user_id)""")
+    op.execute("""CREATE INDEX IF NOT EXISTS refresh_tokens_revoked_at_idx ON refresh_tokens (revoked_at) WHERE revoked_at IS NOT NULL""")
+
+
+def downgrade():
+    op.execute("""DROP TABLE IF EXISTS refresh_tokens""")
@@ -0,0 +1,48 @@
+"""indexes matched to the query paths
+
+Revision ID: 0007
+Revises: 0006
+Create Date: 2025-08-05
+
+"""
+from alembic import op
+
+revision = "0007"
+down_revision = "0006"
+branch_labels = None
+depends_on = None
+
+# name -> definition, each matched to the queries that need it (python -m bench.explain_queries checks them)
+INDEXES = {
+    # home feed: WHERE published = %s ORDER BY created_at DESC, id DESC (plus the keyset cursor on the same columns)
+    "posts_published_created_at_idx": "posts (published, created_at DESC, id DESC)",
+    # a user's page: WHERE user_id = %s AND published = %s, same order - also used by ON DELETE CASCADE from users
+    "posts_user_id_created_at_idx": "posts (user_id, published, created_at DESC, id DESC)",
+    # liked_by_me / bulk like check: WHERE user_id = %s AND post_id = ANY(%s) (the primary key leads with post_id)
+    "likes_user_id_post_id_idx": "likes (user_id, post_id)",
+    # all comments of a post, oldest first
+    "comments_post_id_created_at_idx": "comments (post_id, created_at, id)",
+    # comment threads: the top level comments of a post, oldest first
+    "comments_post_id_threads_idx": "comments (post_id, created_at, id) WHERE parent_id IS NULL",
+    # replies of a comment, oldest first - also used when a parent comment is deleted with its replies
+    "comments_parent_id_created_at_idx": "comments (parent_id, created_at, id) WHERE parent_id IS NOT NULL",
+    # ON DELETE CASCADE from users
+    "comments_user_id_idx": "comments (user_id)",
+    # media of a page of posts: WHERE post_id = ANY(%s)
+    "files_post_id_idx": "files (post_id)",
+    # avatars of a page of authors: WHERE user_id = ANY(%s)
+    "profile_pictures_user_id_idx": "profile_pictures (user_id)",
+}
+
+
+def upgrade():
+    # built without locking the tables against writes, which can't happen inside a transaction
+    with op.get_context().autocommit_block():
+        for name, definition in INDEXES.items():
+            op.execute(f"""CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} ON {definition}""")
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        for name in INDEXES:
+            op.execute(f"""DROP INDEX CONCURRENTLY IF EXISTS {name}""")
@@ -0,0 +1,60 @@
+"""follows and precomputed home timelines
+
+Revision ID: 0008
+Revises: 0007
+Create Date: 2025-08-09
+
+"""
+from alembic import op
+
+revision = "0008"
+down_revision = "0007"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # denormalized like posts.like_count (see app/counters.py) - follower_count also decides whether an author's posts
+    # are fanned out or pulled (see app/timelines.py)
+    op.execute("""ALTER TABLE users
+                  ADD COLUMN IF NOT EXISTS follower_count INTEGER NOT NULL DEFAULT 0,
+                  ADD COLUMN IF NOT EXISTS following_count INTEGER NOT NULL DEFAULT 0""")
+
+    # the primary key serves "does A follow B" and a user's following list, the followee index their followers list
+    # and the fan-out of their posts
+    op.execute("""CREATE TABLE IF NOT EXISTS follows (
+                  follower_id INTEGER NOT NULL REFERENCES users (id) ON DELETE CASCADE,
+                  followee_id INTEGER NOT NULL REFERENCES users (id) ON DELETE CASCADE,
+                  created_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW(),
+                  PRIMARY KEY (follower_id, followee_id),
+                  CHECK (follower_id <> followee_id))""")
+    op.execute("""CREATE INDEX IF NOT EXISTS follows_follower_id_created_at_idx ON follows (follower_id, created_at DESC, followee_id DESC)""")
+    op.execute("""CREATE INDEX IF NOT EXISTS follows_followee_id_created_at_idx ON follows (followee_id, created_at DESC, follower_id DESC)""")
+
+    # one row per post in each follower's home timeline, keyed so a page is a range read in feed order
+    # (created_at is the post's, author_id lets an unfollow remove the author's posts)
+    op.execute("""CREATE TABLE IF NOT EXISTS timelines (
+                  user_id INTEGER NOT NULL REFERENCES users (id) ON DELETE CASCADE,
+                  created_at TIMESTAMP WITH TIME ZONE NOT NULL,
+                  post_id INTEGER NOT NULL REFERENCES posts (id) ON DELETE CASCADE,
+                  author_id INTEGER NOT NULL,
+                  PRIMARY KEY (user_id, created_at, post_id))""")
+    op.execute("""CREATE INDEX IF NOT EXISTS timelines_post_id_idx ON timelines (post_id)""")
+
+    # new posts waiting to be copied into their followers' timelines
+    op.execute("""CREATE TABLE IF NOT EXISTS timeline_fanout (
+                  post_id INTEGER PRIMARY KEY REFERENCES posts (id) ON DELETE CASCADE,
+                  queued_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW())""")
+
+    # the authors whose posts are pulled at read time: WHERE follower_count >= %s
+    with op.get_context().autocommit_block():
+        op.execute("""CREATE INDEX CONCURRENTLY IF NOT EXISTS users_follower_count_idx ON users (follower_count)""")
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.execute("""DROP INDEX CONCURRENTLY IF EXISTS users_follower_count_idx""")
+    op.execute("""DROP TABLE IF EXISTS timeline_fanout""")
+    op.execute("""DROP TABLE IF EXISTS timelines""")
+    op.execute("""DROP TABLE IF EXISTS follows""")
+    op.execute("""ALTER TABLE users DROP COLUMN IF EXISTS follower_count, DROP COLUMN IF EXISTS following_count""")
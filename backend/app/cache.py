@@ -0,0 +1,208 @@
+# File: cache.py
+# Small in-process caches used to skip repeated database lookups, and the response cache for public pages
+# (feed, single posts, comments) which can either live in-process or in a shared redis instance
+# Author: Caitlin Coulombe
+# Last Updated: 2025-07-27
+
+import json
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+# the shared backend is optional - only needed when response_cache_url is set
+try:
+    import redis.asyncio as redis
+except ImportError:
+    redis = None
+
+
+# bounded least-recently-used cache where every entry also expires ttl seconds after it was stored
+class TTLCache:
+    def __init__(self, maxsize: int = 1024, ttl: float = 60.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()     # key -> (expires_at, value), least recently used first
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    # return the cached value, or default when it is missing or expired
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or entry[0] <= time.monotonic():
+                if entry is not None:
+                    del self._data[key]
+                self.misses += 1
+                return default
+
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key, value, ttl: float = None):
+        if self.maxsize <= 0:
+            return
+
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    # store the value only if there is no live entry for the key, and return whichever value ends up cached
+    def add(self, key, value, ttl: float = None):
+        if self.maxsize <= 0:
+            return value
+
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and entry[0] > now:
+                return entry[1]
+
+            self._data[key] = (now + (self.ttl if ttl is None else ttl), value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+            return value
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"size": len(self._data), "maxsize": self.maxsize, "hits": self.hits, "misses": self.misses}
+
+
+# ----------------------- RESPONSE CACHE -----------------------
+# a backend stores bytes under string keys and only needs three operations:
+#   get_many(keys) -> values (None when missing)
+#   set(key, value, ttl)
+#   add(key, value, ttl) -> stores the value only if the key is missing and returns whichever value is stored
+
+# in-process backend, each worker has its own copy (also the local stand-in for the shared backend in development)
+class LocalCacheBackend:
+    def __init__(self, maxsize: int = 1024, ttl: float = 30.0):
+        self._cache = TTLCache(maxsize=maxsize, ttl=ttl)
+
+    async def get_many(self, keys: list) -> list:
+        return [self._cache.get(key) for key in keys]
+
+    async def set(self, key: str, value, ttl: float):
+        self._cache.set(key, value, ttl=ttl)
+
+    async def add(self, key: str, value, ttl: float):
+        return self._cache.add(key, value, ttl=ttl)
+
+    def stats(self) -> dict:
+        return {"type": "local", **self._cache.stats()}
+
+
+# redis backend shared by every worker, so an invalidation in one worker is seen by all of them
+class RedisCacheBackend:
+    def __init__(self, url: str):
+        if redis is None:
+            raise RuntimeError("response_cache_url is set but the redis package is not installed (pip install redis)")
+        self._client = redis.from_url(url)
+
+    async def get_many(self, keys: list) -> list:
+        return await self._client.mget(keys)
+
+    async def set(self, key: str, value, ttl: float):
+        await self._client.set(key, value, px=max(int(ttl * 1000), 1))
+
+    async def add(self, key: str, value, ttl: float):
+        await self._client.set(key, value, px=max(int(ttl * 1000), 1), nx=True)
+        stored = await self._client.get(key)
+        return value if stored is None else stored
+
+    def stats(self) -> dict:
+        return {"type": "redis"}
+
+
+# where a response would be stored, returned by ResponseCache.lookup together with the cached body (None on a miss)
+class CachedResponse:
+    __slots__ = ("key", "body")
+
+    def __init__(self, key: str, body: bytes = None):
+        self.key = key
+        self.body = body
+
+
+# caches serialized responses under a name, the request parameters and a set of tags
+# every tag has a generation token that is part of the key, so invalidating a tag replaces its token and every
+# response stored under the old one can no longer be found (it simply expires). A response computed while an
+# invalidation happens is stored under the old token, so it can never be served stale.
+class ResponseCache:
+    # generations outlive the responses stored under them
+    GENERATION_TTL = 24 * 60 * 60
+
+    def __init__(self, backend, ttl: float = 30.0, prefix: str = "resp"):
+        self.backend = backend
+        self.ttl = ttl
+        self.prefix = prefix
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+
+    def _generation_key(self, tag: str) -> str:
+        return f"{self.prefix}:gen:{tag}"
+
+    @staticmethod
+    def _new_generation() -> str:
+        return uuid.uuid4().hex[:12]
+
+    async def _generations(self, tags: list) -> list:
+        generations = await self.backend.get_many([self._generation_key(tag) for tag in tags])
+        for i, generation in enumerate(generations):
+            # a tag that was never invalidated (or whose token was evicted) gets a brand new token
+            if generation is None:
+                generations[i] = await self.backend.add(self._generation_key(tags[i]), self._new_generation(), self.GENERATION_TTL)
+        return [g.decode() if isinstance(g, bytes) else g for g in generations]
+
+    # find the cached response for these parameters - keep the result to pass to store() on a miss
+    async def lookup(self, name: str, params: dict, tags: list) -> CachedResponse:
+        try:
+            generations = await self._generations(tags)
+            key = f"{self.prefix}:{name}:{json.dumps(params, sort_keys=True, default=str)}:{'.'.join(generations)}"
+            body = (await self.backend.get_many([key]))[0]
+        except Exception as e:
+            # an unreachable cache only costs the database a query, it never fails the request
+            print(f"cache: Lookup failed for {name}: {e}")
+            self.errors += 1
+            return CachedResponse(None)
+
+        if body is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return CachedResponse(key, body)
+
+    async def store(self, entry: CachedResponse, body: bytes):
+        if entry.key is None:
+            return
+        try:
+            await self.backend.set(entry.key, body, self.ttl)
+        except Exception as e:
+            print(f"cache: Store failed for {entry.key}: {e}")
+            self.errors += 1
+
+    # drop every cached response tagged with any of the passed tags
+    async def invalidate(self, *tags: str):
+        for tag in tags:
+            try:
+                await self.backend.set(self._generation_key(tag), self._new_generation(), self.GENERATION_TTL)
+            except Exception as e:
+                print(f"cache: Invalidation of {tag} failed: {e}")
+                self.errors += 1
+
+    def stats(self) -> dict:
+        return {"hits": self.hits, "misses": self.misses, "errors": self.errors, "ttl": self.ttl, "backend": self.backend.stats()}
@@ -0,0 +1,171 @@
+# File: comments.py
+# Builds the comments for the comment endpoints, with the authors' avatars fetched for the whole page at once
+# Threads (top level comments with their first replies nested) are read with a single query
+# The comment writes are single statements too, keeping posts.comment_count in step (see app/counters.py)
+# Like the posts in app/feed.py, comments are plain dicts with the fields of sch.CommentOut / sch.CommentThreadOut
+# Author: Caitlin Coulombe
+# Last Updated: 2025-08-04
+
+from typing import List
+from fastapi import status, HTTPException
+from app import feed
+from app import pagination
+from app import ownership
+
+# every comment query shares the same author join, only the WHERE/ORDER BY differ
+COMMENT_COLUMNS = """comments.id, comments.content, comments.post_id, comments.user_id, comments.parent_id, comments.created_at,
+                    users.id AS author_id,
+                    users.email AS author_email,
+                    users.created_at AS author_created_at,
+                    users.display_name AS author_display_name"""
+COMMENT_SELECT = f"""SELECT {COMMENT_COLUMNS}
+                    FROM comments
+                    JOIN users ON comments.user_id = users.id"""
+
+# oldest first, with the id as a tie breaker so the order matches the (created_at, id) pagination cursor
+COMMENT_ORDER = "comments.created_at ASC, comments.id ASC"
+
+
+# profile pictures of every author in rows, in one query
+async def author_pictures(cursor, rows) -> dict:
+    author_ids = list({row["author_id"] for row in rows})
+    if not author_ids:
+        return {}
+
+    await cursor.execute("""SELECT user_id, filename, filepath, variants FROM profile_pictures WHERE user_id = ANY(%s)""", (author_ids,))
+    return {pic["user_id"]: feed.media_dict(pic) for pic in await cursor.fetchall()}
+
+# the fields of a CommentOut for a row from COMMENT_SELECT
+def comment_dict(row, profile_pics: dict) -> dict:
+    comment = {key: row[key] for key in ("id", "content", "post_id", "user_id", "parent_id", "created_at")}
+
+    # group the author information
+    comment["author"] = {
+        "id": row["author_id"],
+        "email": row["author_email"],
+        "created_at": row["author_created_at"],
+        "display_name": row["author_display_name"],
+        "profile_pic": profile_pics.get(row["author_id"]),
+    }
+    return comment
+
+
+# run the comment query with the passed filter and return the page of comments
+async def fetch_comments(cursor, where: str, params: tuple, limit: int, offset: int = 0) -> List[dict]:
+    await cursor.execute(f"""{COMMENT_SELECT}
+                         WHERE {where}
+                         ORDER BY {COMMENT_ORDER}
+                         LIMIT %s OFFSET %s""", (*params, limit, offset))
+    rows = await cursor.fetchall()
+
+    profile_pics = await author_pictures(cursor, rows)
+    return [comment_dict(row, profile_pics) for row in rows]
+
+
+# a page of top level comments, each with its first reply_limit replies and the cursor to load the rest
+# the comments and replies come from one query (the replies are ranked per thread with a window function),
+# plus one query for the avatars
+async def fetch_threads(cursor, post_id: int, limit: int, reply_limit: int, after: str = None) -> List[dict]:
+    where = "comments.post_id = %s AND comments.parent_id IS NULL"
+    params = [post_id]
+
+    if after:
+        created_at, last_id = pagination.decode_cursor(after)
+        where += " AND (comments.created_at, comments.id) > (%s, %s)"
+        params.extend([created_at, last_id])
+
+    await cursor.execute(f"""WITH parents AS (
+                                SELECT comments.* FROM comments
+                                WHERE {where}
+                                ORDER BY {COMMENT_ORDER}
+                                LIMIT %s),
+                            replies AS (
+                                SELECT comments.*,
+                                ROW_NUMBER() OVER (PARTITION BY comments.parent_id ORDER BY {COMMENT_ORDER}) AS reply_rank,
+                                COUNT(*) OVER (PARTITION BY comments.parent_id) AS reply_count
+                                FROM comments
+                                WHERE comments.parent_id IN (SELECT id FROM parents)),
+                            thread AS (
+                                SELECT parents.*, 0 AS reply_rank,
+                                COALESCE((SELECT MAX(replies.reply_count) FROM replies WHERE replies.parent_id = parents.id), 0) AS reply_count
+                                FROM parents
+                                UNION ALL
+                                SELECT * FROM replies WHERE reply_rank <= %s)
+                         SELECT {COMMENT_COLUMNS},
+                         comments.reply_rank, comments.reply_count
+                         FROM thread AS comments
+                         JOIN users ON comments.user_id = users.id
+                         ORDER BY {COMMENT_ORDER}""", (*params, limit, reply_limit))
+    rows = await cursor.fetchall()
+
+    profile_pics = await author_pictures(cursor, rows)
+
+    threads = {}
+    for row in rows:
+        if row["reply_rank"] == 0:
+            threads[row["id"]] = {**comment_dict(row, profile_pics), "reply_count": row["reply_count"], "replies": [], "replies_cursor": None}
+    for row in rows:
+        if row["reply_rank"] > 0:
+            threads[row["parent_id"]]["replies"].append(comment_dict(row, profile_pics))
+
+    for thread in threads.values():
+        shown = thread["replies"]
+        if shown and len(shown) < thread["reply_count"]:
+            thread["replies_cursor"] = pagination.encode_cursor(shown[-1]["created_at"], shown[-1]["id"])
+
+    return list(threads.values())
+
+
+# add a top level comment and count it on the post, returns the new comment
+# raises psycopg.errors.ForeignKeyViolation when the post does not exist
+async def insert_comment(cursor, content: str, post_id: int, user_id: int) -> dict:
+    await cursor.execute("""WITH new_comment AS (
+                                INSERT INTO comments (content, post_id, user_id) VALUES (%s, %s, %s)
+                                RETURNING *),
+                            counted AS (
+                                UPDATE posts SET comment_count = comment_count + 1
+                                FROM new_comment WHERE posts.id = new_comment.post_id)
+                            SELECT * FROM new_comment""", (content, post_id, user_id))
+    return await cursor.fetchone()
+
+# add a reply to a top level comment of the post - the parent is checked by the insert itself, and only looked up
+# again to explain a failure (400 when the parent is a reply, there is one level of replies, 404 when it is missing)
+async def insert_reply(cursor, content: str, post_id: int, parent_id: int, user_id: int) -> dict:
+    await cursor.execute("""WITH new_comment AS (
+                                INSERT INTO comments (content, post_id, user_id, parent_id)
+                                SELECT %s, parent.post_id, %s, parent.id FROM comments AS parent
+                                WHERE parent.id = %s AND parent.post_id = %s AND parent.parent_id IS NULL
+                                RETURNING *),
+                            counted AS (
+                                UPDATE posts SET comment_count = comment_count + 1
+                                FROM new_comment WHERE posts.id = new_comment.post_id)
+                            SELECT * FROM new_comment""", (content, user_id, parent_id, post_id))
+    new_comment = await cursor.fetchone()
+    if new_comment:
+        return new_comment
+
+    await cursor.execute("""SELECT parent_id FROM comments WHERE id = %s AND post_id = %s""", (parent_id, post_id))
+    if await cursor.fetchone():
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                            detail=f"Comment with id = {parent_id} is a child and cannot be a parent as well")
+    raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
+                        detail=f"There is not a comment with the id = {parent_id} on the post with the id = {post_id}")
+
+# delete the user's comment along with its replies and uncount them, returns the post id
+# 404/403 when the comment is missing or someone else's
+async def delete_comment(cursor, comment_id: int, user_id: int) -> int:
+    await cursor.execute("""WITH owned AS (
+                                SELECT id FROM comments WHERE id = %s AND user_id = %s),
+                            deleted AS (
+                                DELETE FROM comments
+                                WHERE id = (SELECT id FROM owned) OR parent_id = (SELECT id FROM owned)
+                                RETURNING post_id),
+                            counts AS (SELECT post_id, COUNT(*) AS n FROM deleted GROUP BY post_id),
+                            counted AS (
+                                UPDATE posts SET comment_count = GREATEST(comment_count - counts.n, 0)
+                                FROM counts WHERE posts.id = counts.post_id)
+                            SELECT post_id FROM counts""", (comment_id, user_id))
+    deleted = await cursor.fetchone()
+    if deleted is None:
+        await ownership.raise_not_owned(cursor, "comments", comment_id, "comment")
+    return deleted["post_id"]
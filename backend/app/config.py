@@ -14,12 +14,87 @@ class Settings(BaseSettings):
     secret_key: str
     algorithm: str
     access_token_expire_minutes: int
+
+    # connection pool tuning (defaults are sized for a single small RDS instance)
+    db_connect_timeout: int = 5
+    db_pool_min_size: int = 1
+    db_pool_max_size: int = 10
+    db_pool_acquire_timeout: float = 10.0
+    db_pool_max_idle: float = 300.0
+    db_pool_max_lifetime: float = 3600.0
+    db_pool_health_check_interval: float = 30.0
+
+    # request metrics are served at /metrics; the Server-Timing header (db, s3, auth and render time of each response)
+    # can be turned off to keep the breakdown away from clients
+    server_timing_enabled: bool = True
+    # /metrics and /api/health/* show pool and queue state and slow query text, so they are off (404) until
+    # monitoring_token is set, and then only answer requests sending it as "Authorization: Bearer <token>"
+    monitoring_token: str = ""
+
+    # slow query log - statements over slow_query_threshold_ms (0 turns it off) are appended to slow_query_log_path,
+    # rotated every slow_query_log_max_bytes. slow_query_explain_sample_rate of the slow reads are re-run with
+    # EXPLAIN (ANALYZE, BUFFERS) for the log, each distinct statement at most once per slow_query_explain_interval seconds
+    slow_query_threshold_ms: float = 200.0
+    slow_query_log_path: str = "logs/slow_queries.log"
+    slow_query_log_max_bytes: int = 10 * 1024 * 1024
+    slow_query_log_backups: int = 5
+    slow_query_explain_sample_rate: float = 0.1
+    slow_query_explain_interval: float = 300.0
+
+    # authenticated user caching - with jwt_embed_user_claims the profile is read from the token and the database is skipped
+    principal_cache_size: int = 1024
+    principal_cache_ttl: float = 60.0
+    jwt_embed_user_claims: bool = False
+
+    # refresh tokens - keep access_token_expire_minutes short and let clients refresh instead of logging in again.
+    # Revoked sessions are shared between workers by reloading them every revocation_refresh_interval seconds
+    refresh_token_expire_days: int = 30
+    revocation_refresh_interval: float = 15.0
+
+    # password hashing - bcrypt runs on password_hash_workers threads, and calls beyond password_hash_max_queue waiting
+    # ones are rejected with a 429. Changing bcrypt_rounds rehashes each password on the user's next login
+    bcrypt_rounds: int = 12
+    password_hash_workers: int = 2
+    password_hash_max_queue: int = 32
+
+    # response cache for the feed, posts and comments - set response_cache_url (redis://...) to share it between workers,
+    # response_cache_size = 0 turns the in-process cache off
+    response_cache_size: int = 512
+    response_cache_ttl: float = 30.0
+    response_cache_url: str = ""
+
+    # write-behind like buffer (off by default) - likes are written in batches every like_buffer_flush_interval seconds
+    like_buffer_enabled: bool = False
+    like_buffer_flush_interval: float = 1.0
+    like_buffer_max_size: int = 500
+
+    # home timelines (see app/timelines.py) - new posts are copied into the followers' timelines by a background worker,
+    # except for authors with timeline_pull_threshold followers or more, whose posts are merged in when a timeline is read.
+    # Turn the in-process worker off when running python -m app.timelines instead
+    timeline_fanout_worker_enabled: bool = True
+    timeline_fanout_poll_interval: float = 1.0
+    timeline_fanout_batch_size: int = 50
+    timeline_pull_threshold: int = 5000
     
     aws_access_key_id: str
     aws_secret_access_key: str
     aws_region: str
     s3_bucket_name: str
 
+    # uploads: files larger than one part use a multipart upload with s3_upload_max_concurrency parts in flight,
+    # and a post's files are uploaded media_upload_concurrency at a time
+    s3_upload_part_size: int = 8 * 1024 * 1024
+    s3_upload_max_concurrency: int = 4
+    media_upload_concurrency: int = 3
+    # images are kept in memory while they stream to s3 to resize them afterwards - larger ones are stored without variants
+    media_variant_max_size: int = 25 * 1024 * 1024
+
+    # background deletion of s3 objects (see app/outbox.py) - turn the in-process worker off when running python -m app.outbox instead
+    s3_delete_worker_enabled: bool = True
+    s3_delete_poll_interval: float = 5.0
+    s3_delete_max_attempts: int = 8
+    s3_delete_retry_delay: float = 30.0
+
     class Config:
         env_file = ".env"
         env_file_encoding = "utf-8"
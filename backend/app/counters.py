@@ -0,0 +1,82 @@
+# File: counters.py
+# Maintains the denormalized posts.like_count and posts.comment_count columns, and users.follower_count and
+# users.following_count
+# Likes, comments and follows adjust the counters in the same statement as the write (see app/likes.py,
+# app/comments.py and app/follows.py), and reconcile() / reconcile_follows() repair any drift (e.g. likes, comments
+# and follows removed by ON DELETE CASCADE when a user deletes their account)
+# Run the reconciliation job with: python -m app.counters
+# Author: Caitlin Coulombe
+# Last Updated: 2025-08-09
+
+import asyncio
+from app.database import pool, acquire_db, release_db
+
+
+# recompute the counters from the likes and comments tables, only writing the posts that drifted
+# returns the ids of the posts that were repaired
+async def reconcile(cursor) -> list:
+    await cursor.execute("""UPDATE posts SET
+                   like_count = actual.like_count,
+                   comment_count = actual.comment_count
+                   FROM (
+                        SELECT posts.id,
+                        COALESCE(like_counts.like_count, 0) AS like_count,
+                        COALESCE(comment_counts.comment_count, 0) AS comment_count
+                        FROM posts
+                        LEFT JOIN (
+                            SELECT post_id,
+                            COUNT(*) AS like_count
+                            FROM likes
+                            GROUP BY post_id) AS like_counts ON posts.id = like_counts.post_id
+                        LEFT JOIN (
+                            SELECT post_id,
+                            COUNT(*) AS comment_count
+                            FROM comments
+                            GROUP BY post_id) AS comment_counts ON posts.id = comment_counts.post_id) AS actual
+                   WHERE posts.id = actual.id
+                   AND (posts.like_count <> actual.like_count OR posts.comment_count <> actual.comment_count)
+                   RETURNING posts.id""")
+    return [row["id"] for row in await cursor.fetchall()]
+
+
+# recompute the follow counters from the follows table, only writing the users that drifted
+# returns the ids of the users that were repaired
+async def reconcile_follows(cursor) -> list:
+    await cursor.execute("""UPDATE users SET
+                   follower_count = actual.follower_count,
+                   following_count = actual.following_count
+                   FROM (
+                        SELECT users.id,
+                        COALESCE(followers.n, 0) AS follower_count,
+                        COALESCE(following.n, 0) AS following_count
+                        FROM users
+                        LEFT JOIN (
+                            SELECT followee_id, COUNT(*) AS n
+                            FROM follows
+                            GROUP BY followee_id) AS followers ON users.id = followers.followee_id
+                        LEFT JOIN (
+                            SELECT follower_id, COUNT(*) AS n
+                            FROM follows
+                            GROUP BY follower_id) AS following ON users.id = following.follower_id) AS actual
+                   WHERE users.id = actual.id
+                   AND (users.follower_count <> actual.follower_count OR users.following_count <> actual.following_count)
+                   RETURNING users.id""")
+    return [row["id"] for row in await cursor.fetchall()]
+
+
+# run the reconciliation once against the configured database
+async def main():
+    conn, cursor = await acquire_db()
+    try:
+        repaired = await reconcile(cursor)
+        repaired_users = await reconcile_follows(cursor)
+        await conn.commit()
+        print(f"Reconciled counters for {len(repaired)} post(s): {repaired}")
+        print(f"Reconciled follow counters for {len(repaired_users)} user(s): {repaired_users}")
+    finally:
+        await release_db(conn, cursor)
+        await pool.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
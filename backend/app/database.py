@@ -1,20 +1,305 @@
-import psycopg2;
-from psycopg2.extras import RealDictCursor;
+# File: database.py
+# Async connection pool for the postgres database and the FastAPI dependency that hands out connections
+# Connections use TimedCursor, which reports every statement to app/metrics.py and the slow ones to app/slow_queries.py
+# Author: Caitlin Coulombe
+# Last Updated: 2025-08-08
+
+import asyncio
+import time
+from collections import deque
+import psycopg
+from psycopg.pq import TransactionStatus
+from psycopg.rows import dict_row
 from fastapi import HTTPException, status
 from app.config import settings
+from app import metrics
+from app.slow_queries import slow_query_log
+
+
+# raised when no connection could be handed out before the acquire timeout
+class PoolTimeout(Exception):
+    pass
+
+# raised when a connection is requested after the pool has been shut down
+class PoolClosed(Exception):
+    pass
+
+
+# cursor recording the duration of every statement (and counting it for the current request), logging the slow ones
+class TimedCursor(psycopg.AsyncCursor):
+    async def execute(self, query, params=None, **kwargs):
+        started = time.perf_counter()
+        failed = True
+        try:
+            result = await super().execute(query, params, **kwargs)
+            failed = False
+            return result
+        finally:
+            seconds = time.perf_counter() - started
+            metrics.record_query(seconds)
+            if slow_query_log.is_slow(seconds):
+                slow_query_log.record(self.connection, query, params, seconds, failed)
+
+
+# book keeping for a single physical connection owned by the pool
+class _PooledConnection:
+    __slots__ = ("conn", "created_at", "last_used")
+
+    def __init__(self, conn):
+        now = time.monotonic()
+        self.conn = conn
+        self.created_at = now
+        self.last_used = now
+
+
+# asyncio pool of psycopg AsyncConnections
+# - keeps at least min_size connections open and never more than max_size
+# - connections that sat idle for longer than health_check_interval are pinged before being handed out
+# - idle connections above min_size are closed after max_idle seconds, and every connection is recycled after max_lifetime seconds
+# - callers wait up to acquire_timeout seconds for a free connection before PoolTimeout is raised
+class ConnectionPool:
+    def __init__(self, connect_kwargs: dict, min_size: int = 1, max_size: int = 10, acquire_timeout: float = 10.0,
+                 max_idle: float = 300.0, max_lifetime: float = 3600.0, health_check_interval: float = 30.0):
+        if min_size < 0 or max_size < 1 or min_size > max_size:
+            raise ValueError(f"invalid pool size: min_size={min_size}, max_size={max_size}")
+
+        self.connect_kwargs = connect_kwargs
+        self.min_size = min_size
+        self.max_size = max_size
+        self.acquire_timeout = acquire_timeout
+        self.max_idle = max_idle
+        self.max_lifetime = max_lifetime
+        self.health_check_interval = health_check_interval
+
+        self._idle = deque()        # most recently returned connection is on the right
+        self._in_use = {}           # id(conn) -> _PooledConnection
+        self._size = 0              # idle + in use + connections currently being opened
+        self._waiting = 0
+        self._closed = False
+        self._cond = asyncio.Condition()
+
+        self._counters = {
+            "acquired": 0,
+            "released": 0,
+            "timeouts": 0,
+            "waits": 0,
+            "connections_opened": 0,
+            "connections_closed": 0,
+            "health_check_failures": 0,
+        }
+
+    # open the minimum number of connections up front (called on app startup)
+    async def open(self):
+        async with self._cond:
+            self._closed = False
+            missing = max(self.min_size - self._size, 0)
+            self._size += missing
+
+        opened = []
+        try:
+            for _ in range(missing):
+                opened.append(await self._connect())
+        except Exception as error:
+            print("Connection to database failed while filling the pool")
+            print("Error: ", error)
+        finally:
+            async with self._cond:
+                self._size -= missing - len(opened)
+                self._idle.extend(opened)
+                self._cond.notify_all()
+
+    # close every idle connection and refuse new acquires (called on app shutdown)
+    async def close(self):
+        async with self._cond:
+            self._closed = True
+            idle = list(self._idle)
+            self._idle.clear()
+            self._size -= len(idle)
+            self._cond.notify_all()
+
+        for record in idle:
+            await self._disconnect(record)
+
+    # hand out a connection, waiting up to timeout seconds for one to become free
+    async def acquire(self, timeout: float = None):
+        timeout = self.acquire_timeout if timeout is None else timeout
+        deadline = time.monotonic() + timeout
+        record = None
+
+        async with self._cond:
+            while True:
+                if self._closed:
+                    raise PoolClosed("connection pool is closed")
+                if self._idle:
+                    record = self._idle.pop()
+                    break
+                if self._size < self.max_size:
+                    self._size += 1
+                    break
+
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._counters["timeouts"] += 1
+                    raise PoolTimeout(f"no database connection available after {timeout} seconds")
+
+                self._counters["waits"] += 1
+                self._waiting += 1
+                try:
+                    await asyncio.wait_for(self._cond.wait(), remaining)
+                except asyncio.TimeoutError:
+                    pass
+                finally:
+                    self._waiting -= 1
+
+        try:
+            if record is None:
+                record = await self._connect()
+            else:
+                record = await self._checkout(record)
+        except BaseException:
+            async with self._cond:
+                self._size -= 1
+                self._cond.notify()
+            raise
+
+        self._in_use[id(record.conn)] = record
+        self._counters["acquired"] += 1
 
-def get_db():
+        return record.conn
+
+    # give a connection back to the pool, rolling back anything left uncommitted
+    async def release(self, conn, discard: bool = False):
+        record = self._in_use.pop(id(conn), None)
+        if record is None:
+            raise ValueError("connection does not belong to this pool")
+
+        now = time.monotonic()
+        if not discard and not conn.closed:
+            try:
+                if conn.info.transaction_status != TransactionStatus.IDLE:
+                    await conn.rollback()
+            except psycopg.Error:
+                discard = True
+
+        if conn.closed or now - record.created_at > self.max_lifetime:
+            discard = True
+
+        expired = []
+        async with self._cond:
+            self._counters["released"] += 1
+            if discard or self._closed:
+                self._size -= 1
+                expired.append(record)
+            else:
+                record.last_used = now
+                self._idle.append(record)
+                expired.extend(self._prune_idle(now))
+            self._cond.notify()
+
+        for stale in expired:
+            await self._disconnect(stale)
+
+    # snapshot of the pool state for monitoring
+    def stats(self) -> dict:
+        return {
+            "min_size": self.min_size,
+            "max_size": self.max_size,
+            "size": self._size,
+            "idle": len(self._idle),
+            "in_use": len(self._in_use),
+            "waiting": self._waiting,
+            "closed": self._closed,
+            **self._counters,
+        }
+
+    # validate an idle connection before handing it out, replacing it if it is stale or broken
+    async def _checkout(self, record: _PooledConnection) -> _PooledConnection:
+        now = time.monotonic()
+
+        if record.conn.closed or now - record.created_at > self.max_lifetime or now - record.last_used > self.max_idle:
+            await self._disconnect(record)
+            return await self._connect()
+
+        if now - record.last_used > self.health_check_interval:
+            try:
+                await record.conn.execute("SELECT 1")
+                await record.conn.rollback()
+            except psycopg.Error:
+                self._counters["health_check_failures"] += 1
+                await self._disconnect(record)
+                return await self._connect()
+
+        return record
+
+    # remove idle connections above min_size that have not been used in max_idle seconds (lock must be held)
+    def _prune_idle(self, now: float) -> list:
+        expired = []
+        # the oldest idle connections are on the left
+        while len(self._idle) > 0 and self._size > self.min_size and now - self._idle[0].last_used > self.max_idle:
+            expired.append(self._idle.popleft())
+            self._size -= 1
+        return expired
+
+    async def _connect(self) -> _PooledConnection:
+        conn = await psycopg.AsyncConnection.connect(**self.connect_kwargs)
+        self._counters["connections_opened"] += 1
+        return _PooledConnection(conn)
+
+    async def _disconnect(self, record: _PooledConnection):
+        try:
+            await record.conn.close()
+        except psycopg.Error:
+            pass
+        self._counters["connections_closed"] += 1
+
+
+pool = ConnectionPool(
+    connect_kwargs={
+        "host": settings.database_hostname,
+        "port": settings.database_port,
+        "dbname": settings.database_name,
+        "user": settings.database_username,
+        "password": settings.database_password,
+        "connect_timeout": settings.db_connect_timeout,
+        "cursor_factory": TimedCursor,
+    },
+    min_size=settings.db_pool_min_size,
+    max_size=settings.db_pool_max_size,
+    acquire_timeout=settings.db_pool_acquire_timeout,
+    max_idle=settings.db_pool_max_idle,
+    max_lifetime=settings.db_pool_max_lifetime,
+    health_check_interval=settings.db_pool_health_check_interval,
+)
+
+
+# borrow a connection and a dict row cursor from the pool, raising HTTP errors the routers can pass straight through
+async def acquire_db():
     try:
-        conn = psycopg2.connect(host=settings.database_hostname, 
-                                port=settings.database_port,
-                                database=settings.database_name, 
-                                user=settings.database_username, 
-                                password=settings.database_password) 
-        cursor = conn.cursor(cursor_factory=RealDictCursor)
-        print("Database connection was successful")
-        return conn, cursor
+        conn = await pool.acquire()
+    except PoolTimeout:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Database is busy, please try again")
     except Exception as error:
         print("Connection to database failed")
         print("Error: ", error)
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Database connection failed")
-        exit(0)
\ No newline at end of file
+
+    metrics.record_connection()
+    return conn, conn.cursor(row_factory=dict_row)
+
+# return a connection borrowed with acquire_db to the pool
+async def release_db(conn, cursor):
+    try:
+        await cursor.close()
+    except psycopg.Error:
+        pass
+    await pool.release(conn)
+
+
+# FastAPI dependency: borrow a connection from the pool for the duration of the request
+# the same (conn, cursor) pair is shared by every dependency in a request (including get_current_user) and always goes back to the pool
+async def get_db():
+    conn, cursor = await acquire_db()
+    try:
+        yield conn, cursor
+    finally:
+        await release_db(conn, cursor)
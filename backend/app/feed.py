@@ -0,0 +1,132 @@
+# File: feed.py
+# Builds the posts for the feed, user timeline and single post endpoints.
+# Authors, avatars and media are fetched for the whole page at once instead of once per post.
+# Posts are plain dicts with the fields of sch.PostOut, built straight from the rows and serialized with orjson
+# (see app/responses.py) - nothing in them needs validating again.
+# Author: Caitlin Coulombe
+# Last Updated: 2025-08-10
+
+from typing import List
+from app.likes import like_buffer
+
+# every post query shares the same author join, only the WHERE/ORDER BY differ
+# like_count and comment_count are stored on the post itself (see app/counters.py)
+# the columns are listed explicitly so posts.search_vector is never sent back with the feed
+POST_COLUMNS = """posts.id, posts.content, posts.published, posts.created_at, posts.user_id,
+                 posts.like_count, posts.comment_count,
+                 users.id AS author_id,
+                 users.email AS author_email,
+                 users.created_at AS author_created_at,
+                 users.display_name AS author_display_name"""
+POST_SELECT = f"""SELECT {POST_COLUMNS}
+                 FROM posts
+                 JOIN users ON posts.user_id = users.id"""
+
+
+# MediaOut fields for a files or profile_pictures row (the variants also store their s3 key, which isn't sent)
+def media_dict(row) -> dict:
+    srcset = [{"url": variant["url"], "width": variant["width"], "format": variant["format"]} for variant in row.get("variants") or []]
+    return {"filename": row["filename"], "url": row["filepath"], "srcset": srcset}
+
+
+# ids of the passed posts that the user has liked, in one query on the likes primary key
+async def liked_post_ids(cursor, user_id: int, post_ids: List[int]) -> set:
+    if not post_ids:
+        return set()
+    await cursor.execute("""SELECT post_id FROM likes WHERE user_id = %s AND post_id = ANY(%s)""", (user_id, list(post_ids)))
+    liked = {row["post_id"] for row in await cursor.fetchall()}
+    return with_pending_likes(liked, user_id, post_ids)
+
+# likes still waiting in the write-behind buffer
+def with_pending_likes(liked: set, user_id: int, post_ids: List[int]) -> set:
+    if like_buffer is not None:
+        for post_id, is_liked in like_buffer.pending_for(user_id, post_ids).items():
+            if is_liked:
+                liked.add(post_id)
+            else:
+                liked.discard(post_id)
+    return liked
+
+# set like_count and liked_by_me on posts that were already serialized, in one query on the posts and likes primary keys
+# cached pages are shared by every user and kept while posts are liked (see response_cache.likes_changed), so both are
+# read fresh per request instead of being cached
+async def overlay_likes(cursor, posts: List[dict], user_id: int):
+    post_ids = [post["id"] for post in posts]
+    if not post_ids:
+        return
+    await cursor.execute("""SELECT posts.id, posts.like_count, likes.user_id IS NOT NULL AS liked
+                         FROM posts
+                         LEFT JOIN likes ON likes.post_id = posts.id AND likes.user_id = %s
+                         WHERE posts.id = ANY(%s)""", (user_id, post_ids))
+    rows = await cursor.fetchall()
+
+    like_counts = {row["id"]: row["like_count"] for row in rows}
+    liked = with_pending_likes({row["id"] for row in rows if row["liked"]}, user_id, post_ids)
+    for post in posts:
+        post["like_count"] = like_counts.get(post["id"], post["like_count"])
+        post["liked_by_me"] = post["id"] in liked
+
+
+# run the post query with the passed filter and return the assembled page of posts
+# liked_by_me is filled in for viewer_id when it is passed
+async def fetch_posts(cursor, where: str, params: tuple, order_by: str = "posts.id DESC", limit: int = None, offset: int = None, viewer_id: int = None) -> List[dict]:
+    query = f"{POST_SELECT} WHERE {where} ORDER BY {order_by}"
+    params = list(params)
+
+    if limit is not None:
+        query += " LIMIT %s"
+        params.append(limit)
+    if offset is not None:
+        query += " OFFSET %s"
+        params.append(offset)
+
+    await cursor.execute(query, tuple(params))
+    return await assemble_posts(cursor, await cursor.fetchall(), viewer_id)
+
+
+# turn rows from POST_SELECT into posts using one avatar query and one media query for the whole page
+# (and one likes query when viewer_id is passed)
+async def assemble_posts(cursor, rows, viewer_id: int = None) -> List[dict]:
+    if not rows:
+        return []
+
+    author_ids = list({row["author_id"] for row in rows})
+    post_ids = [row["id"] for row in rows]
+
+    # get the profile pictures for every author on the page
+    await cursor.execute("""SELECT user_id, filename, filepath, variants FROM profile_pictures WHERE user_id = ANY(%s)""", (author_ids,))
+    profile_pics = {}
+    for pic in await cursor.fetchall():
+        profile_pics[pic["user_id"]] = media_dict(pic)
+
+    # get all of the media for every post on the page
+    await cursor.execute("""SELECT post_id, filename, filepath, variants FROM files WHERE post_id = ANY(%s)""", (post_ids,))
+    media = {post_id: [] for post_id in post_ids}
+    for file in await cursor.fetchall():
+        media[file["post_id"]].append(media_dict(file))
+
+    liked = await liked_post_ids(cursor, viewer_id, post_ids) if viewer_id is not None else set()
+
+    result = []
+    for row in rows:
+        result.append({
+            "id": row["id"],
+            "content": row["content"],
+            "published": row["published"],
+            "created_at": row["created_at"],
+            "user_id": row["user_id"],
+            # group the author information
+            "author": {
+                "id": row["author_id"],
+                "email": row["author_email"],
+                "created_at": row["author_created_at"],
+                "display_name": row["author_display_name"],
+                "profile_pic": profile_pics.get(row["author_id"]),
+            },
+            "like_count": row["like_count"],
+            "comment_count": row["comment_count"],
+            "media": media[row["id"]],
+            "liked_by_me": row["id"] in liked,
+        })
+
+    return result
@@ -0,0 +1,100 @@
+# File: follows.py
+# The follow graph: follow and unfollow writes and the follower/following lists
+# Each write is a single statement that also keeps users.follower_count and users.following_count in step (see
+# app/counters.py) and updates the follower's home timeline (see app/timelines.py): a follow copies the author's
+# recent posts into it, an unfollow removes them. Both are idempotent, like likes.
+# Author: Caitlin Coulombe
+# Last Updated: 2025-08-09
+
+from typing import List
+from app import pagination
+from app.feed import media_dict
+
+# recent posts of an author copied into the follower's timeline when they follow them
+BACKFILL_POSTS = 20
+
+
+# follow the user, returns True if the follow is new
+# raises psycopg.errors.ForeignKeyViolation when the followed user does not exist
+async def follow(cursor, follower_id: int, followee_id: int) -> bool:
+    await cursor.execute("""WITH followed AS (
+                                INSERT INTO follows (follower_id, followee_id) VALUES (%s, %s)
+                                ON CONFLICT DO NOTHING
+                                RETURNING follower_id, followee_id),
+                            counted AS (
+                                UPDATE users SET
+                                follower_count = follower_count + (users.id = followed.followee_id)::int,
+                                following_count = following_count + (users.id = followed.follower_id)::int
+                                FROM followed WHERE users.id IN (followed.follower_id, followed.followee_id)),
+                            backfilled AS (
+                                INSERT INTO timelines (user_id, created_at, post_id, author_id)
+                                SELECT followed.follower_id, recent.created_at, recent.id, recent.user_id
+                                FROM followed
+                                CROSS JOIN LATERAL (
+                                    SELECT posts.id, posts.created_at, posts.user_id FROM posts
+                                    WHERE posts.user_id = followed.followee_id AND posts.published
+                                    ORDER BY posts.created_at DESC, posts.id DESC
+                                    LIMIT %s) AS recent
+                                ON CONFLICT DO NOTHING)
+                            SELECT COUNT(*) AS changed FROM followed""", (follower_id, followee_id, BACKFILL_POSTS))
+    return (await cursor.fetchone())["changed"] > 0
+
+# unfollow the user, returns True if there was a follow to remove
+async def unfollow(cursor, follower_id: int, followee_id: int) -> bool:
+    await cursor.execute("""WITH unfollowed AS (
+                                DELETE FROM follows WHERE follower_id = %s AND followee_id = %s
+                                RETURNING follower_id, followee_id),
+                            counted AS (
+                                UPDATE users SET
+                                follower_count = GREATEST(follower_count - (users.id = unfollowed.followee_id)::int, 0),
+                                following_count = GREATEST(following_count - (users.id = unfollowed.follower_id)::int, 0)
+                                FROM unfollowed WHERE users.id IN (unfollowed.follower_id, unfollowed.followee_id)),
+                            removed AS (
+                                DELETE FROM timelines USING unfollowed
+                                WHERE timelines.user_id = unfollowed.follower_id AND timelines.author_id = unfollowed.followee_id)
+                            SELECT COUNT(*) AS changed FROM unfollowed""", (follower_id, followee_id))
+    return (await cursor.fetchone())["changed"] > 0
+
+async def is_following(cursor, follower_id: int, followee_id: int) -> bool:
+    await cursor.execute("""SELECT 1 FROM follows WHERE follower_id = %s AND followee_id = %s""", (follower_id, followee_id))
+    return await cursor.fetchone() is not None
+
+
+# one page of the users on the other side of user_id's follows, most recently followed first
+# column is the side user_id is on: "followee_id" lists their followers, "follower_id" the users they follow
+async def fetch_follow_list(cursor, column: str, user_id: int, limit: int, after: str = None) -> List[dict]:
+    other = "follower_id" if column == "followee_id" else "followee_id"
+    where = f"follows.{column} = %s"
+    params = [user_id]
+
+    if after:
+        followed_at, last_id = pagination.decode_cursor(after)
+        where += f" AND (follows.created_at, follows.{other}) < (%s, %s)"
+        params.extend([followed_at, last_id])
+
+    await cursor.execute(f"""SELECT users.id, users.email, users.created_at, users.display_name,
+                          follows.created_at AS followed_at,
+                          profile_pictures.filename,
+                          profile_pictures.filepath,
+                          profile_pictures.variants
+                          FROM follows
+                          JOIN users ON users.id = follows.{other}
+                          LEFT JOIN profile_pictures ON profile_pictures.user_id = users.id
+                          WHERE {where}
+                          ORDER BY follows.created_at DESC, follows.{other} DESC
+                          LIMIT %s""", (*params, limit))
+
+    return [{
+        "id": row["id"],
+        "email": row["email"],
+        "created_at": row["created_at"],
+        "display_name": row["display_name"],
+        "profile_pic": media_dict(row) if row["filename"] else None,
+        "followed_at": row["followed_at"],
+    } for row in await cursor.fetchall()]
+
+# cursor for the page after a follow list page, or None when it was the last page
+def next_cursor(users: List[dict], limit: int):
+    if not users or len(users) < limit:
+        return None
+    return pagination.encode_cursor(users[-1]["followed_at"], users[-1]["id"])
@@ -0,0 +1,64 @@
+# File: images.py
+# Resizes uploaded images into smaller WebP (and AVIF when available) variants for the feed, slideshows and avatars
+# Author: Caitlin Coulombe
+# Last Updated: 2025-08-10
+
+import io
+from typing import List
+from PIL import Image, ImageOps, features
+
+# widths generated for post media (never upscaled past the original width)
+POST_WIDTHS = [320, 640, 1080, 1600]
+# avatars are cropped square, 1x and 2x of the largest size they are shown at
+AVATAR_WIDTHS = [96, 192]
+
+# animated gifs are served as uploaded
+PROCESSED_CONTENT_TYPES = {"image/png", "image/jpg", "image/jpeg", "image/webp"}
+
+QUALITY = {"webp": 80, "avif": 60}
+CONTENT_TYPES = {"webp": "image/webp", "avif": "image/avif"}
+
+
+# formats this Pillow build can write, best compression first
+def available_formats() -> List[str]:
+    return (["avif"] if features.check("avif") else []) + ["webp"]
+
+# object key for a variant of an uploaded file, e.g. 1720000000_cat.jpg -> 1720000000_cat.jpg_w640.webp
+# built from the whole key, extension included, so cat.jpg and cat.png uploaded in the same second don't share variants
+def variant_key(filename: str, width: int, fmt: str) -> str:
+    return f"{filename}_w{width}.{fmt}"
+
+# decode the uploaded image and encode every requested variant
+# returns dicts with the key, width, format, content type and encoded bytes of each variant
+# CPU bound - call it through run_in_threadpool
+def generate_variants(data: bytes, filename: str, widths: List[int], square: bool = False) -> List[dict]:
+    with Image.open(io.BytesIO(data)) as original:
+        # phone cameras store the rotation in EXIF rather than in the pixels
+        image = ImageOps.exif_transpose(original)
+        if image.mode not in ("RGB", "RGBA"):
+            image = image.convert("RGBA" if "transparency" in image.info or image.mode in ("LA", "PA") else "RGB")
+
+        if square:
+            side = min(image.size)
+            image = ImageOps.fit(image, (side, side))
+
+        # always keep at least one variant, even for images smaller than the smallest width
+        targets = sorted({min(width, image.width) for width in widths})
+
+        variants = []
+        for width in targets:
+            height = max(round(image.height * width / image.width), 1)
+            resized = image if width == image.width else image.resize((width, height), Image.LANCZOS)
+
+            for fmt in available_formats():
+                buffer = io.BytesIO()
+                resized.save(buffer, format=fmt.upper(), quality=QUALITY[fmt])
+                variants.append({
+                    "key": variant_key(filename, width, fmt),
+                    "width": width,
+                    "format": fmt,
+                    "content_type": CONTENT_TYPES[fmt],
+                    "body": buffer.getvalue(),
+                })
+
+        return variants
@@ -0,0 +1,162 @@
+# File: likes.py
+# Like and unlike writes, each a single statement that also keeps posts.like_count in step (see app/counters.py)
+# Both are idempotent: liking a liked post or unliking a post that isn't liked changes nothing
+# With like_buffer_enabled, likes are collected in a write-behind buffer instead and flushed in batches, so a burst of
+# like/unlike clicks on the same post becomes (at most) one write
+# Author: Caitlin Coulombe
+# Last Updated: 2025-08-10
+
+import asyncio
+from app.config import settings
+from app.database import acquire_db, release_db
+from app import response_cache as rc
+
+
+# like the post, returns True if the like is new
+# raises psycopg.errors.ForeignKeyViolation when the post does not exist
+async def add_like(cursor, post_id: int, user_id: int) -> bool:
+    await cursor.execute("""WITH changed AS (
+                                INSERT INTO likes (post_id, user_id) VALUES (%s, %s)
+                                ON CONFLICT DO NOTHING
+                                RETURNING post_id)
+                            UPDATE posts SET like_count = like_count + 1
+                            FROM changed WHERE posts.id = changed.post_id
+                            RETURNING posts.id""", (post_id, user_id))
+    return await cursor.fetchone() is not None
+
+# unlike the post, returns True if there was a like to remove
+async def remove_like(cursor, post_id: int, user_id: int) -> bool:
+    await cursor.execute("""WITH changed AS (
+                                DELETE FROM likes WHERE post_id = %s AND user_id = %s
+                                RETURNING post_id)
+                            UPDATE posts SET like_count = GREATEST(like_count - 1, 0)
+                            FROM changed WHERE posts.id = changed.post_id
+                            RETURNING posts.id""", (post_id, user_id))
+    return await cursor.fetchone() is not None
+
+# batch versions used by the buffer - likes of posts or users deleted in the meantime are skipped
+# both return the ids of the posts whose like_count changed
+async def add_like_batch(cursor, post_ids: list, user_ids: list) -> list:
+    await cursor.execute("""WITH changed AS (
+                                INSERT INTO likes (post_id, user_id)
+                                SELECT liked.post_id, liked.user_id
+                                FROM unnest(%s::int[], %s::int[]) AS liked (post_id, user_id)
+                                JOIN posts ON posts.id = liked.post_id
+                                JOIN users ON users.id = liked.user_id
+                                ON CONFLICT DO NOTHING
+                                RETURNING post_id),
+                            counts AS (SELECT post_id, COUNT(*) AS n FROM changed GROUP BY post_id)
+                            UPDATE posts SET like_count = like_count + counts.n
+                            FROM counts WHERE posts.id = counts.post_id
+                            RETURNING posts.id""", (post_ids, user_ids))
+    return [row["id"] for row in await cursor.fetchall()]
+
+async def remove_like_batch(cursor, post_ids: list, user_ids: list) -> list:
+    await cursor.execute("""WITH changed AS (
+                                DELETE FROM likes
+                                USING unnest(%s::int[], %s::int[]) AS unliked (post_id, user_id)
+                                WHERE likes.post_id = unliked.post_id AND likes.user_id = unliked.user_id
+                                RETURNING likes.post_id),
+                            counts AS (SELECT post_id, COUNT(*) AS n FROM changed GROUP BY post_id)
+                            UPDATE posts SET like_count = GREATEST(like_count - counts.n, 0)
+                            FROM counts WHERE posts.id = counts.post_id
+                            RETURNING posts.id""", (post_ids, user_ids))
+    return [row["id"] for row in await cursor.fetchall()]
+
+
+# write-behind buffer of the latest like state per (user, post)
+# only the last click of a burst is kept, and the buffer is written every flush_interval seconds (or sooner once it
+# holds max_size entries). Buffered likes live in this worker's memory until they are flushed, so a crash loses at
+# most one interval of likes, and other workers see them after the flush.
+class LikeBuffer:
+    def __init__(self, flush_interval: float = 1.0, max_size: int = 500):
+        self.flush_interval = flush_interval
+        self.max_size = max_size
+        self._pending = {}     # (user_id, post_id) -> True to like, False to unlike
+        self._wakeup = asyncio.Event()
+        self._stopping = False
+        self._task = None
+        self.flushed = 0
+        self.coalesced = 0
+        self.failures = 0
+
+    def add(self, user_id: int, post_id: int, liked: bool):
+        key = (user_id, post_id)
+        if key in self._pending:
+            self.coalesced += 1
+        self._pending[key] = liked
+        if len(self._pending) >= self.max_size:
+            self._wakeup.set()
+
+    # the buffered state of each of the posts for the user, so a user sees their own likes before they are flushed
+    def pending_for(self, user_id: int, post_ids) -> dict:
+        return {post_id: self._pending[(user_id, post_id)] for post_id in post_ids if (user_id, post_id) in self._pending}
+
+    # write one batch, returns the ids of the posts whose like_count changed
+    async def _write(self, batch: dict) -> list:
+        likes = [key for key, liked in batch.items() if liked]
+        unlikes = [key for key, liked in batch.items() if not liked]
+
+        conn, cursor = await acquire_db()
+        try:
+            changed = []
+            if likes:
+                changed += await add_like_batch(cursor, [post_id for _, post_id in likes], [user_id for user_id, _ in likes])
+            if unlikes:
+                changed += await remove_like_batch(cursor, [post_id for _, post_id in unlikes], [user_id for user_id, _ in unlikes])
+            await conn.commit()
+            return changed
+        finally:
+            await release_db(conn, cursor)
+
+    async def flush(self):
+        if not self._pending:
+            return
+
+        batch, self._pending = self._pending, {}
+        try:
+            changed = await self._write(batch)
+        except BaseException as e:
+            # put the batch back unless a newer click for the same post came in while flushing - also when the flush
+            # is cancelled, so no likes are lost (writing a batch twice is harmless, the batch writes are idempotent)
+            for key, liked in batch.items():
+                self._pending.setdefault(key, liked)
+            if not isinstance(e, Exception):
+                raise
+            self.failures += 1
+            print(f"likes: Failed to flush {len(batch)} buffered like(s): {e}")
+            return
+
+        self.flushed += len(batch)
+        for post_id in set(changed):
+            await rc.likes_changed(post_id)
+
+    async def _run(self):
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+
+    def start(self):
+        if self._task is None:
+            self._stopping = False
+            self._task = asyncio.create_task(self._run())
+
+    # stop the flusher and write whatever is still buffered
+    # the flusher is asked to exit rather than cancelled, so a flush that is already writing finishes first
+    async def stop(self):
+        if self._task is not None:
+            self._stopping = True
+            self._wakeup.set()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await self.flush()
+
+    def stats(self) -> dict:
+        return {"pending": len(self._pending), "flushed": self.flushed, "coalesced": self.coalesced, "failures": self.failures}
+
+
+like_buffer = LikeBuffer(flush_interval=settings.like_buffer_flush_interval, max_size=settings.like_buffer_max_size) if settings.like_buffer_enabled else None
@@ -1,12 +1,51 @@
+import hmac
 import os
-from fastapi import Body, FastAPI, Response, HTTPException
+from contextlib import asynccontextmanager
+from fastapi import Body, Depends, FastAPI, Request, Response, HTTPException, status
 from fastapi.middleware.cors import CORSMiddleware
-from app.routers import post, user, auth, like, media, comment
+from app.routers import post, user, auth, like, media, comment, follow
 from app.config import settings
+from app.database import pool, get_db
+from app.responses import FastJSONResponse
+from app.response_cache import response_cache
+from app.likes import like_buffer
+from app import outbox
+from app.passwords import password_pool
+from app.tokens import revocations
+from app import metrics
+from app.slow_queries import slow_query_log
+from app.timelines import fanout_worker
 from fastapi.staticfiles import StaticFiles
 
+# background worker removing deleted media from s3
+deletion_worker = outbox.default_worker() if settings.s3_delete_worker_enabled else None
+
+# open the database connection pool (and start the slow query plan capture, revocation list refresher, like buffer,
+# deletion worker and timeline fan-out worker) on startup, stop them on shutdown
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await pool.open()
+    slow_query_log.start(pool.connect_kwargs)
+    revocations.start()
+    if like_buffer is not None:
+        like_buffer.start()
+    if deletion_worker is not None:
+        deletion_worker.start()
+    if fanout_worker is not None:
+        fanout_worker.start()
+    yield
+    if fanout_worker is not None:
+        await fanout_worker.stop()
+    if deletion_worker is not None:
+        await deletion_worker.stop()
+    if like_buffer is not None:
+        await like_buffer.stop()
+    await revocations.stop()
+    await slow_query_log.stop()
+    await pool.close()
+
 # Create a FastAPI application
-app = FastAPI()
+app = FastAPI(lifespan=lifespan, default_response_class=FastJSONResponse)
 
 frontend_path = os.path.abspath(os.path.join(os.path.dirname(__file__), "../../frontend"))
 
@@ -20,6 +59,7 @@ app.include_router(auth.router, prefix="/api/login")  # Your login router here
 app.include_router(like.router, prefix="/api/likes")
 app.include_router(media.router, prefix="/api/media")
 app.include_router(comment.router, prefix="/api/comment")
+app.include_router(follow.router, prefix="/api/follows")
 
 # Mount media files (optional)
 # app.mount("/media", StaticFiles(directory="media"), name="media")
@@ -37,6 +77,9 @@ origins = [
     "https://www.demo.createabuzz.ca",
 ]
 
+# outermost, so the recorded latency covers the whole request
+app.add_middleware(metrics.MetricsMiddleware, server_timing=settings.server_timing_enabled)
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=origins,
@@ -47,4 +90,88 @@ app.add_middleware(
 
 @app.post("/test")
 async def test_post():
-    return {"message": "POST works"}
\ No newline at end of file
+    return {"message": "POST works"}
+
+# the monitoring endpoints below (/api/health/* and /metrics) expose internal state, so they need monitoring_token -
+# without one configured they don't exist as far as clients can tell
+async def require_monitoring_token(request: Request):
+    if not settings.monitoring_token:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Not Found")
+
+    scheme, _, token = request.headers.get("authorization", "").partition(" ")
+    if scheme.lower() != "bearer" or not hmac.compare_digest(token.encode(), settings.monitoring_token.encode()):
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Could not validate credentials",
+                            headers={"WWW-Authenticate": "Bearer"})
+
+monitoring = [Depends(require_monitoring_token)]
+
+# connection pool statistics (size, idle/in use connections, waits, timeouts)
+@app.get("/api/health/db", dependencies=monitoring)
+async def db_pool_stats():
+    return {"pool": pool.stats()}
+
+# hit rate of the feed/post/comment response cache, and the state of the like buffer
+@app.get("/api/health/cache", dependencies=monitoring)
+async def response_cache_stats():
+    return {"cache": response_cache.stats(), "like_buffer": like_buffer.stats() if like_buffer is not None else None}
+
+# bcrypt pool load: busy workers, waiting calls, rejections (429s) and time spent waiting
+@app.get("/api/health/passwords", dependencies=monitoring)
+async def password_pool_stats():
+    return {"passwords": password_pool.stats()}
+
+# revoked sessions known to this worker and the access tokens rejected because of them
+@app.get("/api/health/sessions", dependencies=monitoring)
+async def revocation_stats():
+    return {"sessions": revocations.stats()}
+
+# statements logged as slow since startup, and how many of them got a captured plan
+@app.get("/api/health/queries", dependencies=monitoring)
+async def slow_query_stats():
+    return {"slow_queries": slow_query_log.stats()}
+
+# posts and timeline rows written by the fan-out worker, and how many posts are still waiting for it
+@app.get("/api/health/timelines", dependencies=monitoring)
+async def timeline_stats(db = Depends(get_db)):
+    conn, cursor = db
+    await cursor.execute("""SELECT COUNT(*) AS queued FROM timeline_fanout""")
+    return {"worker": fanout_worker.stats() if fanout_worker is not None else None, **(await cursor.fetchone())}
+
+# objects deleted (and failed attempts) by the s3 deletion worker, and how many are still queued
+@app.get("/api/health/outbox", dependencies=monitoring)
+async def outbox_stats(db = Depends(get_db)):
+    conn, cursor = db
+    await cursor.execute("""SELECT COUNT(*) AS queued, COUNT(*) FILTER (WHERE attempts > 0) AS retrying FROM s3_deletions""")
+    return {"worker": deletion_worker.stats() if deletion_worker is not None else None, **(await cursor.fetchone())}
+
+# connection and bcrypt pool saturation, read when /metrics is scraped
+def pool_metrics() -> dict:
+    db = pool.stats()
+    passwords = password_pool.stats()
+    return {
+        "db_pool_size": ("gauge", "Open database connections", db["size"]),
+        "db_pool_max_size": ("gauge", "Maximum database connections", db["max_size"]),
+        "db_pool_in_use": ("gauge", "Database connections handed out", db["in_use"]),
+        "db_pool_waiting": ("gauge", "Requests waiting for a database connection", db["waiting"]),
+        "db_pool_waits_total": ("counter", "Acquires that had to wait for a connection", db["waits"]),
+        "db_pool_timeouts_total": ("counter", "Acquires that timed out (503s)", db["timeouts"]),
+        "password_pool_in_flight": ("gauge", "Password hashes being computed", passwords["in_flight"]),
+        "password_pool_queued": ("gauge", "Password hashes waiting for a worker", passwords["queued"]),
+        "password_pool_rejected_total": ("counter", "Password hashes rejected with a 429", passwords["rejected"]),
+    }
+
+metrics.register_collector(pool_metrics)
+
+def slow_query_metrics() -> dict:
+    stats = slow_query_log.stats()
+    return {
+        "db_slow_queries_total": ("counter", "Statements over the slow query threshold", stats["logged"]),
+        "db_slow_query_plans_total": ("counter", "Slow statements logged with an EXPLAIN ANALYZE plan", stats["explained"]),
+    }
+
+metrics.register_collector(slow_query_metrics)
+
+# prometheus scrape endpoint: request latency per route, queries per request, query and s3 call durations, pool usage
+@app.get("/metrics", include_in_schema=False, dependencies=monitoring)
+async def prometheus_metrics():
+    return Response(content=metrics.render(), media_type="text/plain; version=0.0.4")
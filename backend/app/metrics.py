@@ -0,0 +1,209 @@
+# File: metrics.py
+# Request metrics: latency histograms per route, SQL statements and database time per request, S3 call timing and
+# gauges read from the connection pool, exposed in the Prometheus text format at /metrics
+# Each request gets a RequestStats (through a context variable) that the timed cursor (app/database.py), the s3 client
+# hooks, auth and rendering add to, and the totals are sent back in a Server-Timing header so the browser's network
+# panel shows where a slow request spent its time
+# Author: Caitlin Coulombe
+# Last Updated: 2025-08-08
+
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+# seconds
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _labels(names: tuple, values: tuple) -> str:
+    if not names:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values)) + "}"
+
+
+# cumulative histogram with a series per combination of label values
+# observations can come from the s3 client's worker threads, so updates take a lock
+class Histogram:
+    def __init__(self, name: str, help: str, labels: tuple = (), buckets: tuple = LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = buckets
+        self._series = {}      # label values -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *label_values):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [0] * (len(self.buckets) + 2)
+            if index < len(self.buckets):
+                series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = {values: list(counts) for values, counts in self._series.items()}
+        for values, counts in sorted(series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_labels(self.labels + ('le',), values + (bound,))} {cumulative}")
+            lines.append(f"{self.name}_bucket{_labels(self.labels + ('le',), values + ('+Inf',))} {counts[-1]}")
+            lines.append(f"{self.name}_sum{_labels(self.labels, values)} {counts[-2]}")
+            lines.append(f"{self.name}_count{_labels(self.labels, values)} {counts[-1]}")
+        return lines
+
+
+REQUEST_DURATION = Histogram("http_request_duration_seconds", "Time to handle a request", ("method", "route", "status"))
+REQUEST_QUERIES = Histogram("http_request_db_queries", "SQL statements run by a request", ("route",), COUNT_BUCKETS)
+QUERY_DURATION = Histogram("db_query_duration_seconds", "Time to run a SQL statement", buckets=QUERY_BUCKETS)
+S3_DURATION = Histogram("s3_request_duration_seconds", "Time of an S3 call", ("operation",))
+HISTOGRAMS = [REQUEST_DURATION, REQUEST_QUERIES, QUERY_DURATION, S3_DURATION]
+
+# functions returning {metric name: (type, help, value)} for values read at scrape time (e.g. the connection pool)
+_collectors = []
+
+def register_collector(collect):
+    _collectors.append(collect)
+
+
+# what one request spent its time on
+class RequestStats:
+    __slots__ = ("scope", "queries", "db_time", "connections", "s3_calls", "s3_time", "timings")
+
+    def __init__(self, scope: dict = None):
+        self.scope = scope      # the asgi scope, which names the matched route once the router has run
+        self.queries = 0
+        self.db_time = 0.0
+        self.connections = 0    # borrowed from the pool
+        self.s3_calls = 0
+        self.s3_time = 0.0
+        self.timings = {}      # name -> seconds, for the other Server-Timing entries (auth, render)
+
+_request_stats: ContextVar = ContextVar("request_stats", default=None)
+
+
+def record_query(seconds: float):
+    QUERY_DURATION.observe(seconds)
+    stats = _request_stats.get()
+    if stats is not None:
+        stats.queries += 1
+        stats.db_time += seconds
+
+def record_connection():
+    stats = _request_stats.get()
+    if stats is not None:
+        stats.connections += 1
+
+# path template of the route that handled a request (/api/posts/{id}), "unmatched" until the router found one
+def route_of(scope: dict) -> str:
+    route = scope.get("route") if scope else None
+    return getattr(route, "path", None) or "unmatched"
+
+# route of the request being handled, None when the caller runs outside of a request (background workers, scripts)
+def current_route():
+    stats = _request_stats.get()
+    return route_of(stats.scope) if stats is not None else None
+
+# time a block of the request for the Server-Timing header
+@contextmanager
+def timed(name: str):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        stats = _request_stats.get()
+        if stats is not None:
+            stats.timings[name] = stats.timings.get(name, 0.0) + time.perf_counter() - started
+
+
+# time every call of a boto3 s3 client through its event hooks - the calls run on the threadpool, which copies the
+# request's context, so they are added to the request that made them
+def instrument_s3(client):
+    events = getattr(getattr(client, "meta", None), "events", None)
+    if events is None:
+        return client
+
+    def before_call(context, **kwargs):
+        context["metrics_started"] = time.perf_counter()
+
+    def after_call(context, model, **kwargs):
+        started = context.pop("metrics_started", None)
+        if started is None:
+            return
+        seconds = time.perf_counter() - started
+        S3_DURATION.observe(seconds, model.name)
+        stats = _request_stats.get()
+        if stats is not None:
+            stats.s3_calls += 1
+            stats.s3_time += seconds
+
+    events.register("before-call.s3", before_call)
+    events.register("after-call.s3", after_call)
+    events.register("after-call-error.s3", lambda context, **kwargs: context.pop("metrics_started", None))
+    return client
+
+
+def render() -> str:
+    lines = []
+    for histogram in HISTOGRAMS:
+        lines.extend(histogram.render())
+    for collect in _collectors:
+        for name, (kind, help, value) in collect().items():
+            lines.extend([f"# HELP {name} {help}", f"# TYPE {name} {kind}", f"{name} {value}"])
+    return "\n".join(lines) + "\n"
+
+
+def server_timing(stats: RequestStats, total: float) -> str:
+    entries = [f'db;dur={stats.db_time * 1000:.1f};desc="{stats.queries} queries, {stats.connections} conn"']
+    if stats.s3_calls:
+        entries.append(f's3;dur={stats.s3_time * 1000:.1f};desc="{stats.s3_calls} calls"')
+    entries.extend(f"{name};dur={seconds * 1000:.1f}" for name, seconds in stats.timings.items())
+    entries.append(f"total;dur={total * 1000:.1f}")
+    return ", ".join(entries)
+
+
+# ASGI middleware timing every http request
+# the route label is the path template (/api/posts/{id}), so there is one series per endpoint rather than per url
+class MetricsMiddleware:
+    def __init__(self, app, server_timing: bool = True):
+        self.app = app
+        self.server_timing = server_timing
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        stats = RequestStats(scope)
+        token = _request_stats.set(stats)
+        started = time.perf_counter()
+        status = 500
+
+        async def send_with_timing(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                if self.server_timing:
+                    headers = list(message.get("headers", []))
+                    headers.append((b"server-timing", server_timing(stats, time.perf_counter() - started).encode()))
+                    message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _request_stats.reset(token)
+            route = route_of(scope)
+            REQUEST_DURATION.observe(time.perf_counter() - started, scope["method"], route, status)
+            REQUEST_QUERIES.observe(stats.queries, route)
@@ -3,8 +3,11 @@ from datetime import datetime, timedelta
 from app import schema as sch
 from fastapi import Depends, status, HTTPException
 from fastapi.security import OAuth2PasswordBearer
-from app.database import get_db
+from app.database import acquire_db, release_db
 from app.config import settings
+from app.cache import TTLCache
+from app import metrics
+from app.tokens import revocations
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="login")
 
@@ -13,6 +16,10 @@ SECRET_KEY = settings.secret_key
 ALGORITHM = settings.algorithm
 ACCESS_TOKEN_EXPIRE_MINUTES = settings.access_token_expire_minutes
 
+# recently authenticated users keyed by id, so most requests skip the users lookup
+# each worker has its own cache, so changes made through another worker show up after at most principal_cache_ttl seconds
+principal_cache = TTLCache(maxsize=settings.principal_cache_size, ttl=settings.principal_cache_ttl)
+
 # Create and return a new access token
 def create_access_token(data: dict):
     to_encode = data.copy()
@@ -24,6 +31,22 @@ def create_access_token(data: dict):
     
     return encoded_jwt
 
+# the data to put in a user's access token - the user's profile is only included when jwt_embed_user_claims is on
+# sid is the refresh token family of the session, so the token stops working once the session is revoked
+def user_claims(user: dict, sid: str = None) -> dict:
+    claims = {"user_id": user["id"]}
+    if sid:
+        claims["sid"] = sid
+
+    if settings.jwt_embed_user_claims:
+        claims.update({
+            "email": user["email"],
+            "display_name": user["display_name"],
+            "created_at": user["created_at"].isoformat(),
+        })
+
+    return claims
+
 # decode and verify the passed token
 def verify_access_token(token: str, credential_exception):
     try: 
@@ -31,24 +54,56 @@ def verify_access_token(token: str, credential_exception):
         id: str = payload.get("user_id")
         if id is None:
             raise credential_exception
-        token_data = sch.TokenData(id=id)
-    except JWTError:
+        token_data = sch.TokenData(id=id,
+                                   sid=payload.get("sid"),
+                                   email=payload.get("email"),
+                                   display_name=payload.get("display_name"),
+                                   created_at=payload.get("created_at"))
+    except (JWTError, ValueError):
         raise credential_exception
     return token_data
 
+# drop a user from the principal cache (call after changing or deleting the user)
+def invalidate_user(user_id: int):
+    principal_cache.delete(user_id)
+
 # this ensures that any time an endpoint is protected (they need to be logged in), this ensures they have a valid token
-def get_current_user(token: str = Depends(oauth2_scheme)):
+# no connection is held for it: one is only borrowed for the users lookup, when neither the token nor the principal cache
+# can answer it, and is back in the pool before the handler runs (so handlers can also do slow work like uploads to s3)
+async def get_current_user(token: str = Depends(oauth2_scheme)):
     credentials_exception = HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail=f"Could not validate credentials", headers={"WWW-Authenticate": "Bearer"})
-    conn, cursor = get_db()
 
-    token = verify_access_token(token, credentials_exception)
-    cursor.execute("""SELECT * FROM users WHERE id = %s""", (str(token.id),))
-    user = cursor.fetchone()
+    # time spent authenticating shows up as "auth" in the Server-Timing header
+    with metrics.timed("auth"):
+        token = verify_access_token(token, credentials_exception)
+
+        # logged out, or the session's refresh token was reused
+        if token.sid and revocations.is_revoked(token.sid):
+            raise credentials_exception
+
+        # the token carries the whole profile, no lookup needed
+        if settings.jwt_embed_user_claims and token.email and token.display_name and token.created_at:
+            return sch.UserOut(id=token.id, email=token.email, display_name=token.display_name, created_at=token.created_at)
+
+        user = principal_cache.get(token.id)
+        if user is not None:
+            return user
+
+        conn, cursor = await acquire_db()
+        try:
+            user = await fetch_user(cursor, token.id)
+        finally:
+            await release_db(conn, cursor)
+
+        if not user:
+            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED,
+                                detail=f"User does not exist or is not authenticated")
 
-    if not user:
-        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED,
-                            detail=f"User does not exist or is not authenticated")
+        user = sch.UserOut(**user)
+        principal_cache.set(token.id, user)
 
-    return sch.UserOut(**user)
+        return user
 
-    # return verify_access_token(token, credentials_exception)
\ No newline at end of file
+async def fetch_user(cursor, user_id: int):
+    await cursor.execute("""SELECT * FROM users WHERE id = %s""", (str(user_id),))
+    return await cursor.fetchone()
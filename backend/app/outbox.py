@@ -0,0 +1,141 @@
+# File: outbox.py
+# Deletes s3 objects in the background through a durable outbox (the s3_deletions table)
+# Keys are queued in the same transaction as the database delete, so they are never lost and a rolled back delete
+# queues nothing. The worker claims batches of keys, removes them with one delete_objects call per batch and retries
+# failures with an exponential backoff.
+# The worker runs inside the api (s3_delete_worker_enabled), or can be drained on its own with: python -m app.outbox
+# The s3 client is passed in so the worker can be pointed at a local stand-in (e.g. moto)
+# Author: Caitlin Coulombe
+# Last Updated: 2025-07-31
+
+import asyncio
+from fastapi.concurrency import run_in_threadpool
+from app.config import settings
+from app.database import pool, acquire_db, release_db
+from app.utils import s3_client
+
+# delete_objects accepts at most 1000 keys per call
+MAX_BATCH_SIZE = 1000
+# longest wait between two attempts at the same key
+MAX_RETRY_DELAY = 3600
+
+
+# queue every key returned by the query (a SELECT with a single column) for deletion
+# must run in the same transaction as the delete of the rows the keys come from
+async def enqueue_from(cursor, query: str, params: tuple = ()):
+    await cursor.execute(f"""INSERT INTO s3_deletions (key)
+                         SELECT queued.key FROM ({query}) AS queued (key)
+                         WHERE queued.key IS NOT NULL AND queued.key <> ''""", params)
+
+
+class DeletionWorker:
+    def __init__(self, client, bucket: str, batch_size: int = MAX_BATCH_SIZE, poll_interval: float = 5.0,
+                 max_attempts: int = 8, retry_delay: float = 30.0):
+        self.client = client
+        self.bucket = bucket
+        self.batch_size = min(batch_size, MAX_BATCH_SIZE)
+        self.poll_interval = poll_interval
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self._task = None
+        self.deleted = 0
+        self.failed = 0
+
+    # delete the keys from s3, returns the error message for every key that could not be deleted
+    async def _delete(self, keys: list) -> dict:
+        try:
+            response = await run_in_threadpool(self.client.delete_objects, Bucket=self.bucket,
+                                               Delete={"Objects": [{"Key": key} for key in keys], "Quiet": True})
+        except Exception as e:
+            return {key: str(e) for key in keys}
+
+        return {error["Key"]: f"{error.get('Code')}: {error.get('Message')}" for error in response.get("Errors", [])}
+
+    # process one batch of due keys, returns how many rows were claimed
+    # rows are locked with SKIP LOCKED so several workers never delete the same batch
+    async def run_once(self) -> int:
+        conn, cursor = await acquire_db()
+        try:
+            await cursor.execute("""SELECT id, key FROM s3_deletions
+                                 WHERE available_at <= NOW() AND attempts < %s
+                                 ORDER BY id
+                                 LIMIT %s
+                                 FOR UPDATE SKIP LOCKED""", (self.max_attempts, self.batch_size))
+            rows = await cursor.fetchall()
+            if not rows:
+                await conn.commit()
+                return 0
+
+            # the same object can be queued twice (e.g. a post delete racing a user delete), s3 only needs it once
+            errors = await self._delete(list(dict.fromkeys(row["key"] for row in rows)))
+
+            done = [row["id"] for row in rows if row["key"] not in errors]
+            failed = [row for row in rows if row["key"] in errors]
+
+            await cursor.execute("""DELETE FROM s3_deletions WHERE id = ANY(%s)""", (done,))
+            if failed:
+                await cursor.execute("""UPDATE s3_deletions SET
+                                     attempts = attempts + 1,
+                                     last_error = failure.error,
+                                     available_at = NOW() + make_interval(secs => LEAST(%s * power(2, attempts), %s))
+                                     FROM unnest(%s::bigint[], %s::varchar[]) AS failure (id, error)
+                                     WHERE s3_deletions.id = failure.id""",
+                                     (self.retry_delay, MAX_RETRY_DELAY, [row["id"] for row in failed], [errors[row["key"]] for row in failed]))
+                print(f"outbox: Failed to delete {len(failed)} s3 object(s), will retry: {errors}")
+            await conn.commit()
+        finally:
+            await release_db(conn, cursor)
+
+        self.deleted += len(done)
+        self.failed += len(failed)
+        return len(rows)
+
+    # keep deleting until the outbox has no due keys left, returns how many rows were processed
+    async def drain(self) -> int:
+        total = 0
+        while True:
+            claimed = await self.run_once()
+            total += claimed
+            if claimed < self.batch_size:
+                return total
+
+    async def _run(self):
+        while True:
+            try:
+                await self.drain()
+            except Exception as e:
+                # the database being unreachable must not kill the worker, the keys stay queued
+                print(f"outbox: Deletion batch failed: {e}")
+            await asyncio.sleep(self.poll_interval)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def stats(self) -> dict:
+        return {"deleted": self.deleted, "failed": self.failed}
+
+
+# worker for the configured bucket
+def default_worker() -> DeletionWorker:
+    return DeletionWorker(s3_client, settings.s3_bucket_name, poll_interval=settings.s3_delete_poll_interval,
+                          max_attempts=settings.s3_delete_max_attempts, retry_delay=settings.s3_delete_retry_delay)
+
+
+# delete everything that is due once against the configured database and bucket
+async def main():
+    try:
+        processed = await default_worker().drain()
+        print(f"Processed {processed} queued s3 deletion(s)")
+    finally:
+        await pool.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,55 @@
+# File: ownership.py
+# Writes to rows that only their owner may change, each done in a single statement with the ownership check in the
+# WHERE clause instead of a SELECT of the owner first
+# Only when the write matched nothing is the row looked up again, to tell a missing row (404) from someone else's (403)
+# Author: Caitlin Coulombe
+# Last Updated: 2025-08-04
+
+from fastapi import status, HTTPException
+
+
+def not_found(label: str, id: int) -> HTTPException:
+    return HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"{label} with id: {id} was not found")
+
+def forbidden() -> HTTPException:
+    return HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail=f"Not authorized to perform requested action.")
+
+
+# the failure path of a guarded write: always raises, 404 if the row doesn't exist and 403 if it belongs to someone else
+async def raise_not_owned(cursor, table: str, id: int, label: str, owner_column: str = "user_id"):
+    await cursor.execute(f"""SELECT 1 FROM {table} WHERE id = %s""", (id,))
+    if await cursor.fetchone():
+        raise forbidden()
+    raise not_found(label, id)
+
+# 404/403 unless the user owns the row - for checks that have to happen before work that can't be rolled back
+# (e.g. uploads to s3), everything else should use the guarded writes below
+async def require_owner(cursor, table: str, id: int, user_id: int, label: str, owner_column: str = "user_id"):
+    await cursor.execute(f"""SELECT {owner_column} FROM {table} WHERE id = %s""", (id,))
+    row = await cursor.fetchone()
+    if not row:
+        raise not_found(label, id)
+    if row[owner_column] != user_id:
+        raise forbidden()
+
+# UPDATE {table} SET {assignments} for the row with the id, only if the user owns it - returns the updated row
+# params are the values of the assignments' placeholders
+async def update_owned(cursor, table: str, id: int, user_id: int, assignments: str, params: tuple, label: str,
+                       returning: str = "*", owner_column: str = "user_id"):
+    await cursor.execute(f"""UPDATE {table} SET {assignments}
+                         WHERE id = %s AND {owner_column} = %s
+                         RETURNING {returning}""", (*params, id, user_id))
+    row = await cursor.fetchone()
+    if row is None:
+        await raise_not_owned(cursor, table, id, label, owner_column)
+    return row
+
+# DELETE the row with the id, only if the user owns it - returns the deleted row
+async def delete_owned(cursor, table: str, id: int, user_id: int, label: str, returning: str = "*", owner_column: str = "user_id"):
+    await cursor.execute(f"""DELETE FROM {table}
+                         WHERE id = %s AND {owner_column} = %s
+                         RETURNING {returning}""", (id, user_id))
+    row = await cursor.fetchone()
+    if row is None:
+        await raise_not_owned(cursor, table, id, label, owner_column)
+    return row
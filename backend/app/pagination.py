@@ -0,0 +1,57 @@
+# File: pagination.py
+# Helpers for keyset (cursor) pagination on (created_at, id), or (rank, created_at, id) for search results
+# Author: Caitlin Coulombe
+# Last Updated: 2025-07-26
+
+import base64
+import binascii
+import json
+from datetime import datetime
+from typing import Optional
+from fastapi import status, HTTPException
+
+
+def _encode(data: dict) -> str:
+    raw = json.dumps(data, separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+def _decode(cursor: str) -> dict:
+    padded = cursor + "=" * (-len(cursor) % 4)
+    return json.loads(base64.urlsafe_b64decode(padded.encode()))
+
+def _invalid_cursor():
+    return HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                         detail=f"Invalid pagination cursor")
+
+# encode the position of the last item on a page into an opaque string for the client
+def encode_cursor(created_at: datetime, id: int) -> str:
+    return _encode({"created_at": created_at.isoformat(), "id": id})
+
+# decode a cursor from the client back into (created_at, id)
+def decode_cursor(cursor: str):
+    try:
+        data = _decode(cursor)
+        return datetime.fromisoformat(data["created_at"]), int(data["id"])
+    except (binascii.Error, UnicodeDecodeError, ValueError, KeyError, TypeError):
+        raise _invalid_cursor()
+
+# same as encode_cursor, with the search rank of the last item in front
+def encode_ranked_cursor(rank: float, created_at: datetime, id: int) -> str:
+    return _encode({"rank": rank, "created_at": created_at.isoformat(), "id": id})
+
+# decode a search cursor from the client back into (rank, created_at, id)
+def decode_ranked_cursor(cursor: str):
+    try:
+        data = _decode(cursor)
+        return float(data["rank"]), datetime.fromisoformat(data["created_at"]), int(data["id"])
+    except (binascii.Error, UnicodeDecodeError, ValueError, KeyError, TypeError):
+        raise _invalid_cursor()
+
+# cursor for the page after this one, or None when this was the last page
+def next_cursor(items: list, limit: int) -> Optional[str]:
+    if not items or len(items) < limit:
+        return None
+    last = items[-1]
+    if isinstance(last, dict):
+        return encode_cursor(last["created_at"], last["id"])
+    return encode_cursor(last.created_at, last.id)
@@ -0,0 +1,77 @@
+# File: passwords.py
+# Runs bcrypt hashing and verification on a small dedicated thread pool, away from the event loop and from the
+# threadpool FastAPI uses for everything else (bcrypt releases the GIL, so the threads really run in parallel)
+# When every worker is busy and password_hash_max_queue calls are already waiting, new calls are rejected with a 429
+# instead of piling up, so a login storm can't starve the rest of the api
+# Author: Caitlin Coulombe
+# Last Updated: 2025-08-02
+
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from fastapi import status, HTTPException
+from app.config import settings
+from app import utils
+
+
+class PasswordPool:
+    def __init__(self, workers: int = 2, max_queue: int = 32, retry_after: int = 1):
+        self.workers = workers
+        self.max_queue = max_queue
+        self.retry_after = retry_after
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="bcrypt")
+        self.pending = 0          # running + waiting calls
+        self.completed = 0
+        self.rejected = 0
+        self.total_wait = 0.0     # seconds calls spent waiting for a free worker
+        self.max_wait = 0.0
+
+    async def _run(self, fn, *args):
+        if self.pending >= self.workers + self.max_queue:
+            self.rejected += 1
+            raise HTTPException(status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                                detail=f"Too many login attempts in progress, please try again",
+                                headers={"Retry-After": str(self.retry_after)})
+
+        queued_at = time.monotonic()
+
+        # runs on the worker thread, the stats are only updated back on the event loop
+        def timed():
+            return time.monotonic() - queued_at, fn(*args)
+
+        self.pending += 1
+        try:
+            wait, result = await asyncio.get_running_loop().run_in_executor(self._executor, timed)
+        finally:
+            self.pending -= 1
+
+        self.completed += 1
+        self.total_wait += wait
+        self.max_wait = max(self.max_wait, wait)
+        return result
+
+    async def hash(self, password: str) -> str:
+        return await self._run(utils.hash, password)
+
+    async def verify(self, password: str, hashed_password: str) -> bool:
+        return await self._run(utils.verify, password, hashed_password)
+
+    # verify the password and, when the stored hash uses an outdated cost factor (or scheme), also return a new hash
+    # to store - returns (valid, new_hash or None)
+    async def verify_and_update(self, password: str, hashed_password: str):
+        return await self._run(utils.pwd_context.verify_and_update, password, hashed_password)
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.workers,
+            "max_queue": self.max_queue,
+            "in_flight": min(self.pending, self.workers),
+            "queued": max(self.pending - self.workers, 0),
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "avg_wait_ms": round(self.total_wait / self.completed * 1000, 2) if self.completed else 0.0,
+            "max_wait_ms": round(self.max_wait * 1000, 2),
+        }
+
+
+password_pool = PasswordPool(workers=settings.password_hash_workers, max_queue=settings.password_hash_max_queue)
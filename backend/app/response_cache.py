@@ -0,0 +1,57 @@
+# File: response_cache.py
+# The cache for the public feed, single post and comment pages, and the invalidation calls the write paths make
+# None of these responses depend on who is asking, so one cached page serves every user
+# Author: Caitlin Coulombe
+# Last Updated: 2025-08-10
+
+from app import responses
+from app.cache import ResponseCache, LocalCacheBackend, RedisCacheBackend
+from app.config import settings
+
+# with response_cache_url set every worker shares one redis cache, otherwise each worker keeps its own
+if settings.response_cache_url:
+    backend = RedisCacheBackend(settings.response_cache_url)
+else:
+    backend = LocalCacheBackend(maxsize=settings.response_cache_size, ttl=settings.response_cache_ttl)
+
+response_cache = ResponseCache(backend, ttl=settings.response_cache_ttl)
+
+# tags - every feed page depends on FEED, a single post on its post tag, and every page shows author profiles
+FEED = "feed"
+USERS = "users"
+
+def post_tag(post_id: int) -> str:
+    return f"post:{post_id}"
+
+def comments_tag(post_id: int) -> str:
+    return f"comments:{post_id}"
+
+
+# serialize a response once so the same bytes can be cached and sent
+def encode(payload) -> bytes:
+    return responses.dumps(payload)
+
+# a cached body back into the payload, for responses that add per-user fields on top of the shared page
+def decode(body: bytes):
+    return responses.loads(body)
+
+def json_response(body: bytes):
+    return responses.raw_json(body)
+
+
+# a post was created, edited or deleted, or its media changed (the counters are shown on every feed page)
+async def post_changed(post_id: int):
+    await response_cache.invalidate(FEED, post_tag(post_id))
+
+# a post was liked or unliked - like_count is read fresh over cached feed pages (see feed.overlay_likes), so only the
+# post's own page is dropped and the feed stays cached
+async def likes_changed(post_id: int):
+    await response_cache.invalidate(post_tag(post_id))
+
+# a comment was added, edited or removed (the comment counter is shown on the post and the feed)
+async def comments_changed(post_id: int):
+    await response_cache.invalidate(FEED, post_tag(post_id), comments_tag(post_id))
+
+# a user's name or avatar changed, or the user (and all of their content) was deleted
+async def users_changed():
+    await response_cache.invalidate(USERS)
@@ -0,0 +1,37 @@
+# File: responses.py
+# JSON rendering with orjson
+# FastJSONResponse is the app's default response class. The hot endpoints (feed, comments, users) build plain dicts
+# and return a FastJSONResponse themselves, which skips FastAPI's jsonable_encoder pass over the whole page
+# Author: Caitlin Coulombe
+# Last Updated: 2025-08-10
+
+import orjson
+from fastapi import Response
+from fastapi.responses import ORJSONResponse
+from pydantic import BaseModel
+from app import metrics
+
+
+# pydantic models that are still returned by the less busy endpoints
+def _default(value):
+    if isinstance(value, BaseModel):
+        return value.model_dump()
+    raise TypeError(f"Type is not JSON serializable: {type(value).__name__}")
+
+# serialize a payload of dicts, lists, datetimes and pydantic models
+# OPT_UTC_Z writes utc datetimes as ...Z like pydantic does, so created_at keeps the format the api always had
+def dumps(payload) -> bytes:
+    return orjson.dumps(payload, default=_default, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_UTC_Z)
+
+def loads(body: bytes):
+    return orjson.loads(body)
+
+
+class FastJSONResponse(ORJSONResponse):
+    def render(self, content) -> bytes:
+        with metrics.timed("render"):
+            return dumps(content)
+
+# a response for a body that is already serialized (e.g. from the response cache)
+def raw_json(body: bytes) -> Response:
+    return Response(content=body, media_type="application/json")
@@ -1,41 +1,77 @@
 # File: auth.py
-# Path operations for authenticating user login attempts
+# Path operations for authenticating user login attempts, and for refreshing and revoking sessions (see app/tokens.py)
 # Author: Caitlin Coulombe
-# Last Updated: 2025-06-04
+# Last Updated: 2025-08-10
 
 from fastapi import Body, Depends, FastAPI, Response, status, HTTPException, APIRouter
 from fastapi.security.oauth2 import OAuth2PasswordRequestForm
 from app import schema as sch
-from app import utils, oauth2
-from app.database import get_db
-import psycopg2
+from app import oauth2
+from app import tokens
+from app.database import get_db, acquire_db, release_db
+from app.passwords import password_pool
 
 router = APIRouter(
     tags=['Authentication']
 )
 
 # login the user based on username and password attempt
+# a connection is only held around the queries, never while bcrypt runs (or waits for a worker), so a login storm
+# is turned away with 429s by the password pool instead of draining the connection pool for the rest of the api
 @router.post("/")
-def login(user_credentials: OAuth2PasswordRequestForm = Depends()):
-    conn, cursor = get_db()
-
-    cursor.execute("""SELECT * FROM users WHERE email = %s""", (user_credentials.username,))
-    user = cursor.fetchone()
+async def login(user_credentials: OAuth2PasswordRequestForm = Depends()):
+    conn, cursor = await acquire_db()
+    try:
+        await cursor.execute("""SELECT * FROM users WHERE email = %s""", (user_credentials.username,))
+        user = await cursor.fetchone()
+    finally:
+        await release_db(conn, cursor)
 
     if not user:
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail=f"Invalid Credentials")
     
     # need to verify that the attempted password is the same as the real password
-    if not utils.verify(user_credentials.password, user["password"]):
+    valid, new_hash = await password_pool.verify_and_update(user_credentials.password, user["password"])
+    if not valid:
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail=f"Invalid Credentials")
+
+    conn, cursor = await acquire_db()
+    try:
+        # the stored hash used an old cost factor, replace it now that we have the plain password
+        if new_hash:
+            await cursor.execute("""UPDATE users SET password = %s WHERE id = %s""", (new_hash, user["id"]))
+
+        # start a new session
+        refresh_token, sid = await tokens.issue_refresh_token(cursor, user["id"])
+        await conn.commit()
+    finally:
+        await release_db(conn, cursor)
     
     # create a token
-    access_token = oauth2.create_access_token(data = {"user_id": user["id"]})
+    access_token = oauth2.create_access_token(data = oauth2.user_claims(user, sid))
+
+    return {"token": sch.Token(access_token=access_token , token_type="bearer", id=user["id"], refresh_token=refresh_token)}
+
+# exchange a refresh token for a new access token (and a new refresh token, the old one can't be used again)
+@router.post("/refresh")
+async def refresh(body: sch.RefreshRequest, db = Depends(get_db)):
+    conn, cursor = db
+
+    user, refresh_token, sid = await tokens.rotate_refresh_token(conn, cursor, body.refresh_token)
+    await conn.commit()
+
+    access_token = oauth2.create_access_token(data = oauth2.user_claims(user, sid))
 
-    cursor.close()
-    conn.close()
+    return {"token": sch.Token(access_token=access_token , token_type="bearer", id=user["id"], refresh_token=refresh_token)}
 
-    return {"token": sch.Token(access_token=access_token , token_type="bearer", id=user["id"])}
+# end the session of the passed refresh token, its access tokens stop working as well
+@router.post("/logout", status_code=status.HTTP_204_NO_CONTENT)
+async def logout(body: sch.RefreshRequest, db = Depends(get_db)):
+    conn, cursor = db
 
+    sid = await tokens.revoke_refresh_token(cursor, body.refresh_token)
+    await conn.commit()
+    if sid:
+        tokens.revocations.add(sid)
 
-# add in refresh tokens so that people don't need to log in over and over again
\ No newline at end of file
+    return Response(status_code=status.HTTP_204_NO_CONTENT)
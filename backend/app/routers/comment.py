@@ -1,250 +1,171 @@
 # File: comment.py
 # Path operations related to comments
 # Author: Caitlin Coulombe
-# Last Updated: 2025-06-29
+# Last Updated: 2025-08-04
 
+from typing import Optional
 from fastapi import Body, Depends, FastAPI, Response, status, HTTPException, APIRouter
 from app import schema as sch
 from app import oauth2
+from app import pagination
+from app import comments
+from app import ownership
+from app import response_cache as rc
+from app.response_cache import response_cache
 from app.database import get_db
+from app.responses import FastJSONResponse
+import psycopg
 
 router = APIRouter(
     tags=['comment']
 )
 
-# path operation to get all of the comments for a specific post
-@router.get("/{post_id}")
-def get_comments(post_id: int, current_user: int = Depends(oauth2.get_current_user), limit: int = 100, skip: int = 0):
-    conn, cursor = get_db()
-
-    # check if the post exists
-    cursor.execute("""SELECT 1 FROM posts WHERE id = %s""", (str(post_id),))
-    post_exists = cursor.fetchone()
+# 404 unless the post exists - only called when a page comes back empty, so a normal page costs no extra query
+async def check_post_exists(cursor, post_id: int):
+    await cursor.execute("""SELECT 1 FROM posts WHERE id = %s""", (str(post_id),))
+    post_exists = await cursor.fetchone()
     if not post_exists:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
                             detail=f"post with id = {post_id} does not exist")
 
-    # get comments for the post
-    cursor.execute("""SELECT comments.*, 
-                   users.id AS author_id,
-                   users.email AS author_email,
-                   users.created_at AS author_created_at,
-                   users.display_name AS author_display_name
-                   FROM comments
-                   JOIN users ON comments.user_id = users.id
-                   WHERE post_id = %s
-                   ORDER BY comments.created_at ASC
-                   LIMIT %s OFFSET %s""", (str(post_id), limit, skip,))
-    comments = cursor.fetchall()
-
-    result = []
-    for comment in comments:
-        comment_dict = dict(comment)
-
-        # get the profile picture for the user
-        cursor.execute("""SELECT filename, filepath FROM profile_pictures WHERE user_id = %s""", (str(comment_dict["author_id"]),))
-        # print("AUTHOR_ID:", post_dict["author_id"], type(post_dict["author_id"]))
-
-        profile_pic_row = cursor.fetchone()
-
-        if profile_pic_row:
-            profile_pic = {
-                "filename":profile_pic_row["filename"],
-                "url": profile_pic_row["filepath"]
-            }
-        else:
-            profile_pic = None
-
-        # group the author information
-        author_data = {
-            "id": comment_dict["author_id"],
-            "email": comment_dict["author_email"],
-            "created_at": comment_dict["author_created_at"],
-            "display_name": comment_dict["author_display_name"],
-            "profile_pic": profile_pic
-        }
-
-        comment_dict["author"] = author_data
-
-        # remove the flattened author fields to avoid conflict
-        del comment_dict["author_id"]
-        del comment_dict["author_email"]
-        del comment_dict["author_created_at"]
-        del comment_dict["author_display_name"]
-
-        result.append(sch.CommentOut(**comment_dict))
-
-    cursor.close()
-    conn.close()
-
-    return {"data": result}
+# path operation to get all of the comments for a specific post
+@router.get("/{post_id}")
+async def get_comments(post_id: int, current_user: int = Depends(oauth2.get_current_user), limit: int = 100, skip: int = 0, after: Optional[str] = None, db = Depends(get_db)):
+    conn, cursor = db
+
+    cached = await response_cache.lookup("comments", {"post_id": post_id, "limit": limit, "skip": skip, "after": after}, [rc.comments_tag(post_id), rc.USERS])
+    if cached.body is not None:
+        return rc.json_response(cached.body)
+
+    where = "comments.post_id = %s"
+    params = [post_id]
+
+    # continue after the last comment of the previous page when a cursor is passed, otherwise fall back to the offset
+    if after:
+        created_at, last_id = pagination.decode_cursor(after)
+        where += " AND (comments.created_at, comments.id) > (%s, %s)"
+        params.extend([created_at, last_id])
+        skip = 0
+
+    result = await comments.fetch_comments(cursor, where, tuple(params), limit, skip)
+    if not result:
+        await check_post_exists(cursor, post_id)
+
+    body = rc.encode({"data": result, "next_cursor": pagination.next_cursor(result, limit)})
+    await response_cache.store(cached, body)
+    return rc.json_response(body)
 
 # path operation to get all of parent comments for a specific post
 @router.get("/parent/{post_id}")
-def get_comments(post_id: int, current_user: int = Depends(oauth2.get_current_user), limit: int = 100, skip: int = 0):
-    conn, cursor = get_db()
+async def get_comments(post_id: int, current_user: int = Depends(oauth2.get_current_user), limit: int = 100, skip: int = 0, after: Optional[str] = None, db = Depends(get_db)):
+    conn, cursor = db
 
-    # check if the post exists
-    cursor.execute("""SELECT 1 FROM posts WHERE id = %s""", (str(post_id),))
-    post_exists = cursor.fetchone()
-    if not post_exists:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
-                            detail=f"post with id = {post_id} does not exist")
+    cached = await response_cache.lookup("parent_comments", {"post_id": post_id, "limit": limit, "skip": skip, "after": after}, [rc.comments_tag(post_id), rc.USERS])
+    if cached.body is not None:
+        return rc.json_response(cached.body)
+
+    where = "comments.post_id = %s AND comments.parent_id IS NULL"
+    params = [post_id]
+
+    # continue after the last comment of the previous page when a cursor is passed, otherwise fall back to the offset
+    if after:
+        created_at, last_id = pagination.decode_cursor(after)
+        where += " AND (comments.created_at, comments.id) > (%s, %s)"
+        params.extend([created_at, last_id])
+        skip = 0
+
+    result = await comments.fetch_comments(cursor, where, tuple(params), limit, skip)
+    if not result:
+        await check_post_exists(cursor, post_id)
+
+    body = rc.encode({"data": result, "next_cursor": pagination.next_cursor(result, limit)})
+    await response_cache.store(cached, body)
+    return rc.json_response(body)
+
+# path operation to get the comment threads of a post: top level comments with their first "replies" replies nested
+# pass next_cursor as "after" for the next page of threads, and a thread's replies_cursor to /replies/{comment_id} for the rest of its replies
+@router.get("/thread/{post_id}")
+async def get_threads(post_id: int, current_user: int = Depends(oauth2.get_current_user), limit: int = 20, replies: int = 3, after: Optional[str] = None, db = Depends(get_db)):
+    conn, cursor = db
+
+    cached = await response_cache.lookup("threads", {"post_id": post_id, "limit": limit, "replies": replies, "after": after}, [rc.comments_tag(post_id), rc.USERS])
+    if cached.body is not None:
+        return rc.json_response(cached.body)
+
+    result = await comments.fetch_threads(cursor, post_id, limit, max(replies, 0), after)
+    if not result:
+        await check_post_exists(cursor, post_id)
+
+    body = rc.encode({"data": result, "next_cursor": pagination.next_cursor(result, limit)})
+    await response_cache.store(cached, body)
+    return rc.json_response(body)
 
-    # get comments for the post
-    cursor.execute("""SELECT comments.*, 
-                   users.id AS author_id,
-                   users.email AS author_email,
-                   users.created_at AS author_created_at,
-                   users.display_name AS author_display_name
-                   FROM comments
-                   JOIN users ON comments.user_id = users.id
-                   WHERE post_id = %s AND parent_id IS NULL
-                   ORDER BY comments.created_at ASC
-                   LIMIT %s OFFSET %s""", (str(post_id), limit, skip,))
-    comments = cursor.fetchall()
-
-    result = []
-    for comment in comments:
-        comment_dict = dict(comment)
-
-        # get the profile picture for the user
-        cursor.execute("""SELECT filename, filepath FROM profile_pictures WHERE user_id = %s""", (str(comment_dict["author_id"]),))
-        # print("AUTHOR_ID:", post_dict["author_id"], type(post_dict["author_id"]))
-
-        profile_pic_row = cursor.fetchone()
-
-        if profile_pic_row:
-            profile_pic = {
-                "filename":profile_pic_row["filename"],
-                "url": profile_pic_row["filepath"]
-            }
-        else:
-            profile_pic = None
-
-        # group the author information
-        author_data = {
-            "id": comment_dict["author_id"],
-            "email": comment_dict["author_email"],
-            "created_at": comment_dict["author_created_at"],
-            "display_name": comment_dict["author_display_name"],
-            "profile_pic": profile_pic
-        }
-
-        comment_dict["author"] = author_data
-
-        # remove the flattened author fields to avoid conflict
-        del comment_dict["author_id"]
-        del comment_dict["author_email"]
-        del comment_dict["author_created_at"]
-        del comment_dict["author_display_name"]
-
-        result.append(sch.CommentOut(**comment_dict))
-
-    cursor.close()
-    conn.close()
-
-    return {"data": result}
+# path operation to load more replies to a comment (oldest first)
+@router.get("/replies/{comment_id}")
+async def get_replies(comment_id: int, current_user: int = Depends(oauth2.get_current_user), limit: int = 20, after: Optional[str] = None, db = Depends(get_db)):
+    conn, cursor = db
+
+    where = "comments.parent_id = %s"
+    params = [comment_id]
+
+    if after:
+        created_at, last_id = pagination.decode_cursor(after)
+        where += " AND (comments.created_at, comments.id) > (%s, %s)"
+        params.extend([created_at, last_id])
+
+    result = await comments.fetch_comments(cursor, where, tuple(params), limit)
+
+    return FastJSONResponse({"data": result, "next_cursor": pagination.next_cursor(result, limit)})
 
 # path operation to create a new comment for a post
 @router.post("/{post_id}", status_code=status.HTTP_201_CREATED)
-def create_comment(post_id: int, comment: sch.CreateComment, current_user: int = Depends(oauth2.get_current_user)):
-    conn, cursor = get_db()
-
-    cursor.execute("""INSERT INTO comments (content, post_id, user_id) VALUES (%s, %s, %s) RETURNING *""", (comment.content, str(post_id), current_user.id,))
-    new_comment = cursor.fetchone()
-    if not new_comment:
+async def create_comment(post_id: int, comment: sch.CreateComment, current_user: int = Depends(oauth2.get_current_user), db = Depends(get_db)):
+    conn, cursor = db
+
+    try:
+        new_comment = await comments.insert_comment(cursor, comment.content, post_id, current_user.id)
+        await conn.commit()
+    except psycopg.errors.ForeignKeyViolation:
+        await conn.rollback()
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
-                            detail=f"Comment could not be created")
-    conn.commit()
-
-    cursor.close()
-    conn.close()
+                            detail=f"post with id = {post_id} does not exist")
+    await rc.comments_changed(post_id)
     # print("NEW COMMENT DATA: " + new_comment)
     return {"data" :sch.CreateCommentOut(**new_comment)}
 
 # create a child comment
 @router.post("/{post_id}/{parent_id}", status_code=status.HTTP_201_CREATED)
-def create_comment(post_id: int, parent_id: int, comment: sch.CreateComment, current_user: int = Depends(oauth2.get_current_user)):
-    conn, cursor = get_db()
-
-    # check that the "parent" comment is not itelf a child (only one level of parenthood)
-    cursor.execute("""SELECT parent_id FROM comments WHERE id = %s""", (str(parent_id),))
-    is_childRow = cursor.fetchone()
-    if is_childRow and is_childRow["parent_id"] is not None:
-        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
-                            detail=f"Comment with id = {parent_id} is a child and cannot be a parent as well: " + str(is_childRow))
-
-    # check that there is a comment with the entered id for the post id
-    cursor.execute("""SELECT 1 FROM comments WHERE post_id = %s AND id = %s""", (str(post_id), str(parent_id),))
-    parent_exists = cursor.fetchone()
-    if not parent_exists:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
-                            detail=f"There is not a comment with the id = {parent_id} on the post with the id = {post_id}")
-
-    cursor.execute("""INSERT INTO comments (content, post_id, user_id, parent_id) VALUES (%s, %s, %s, %s) RETURNING *""", (comment.content, str(post_id), current_user.id, str(parent_id),))
-    new_comment = cursor.fetchone()
-    if not new_comment:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
-                            detail=f"Comment could not be created")
-    conn.commit()
+async def create_comment(post_id: int, parent_id: int, comment: sch.CreateComment, current_user: int = Depends(oauth2.get_current_user), db = Depends(get_db)):
+    conn, cursor = db
 
-    cursor.close()
-    conn.close()
+    # the parent has to be a top level comment of the post (only one level of parenthood)
+    new_comment = await comments.insert_reply(cursor, comment.content, post_id, parent_id, current_user.id)
+    await conn.commit()
+    await rc.comments_changed(post_id)
     # print("NEW COMMENT DATA: " + new_comment)
     return {"data" :sch.CreateCommentOut(**new_comment)}
 
 # path operation to edit an existing comment
 @router.put("/{comment_id}")
-def create_comment(comment_id: int, comment: sch.CreateComment, current_user: int = Depends(oauth2.get_current_user)):
-    conn, cursor = get_db()
+async def create_comment(comment_id: int, comment: sch.CreateComment, current_user: int = Depends(oauth2.get_current_user), db = Depends(get_db)):
+    conn, cursor = db
 
-    cursor.execute("""SELECT user_id FROM comments WHERE id = %s""", (str(comment_id),))
-    user_id = cursor.fetchone()
-    if not user_id:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
-                            detail=f"comment with id: {comment_id} was not found")
-    
-    if user_id["user_id"] != current_user.id:
-        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN,
-                            detail=f"Not authorized to perform requested action.")
+    # only the author can edit the comment
+    updated = await ownership.update_owned(cursor, "comments", comment_id, current_user.id, "content = %s", (comment.content,), "comment")
     
-    cursor.execute("""UPDATE comments SET content = %s WHERE id = %s RETURNING *""", (comment.content, str(comment_id),))
-    updated = cursor.fetchone()
-    if not updated:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
-                            detail=f"comment with id: {comment_id} was not updated")
-    
-    conn.commit()
-
-    cursor.close()
-    conn.close()
+    await conn.commit()
+    await rc.comments_changed(updated["post_id"])
     
     return {"data" :sch.CreateCommentOut(**updated)}
 
 # path operation to delete an existing comment
 @router.delete("/{comment_id}")
-def create_comment(comment_id: int, current_user: int = Depends(oauth2.get_current_user)):
-    conn, cursor = get_db()
-
-    cursor.execute("""SELECT user_id FROM comments WHERE id = %s""", (str(comment_id),))
-    user_id = cursor.fetchone()
-    if not user_id:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
-                            detail=f"comment with id: {comment_id} was not found")
-    
-    if user_id["user_id"] != current_user.id:
-        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN,
-                            detail=f"Not authorized to perform requested action.")
-    
-    cursor.execute("""DELETE FROM comments WHERE id = %s RETURNING *""", (str(comment_id),))
-    deleted = cursor.fetchone()
-    if not deleted:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
-                            detail=f"post with id: {id} was not found")
-    conn.commit()
+async def create_comment(comment_id: int, current_user: int = Depends(oauth2.get_current_user), db = Depends(get_db)):
+    conn, cursor = db
 
-    cursor.close()
-    conn.close()
+    # replies are removed along with their parent so they are deleted here too to keep the comment counter right
+    post_id = await comments.delete_comment(cursor, comment_id, current_user.id)
+    await conn.commit()
+    await rc.comments_changed(post_id)
     
     return Response(status_code=status.HTTP_204_NO_CONTENT)
@@ -0,0 +1,75 @@
+# File: follow.py
+# Path operations related to following users
+# Author: Caitlin Coulombe
+# Last Updated: 2025-08-09
+
+from typing import Optional
+from fastapi import Depends, status, HTTPException, APIRouter
+from app import schema as sch
+from app import oauth2
+from app import follows
+from app.database import get_db
+from app.responses import FastJSONResponse
+import psycopg
+
+router = APIRouter(
+    tags=['Follow']
+)
+
+# 404 unless the user exists - only called when a list comes back empty, so a normal page costs no extra query
+async def check_user_exists(cursor, user_id: int):
+    await cursor.execute("""SELECT 1 FROM users WHERE id = %s""", (user_id,))
+    if not await cursor.fetchone():
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
+                            detail=f"user with id: {user_id} was not found")
+
+# follow or unfollow a user based on the direction flag
+# idempotent like likes: following a user twice (or unfollowing one that isn't followed) succeeds without changing anything
+@router.post("/", status_code=status.HTTP_201_CREATED)
+async def follow(follow: sch.Follow, current_user: int = Depends(oauth2.get_current_user), db = Depends(get_db)):
+    conn, cursor = db
+    following = follow.dir == 1
+
+    if follow.user_id == current_user.id:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="You can't follow yourself")
+
+    try:
+        if following:
+            await follows.follow(cursor, current_user.id, follow.user_id)
+        else:
+            await follows.unfollow(cursor, current_user.id, follow.user_id)
+        await conn.commit()
+    except psycopg.errors.ForeignKeyViolation:
+        await conn.rollback()
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"user with id: {follow.user_id} was not found")
+
+    return {"message": "successfully followed user" if following else "successfully unfollowed user", "following": following}
+
+# the users following a user, most recent first - pass next_cursor as "after" for the next page
+@router.get("/followers/{user_id}")
+async def get_followers(user_id: int, current_user: int = Depends(oauth2.get_current_user), limit: int = 50, after: Optional[str] = None, db = Depends(get_db)):
+    conn, cursor = db
+
+    result = await follows.fetch_follow_list(cursor, "followee_id", user_id, limit, after)
+    if not result:
+        await check_user_exists(cursor, user_id)
+
+    return FastJSONResponse({"data": result, "next_cursor": follows.next_cursor(result, limit)})
+
+# the users a user follows, most recent first
+@router.get("/following/{user_id}")
+async def get_following(user_id: int, current_user: int = Depends(oauth2.get_current_user), limit: int = 50, after: Optional[str] = None, db = Depends(get_db)):
+    conn, cursor = db
+
+    result = await follows.fetch_follow_list(cursor, "follower_id", user_id, limit, after)
+    if not result:
+        await check_user_exists(cursor, user_id)
+
+    return FastJSONResponse({"data": result, "next_cursor": follows.next_cursor(result, limit)})
+
+# whether the current user follows the passed user
+@router.get("/{user_id}")
+async def check_follow(user_id: int, current_user: int = Depends(oauth2.get_current_user), db = Depends(get_db)):
+    conn, cursor = db
+
+    return {"following": await follows.is_following(cursor, current_user.id, user_id)}
@@ -1,70 +1,64 @@
 # File: like.py
 # Path operations related to likes
 # Author: Caitlin Coulombe
-# Last Updated: 2025-06-04
+# Last Updated: 2025-08-10
 
-from fastapi import Body, Depends, FastAPI, Response, status, HTTPException, APIRouter
+from typing import List
+from fastapi import Body, Depends, FastAPI, Response, status, HTTPException, APIRouter, Query
 from app import schema as sch
 from app import oauth2
+from app import likes
+from app.likes import like_buffer
+from app import feed
+from app import response_cache as rc
 from app.database import get_db
+import psycopg
 
 router = APIRouter(
     tags=['Like']
 )
 
+# most post ids that can be checked in one request
+MAX_LIKE_CHECK = 200
+
 # add or remove a like based on the direction flag
+# idempotent: liking an already liked post (or unliking a post that isn't liked) succeeds without changing anything,
+# so double clicks and retries are safe
 @router.post("/", status_code=status.HTTP_201_CREATED)
-def like(like: sch.Like, current_user: int = Depends(oauth2.get_current_user)):
-    conn, cursor = get_db()
+async def like(like: sch.Like, current_user: int = Depends(oauth2.get_current_user), db = Depends(get_db)):
+    conn, cursor = db
+    liked = like.dir == 1
+
+    # written later in a batch (the post is checked when the batch is flushed)
+    if like_buffer is not None:
+        like_buffer.add(current_user.id, like.post_id, liked)
+        return {"message": "successfully added like" if liked else "successfully removed like", "liked": liked}
 
-    # check that the targetted vote exists
-    cursor.execute("""SELECT 1 FROM posts WHERE id = %s""", (like.post_id,))
-    post_exists = cursor.fetchone()
-    if not post_exists:
+    try:
+        if liked:
+            changed = await likes.add_like(cursor, like.post_id, current_user.id)
+        else:
+            changed = await likes.remove_like(cursor, like.post_id, current_user.id)
+        await conn.commit()   # changes made to the database must be committed deliberately
+    except psycopg.errors.ForeignKeyViolation:
+        await conn.rollback()
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"post with id: {like.post_id} was not found")
 
-    cursor.execute("""SELECT 1 FROM likes WHERE user_id = %s AND post_id = %s""", (current_user.id, like.post_id))
-    isLiked = cursor.fetchone()
+    if changed:
+        await rc.likes_changed(like.post_id)
+
+    return {"message": "successfully added like" if liked else "successfully removed like", "liked": liked}
 
-    if(like.dir == 1):
-        if isLiked:
-            raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=f"user {current_user.id} has already liked post {like.post_id}")
-            # already liked the post
-        cursor.execute("""INSERT INTO likes (post_id, user_id) VALUES (%s, %s)""", (like.post_id, current_user.id))
-        conn.commit()   # changes made to the database must be committed deliberately
-        
-        cursor.close()
-        conn.close()
-        
-        return {"message": "successfully added like"}
-    else:
-        if not isLiked:
-            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Like does not exist")
-        cursor.execute("""DELETE FROM likes WHERE user_id = %s AND post_id = %s""", (current_user.id, like.post_id))
-        conn.commit()
-        
-        cursor.close()
-        conn.close()
 
-        return {"message": "successfully removed like"}
+# returns the ids of the passed posts that the user has liked, e.g. /api/likes/?post_ids=1&post_ids=2
+# one query for a whole page of posts instead of one request per post
+@router.get("/")
+async def get_liked(post_ids: List[int] = Query([]), current_user: int = Depends(oauth2.get_current_user), db = Depends(get_db)):
+    conn, cursor = db
 
+    if len(post_ids) > MAX_LIKE_CHECK:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"at most {MAX_LIKE_CHECK} posts can be checked at once")
 
-# returns 1 is the user has liked the passed post
-@router.get("/{id}", status_code=status.HTTP_201_CREATED)
-def check_like(id:int, current_user: int = Depends(oauth2.get_current_user)):
-    conn, cursor = get_db()
+    liked = await feed.liked_post_ids(cursor, current_user.id, post_ids)
 
-    # check that the targetted vote exists
-    cursor.execute("""SELECT 1 FROM posts WHERE id = %s""", (str(id),))
-    post_exists = cursor.fetchone()
-    if not post_exists:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"post with id: {id} was not found")
-    
-    # return if the post was liked by the user or not
-    cursor.execute("""SELECT 1 FROM likes WHERE user_id = %s AND post_id = %s""", (current_user.id, str(id),))
-    isLiked = cursor.fetchone()
-    
-    cursor.close()
-    conn.close()
-    
-    return {"liked": bool(isLiked)}
+    return {"liked": sorted(liked)}
@@ -1,16 +1,27 @@
 # File: media.py
 # Path operations concerning adding media
 # Author: Caitlin Coulombe
-# Last Updated: 2025-06-20
+# Last Updated: 2025-08-10
 from typing import List, Optional
-from fastapi import Body, Depends, FastAPI, Response, status, HTTPException, APIRouter, UploadFile, Form, File
-from fastapi.responses import JSONResponse
+from fastapi import Body, Depends, FastAPI, Request, Response, status, HTTPException, APIRouter
+from fastapi.concurrency import run_in_threadpool
+import asyncio
+import contextlib
 import os
-import shutil
 from datetime import datetime
 from app import schema as sch
 from app import oauth2
-from app.database import get_db
+from app import storage
+from app import outbox
+from app import ownership
+from app import utils
+from app import images
+from app import feed
+from app import response_cache as rc
+from app import metrics
+from app.config import settings
+from app.database import get_db, acquire_db, release_db
+from psycopg.types.json import Jsonb
 import boto3
 from botocore.exceptions import NoCredentialsError
 
@@ -21,230 +32,292 @@ router = APIRouter(
 # AWS S3 setup
 BUCKET_NAME = os.getenv("S3_BUCKET_NAME")
 REGION_NAME = os.getenv("AWS_REGION")
-s3_client = boto3.client("s3", region_name=REGION_NAME)
-
-# UPLOAD_DIR = "media"
-# os.makedirs(UPLOAD_DIR, exist_ok=True)
+s3_client = metrics.instrument_s3(boto3.client("s3", region_name=REGION_NAME))
 
 ALLOWED_CONTENT_TYPES = {"image/png", "image/jpg", "image/jpeg", "image/gif", "image/webp"}   # for now just allowing still images, not mov or mp4 (big and expensive)
+MAX_FILES_PER_POST = 9
 
-# for uploading the file to s3
-def upload_file_to_s3(file_path: str, bucket: str, object_name: str):
-    try:
-        print(f"Uploading {file_path} to bucket {bucket} with key {object_name}")
-        s3_client.upload_file(file_path, bucket, object_name)
-        print("Upload successful")
-    except NoCredentialsError:
+# turn an s3 failure into the error the client sees
+def upload_failed(e: Exception) -> HTTPException:
+    if isinstance(e, NoCredentialsError):
         print("AWS credentials not found!")
-        raise HTTPException(status_code=500, 
-                            detail="AWS credentials not available")
-    except Exception as e:
-        print(f"Upload failed: {str(e)}")
-        raise HTTPException(status_code=500, 
-                            detail=f"Failed to upload to S3: {str(e)}")
-
+        return HTTPException(status_code=500, 
+                             detail="AWS credentials not available")
+    print(f"Upload failed: {str(e)}")
+    return HTTPException(status_code=500, 
+                         detail=f"Failed to upload to S3: {str(e)}")
+
+# remove already uploaded objects after a failed upload (failures are only logged)
+async def delete_s3_objects(filenames: List[str]):
+    async def delete(filename: str):
+        try:
+            await run_in_threadpool(utils.delete_s3_object, filename)
+        except Exception as e:
+            print(f"media: Error deleting S3 file {filename}: {e}")
+
+    await asyncio.gather(*(delete(filename) for filename in filenames))
     
 # for getting the file from s3
 def get_s3_url(filename:str) -> str:
     return f"https://{BUCKET_NAME}.s3.{REGION_NAME}.amazonaws.com/{filename}"
 
-# for uploading a media file: 
-@router.post("/upload-s3/{post_id}", status_code=status.HTTP_201_CREATED)
-async def upload_file(post_id: int, files: List[UploadFile] = File(...), current_user: int = Depends(oauth2.get_current_user)):
-    print("=== HANDLER HIT: CORRECT upload_file() ===")
-
-    conn, cursor = get_db()
-    uploaded_urls = []
-    
-    # only add media to the user's post
-    cursor.execute("""SELECT user_id FROM posts WHERE id = %s""", (str(post_id),))
-    user_id = cursor.fetchone()
-    if not user_id:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
-                            detail=f"post with id: {post_id} was not found")
-
-    if user_id["user_id"] != current_user.id:
-        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail=f"Not authorized to perform requested action.")
-
-    for file in files:
-        if file.content_type not in ALLOWED_CONTENT_TYPES:
-            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
-                                detail=f"Invalid file type")
-
-        filename = f"{int(datetime.utcnow().timestamp())}_{file.filename}"
-        temp_file_path = f"/tmp/{filename}"
-
-        # save to temp location
-        with open(temp_file_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-
-        # upload to s3
-        print(f"temp_file_path: {temp_file_path} ({type(temp_file_path)})")
-        print(f"BUCKET_NAME: {BUCKET_NAME} ({type(BUCKET_NAME)})")
-        print(f"filename: {filename} ({type(filename)})")
-        upload_file_to_s3(temp_file_path, BUCKET_NAME, filename)
-
-        # delete temp file
-        os.remove(temp_file_path)
+# resize an uploaded image and upload the variants next to the original
+# returns the srcset entries to store with the file's row (empty if the image could not be processed, the original is still served)
+async def upload_variants(data: bytes, filename: str, widths: List[int], square: bool = False) -> List[dict]:
+    variants = []
+    try:
+        variants = await run_in_threadpool(images.generate_variants, data, filename, widths, square)
 
-        s3_url = get_s3_url(filename)
+        await asyncio.gather(*(run_in_threadpool(s3_client.put_object, Bucket=BUCKET_NAME, Key=variant["key"],
+                                                 Body=variant["body"], ContentType=variant["content_type"])
+                               for variant in variants))
+    except Exception as e:
+        print(f"media: Could not create image variants for {filename}: {e}")
+        await delete_s3_objects([variant["key"] for variant in variants])
+        return []
+
+    return [{"key": variant["key"], "url": get_s3_url(variant["key"]), "width": variant["width"], "format": variant["format"]}
+            for variant in variants]
+
+# upload the files of a multipart request to s3 while its body is still arriving - nothing is written to local disk
+# each file is checked as soon as its headers are read and its data is fed into an s3 upload chunk by chunk. Finishing
+# a file (its last part and its resized variants) carries on while the next file is read, media_upload_concurrency
+# files at a time. Images are kept in memory to be resized (up to media_variant_max_size), other files never are.
+# returns (filename, variants) of each file in the order they were sent - on any failure, whatever was already
+# uploaded is removed from s3 before the error is raised
+async def upload_form_files(request: Request, max_files: int, widths: List[int], square: bool = False) -> List[tuple]:
+    timestamp = int(datetime.utcnow().timestamp())
+    slots = asyncio.Semaphore(settings.media_upload_concurrency)
+    finishing = []
+    current = None
+    upload = None
+    data = None
+
+    async def finish(upload: storage.S3Upload, data: bytearray):
+        try:
+            try:
+                await upload.close()
+            except Exception as e:
+                raise upload_failed(e)
+            variants = await upload_variants(bytes(data), upload.key, widths, square) if data is not None else []
+            return upload.key, variants
+        finally:
+            slots.release()
 
-        # save metadata to database
-        cursor.execute("""INSERT INTO files (filename, filepath, uploaded_at, post_id)
-                    VALUES (%s, %s, NOW(), %s)""", (filename, s3_url, post_id))
-        
-        uploaded_urls.append(s3_url)
+    try:
+        async with contextlib.aclosing(storage.iter_form_files(request)) as parts:
+            async for file, chunk in parts:
+                if file is not current:
+                    # validate every file before any of it is uploaded
+                    if len(finishing) >= max_files:
+                        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                                            detail=f"At most {max_files} file(s) can be uploaded at once")
+                    if file.content_type not in ALLOWED_CONTENT_TYPES:
+                        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                                            detail=f"Invalid file type")
+
+                    await slots.acquire()
+                    current = file
+                    upload = storage.S3Upload(s3_client, BUCKET_NAME, f"{timestamp}_{file.filename}", file.content_type)
+                    data = bytearray() if file.content_type in images.PROCESSED_CONTENT_TYPES else None
+
+                if chunk is None:
+                    finishing.append(asyncio.create_task(finish(upload, data)))
+                    upload = None
+                    continue
+
+                if data is not None:
+                    data += chunk
+                    if len(data) > settings.media_variant_max_size:
+                        data = None
+                try:
+                    await upload.write(chunk)
+                except Exception as e:
+                    raise upload_failed(e)
+    except BaseException:
+        # the file being read when it failed, then everything already sent
+        if upload is not None:
+            await upload.abort()
+            slots.release()
+        results = await asyncio.gather(*finishing, return_exceptions=True)
+        await delete_s3_objects(uploaded_keys(results))
+        raise
+
+    if not finishing:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="No files were uploaded")
+
+    results = await asyncio.gather(*finishing, return_exceptions=True)
+    failures = [result for result in results if isinstance(result, BaseException)]
+    if failures:
+        # don't leave part of the post's media behind in s3
+        await delete_s3_objects(uploaded_keys(results))
+        raise failures[0]
+
+    return results
+
+# the s3 keys of the files (and their variants) that upload_form_files got into the bucket
+def uploaded_keys(results: list) -> List[str]:
+    keys = []
+    for result in results:
+        if not isinstance(result, BaseException):
+            filename, variants = result
+            keys.append(filename)
+            keys.extend(variant["key"] for variant in variants)
+    return keys
+
+# the multipart body the upload endpoints read themselves (see upload_form_files), for the api docs
+def form_files_body(field: str, multiple: bool) -> dict:
+    file = {"type": "string", "format": "binary"}
+    return {"requestBody": {"required": True, "content": {"multipart/form-data": {"schema": {
+        "type": "object", "required": [field],
+        "properties": {field: {"type": "array", "items": file} if multiple else file}}}}}}
 
-    conn.commit()
+# for uploading a media file: 
+# the uploads to s3 take far longer than the queries, so no connection is held while they run - one is borrowed for the
+# ownership check and another for saving the metadata (likewise for the profile pictures below)
+# the ownership check runs before the body is read, so nothing is uploaded for someone else's post
+@router.post("/upload-s3/{post_id}", status_code=status.HTTP_201_CREATED, openapi_extra=form_files_body("files", multiple=True))
+async def upload_file(post_id: int, request: Request, current_user: int = Depends(oauth2.get_current_user)):
+    # only add media to the user's post - checked up front, before anything is uploaded to s3
+    conn, cursor = await acquire_db()
+    try:
+        await ownership.require_owner(cursor, "posts", post_id, current_user.id, "post")
+    finally:
+        await release_db(conn, cursor)
 
-    cursor.close()
-    conn.close()
+    # upload to s3 as the files arrive
+    results = await upload_form_files(request, MAX_FILES_PER_POST, images.POST_WIDTHS)
+    filenames = [filename for filename, variants in results]
+    uploaded_urls = [get_s3_url(filename) for filename in filenames]
 
-    print(uploaded_urls)
+    # save metadata to database in one statement (releasing the connection rolls back a failed insert)
+    try:
+        conn, cursor = await acquire_db()
+        try:
+            await cursor.execute("""INSERT INTO files (filename, filepath, uploaded_at, post_id, variants)
+                                 SELECT filename, filepath, NOW(), %s, variants
+                                 FROM unnest(%s::varchar[], %s::varchar[], %s::jsonb[]) AS uploaded (filename, filepath, variants)""",
+                                 (post_id, filenames, uploaded_urls, [Jsonb(variants) for filename, variants in results]))
+            await conn.commit()
+        finally:
+            await release_db(conn, cursor)
+    except Exception:
+        await delete_s3_objects(uploaded_keys(results))
+        raise
+
+    await rc.post_changed(post_id)
 
     return {"urls": uploaded_urls}
 
 # for retrieving the data for all media related to a specific post
 @router.get("/by-id/{post_id}")
-def get_media_id(post_id: int):
-    conn, cursor = get_db()
+async def get_media_id(post_id: int, db = Depends(get_db)):
+    conn, cursor = db
 
-    cursor.execute("SELECT 1 FROM posts WHERE id = %s", (post_id,))
-    postExists = cursor.fetchone()
+    await cursor.execute("SELECT 1 FROM posts WHERE id = %s", (post_id,))
+    postExists = await cursor.fetchone()
 
     if not postExists:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
                             detail=f"post with id: {post_id} was not found")
 
-    cursor.execute("SELECT filename, filepath FROM files WHERE post_id = %s", (post_id,))
-    rows = cursor.fetchall()
+    await cursor.execute("SELECT filename, filepath, variants FROM files WHERE post_id = %s", (post_id,))
+    rows = await cursor.fetchall()
 
     if not rows:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, 
                             detail=f"No media associated with post {post_id}")
 
-    files = [{"filename": row["filename"], "url": row["filepath"]} for row in rows]
-
-    cursor.close()
-    conn.close()
+    files = [feed.media_dict(row) for row in rows]
 
     return {"files": files}
 
 # for uploading a profile picture - occurs during account creation so the user cannot be authorized yet
-@router.post("/profile/upload/{user_id}", status_code=status.HTTP_201_CREATED)
-# async def upload_file(user_id: int, file: UploadFile = File(...), current_user: int = Depends(oauth2.get_current_user)):
-async def upload_profile_picture(user_id: int, file: UploadFile = File(...)):
-
-    conn, cursor = get_db()
-
-    if file.content_type not in ALLOWED_CONTENT_TYPES:
-        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
-                            detail=f"Invalid file type")
-
-    filename = f"{int(datetime.utcnow().timestamp())}_{file.filename}"
-    temp_file_path = f"/tmp/{filename}"
+@router.post("/profile/upload/{user_id}", status_code=status.HTTP_201_CREATED, openapi_extra=form_files_body("file", multiple=False))
+async def upload_profile_picture(user_id: int, request: Request):
 
-    # save file to disk
-    with open(temp_file_path, "wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
-
-    # upload to s3
-    upload_file_to_s3(temp_file_path, BUCKET_NAME, filename)
-    os.remove(temp_file_path)
+    # upload to s3, along with the square avatar thumbnails
+    [(filename, variants)] = await upload_form_files(request, 1, images.AVATAR_WIDTHS, square=True)
 
     s3_url = get_s3_url(filename)
 
-    # save metadata to database
-    cursor.execute("""INSERT INTO profile_pictures (filename, filepath, uploaded_at, user_id)
-                VALUES (%s, %s, NOW(), %s)""", (filename, s3_url, user_id))
-
-    conn.commit()
-
-    cursor.close()
-    conn.close()
+    # save metadata to database, removing the new picture from s3 again if that fails
+    try:
+        conn, cursor = await acquire_db()
+        try:
+            await cursor.execute("""INSERT INTO profile_pictures (filename, filepath, uploaded_at, user_id, variants)
+                        VALUES (%s, %s, NOW(), %s, %s)""", (filename, s3_url, user_id, Jsonb(variants)))
+
+            await conn.commit()
+        finally:
+            await release_db(conn, cursor)
+    except Exception:
+        await delete_s3_objects(uploaded_keys([(filename, variants)]))
+        raise
+    await rc.users_changed()
 
     return {"url": s3_url}
 
 # for retrieving the data for the profile picture for the user
 @router.get("/by-user/{user_id}")
-def get_media_user(user_id: int):
-    conn, cursor = get_db()
+async def get_media_user(user_id: int, db = Depends(get_db)):
+    conn, cursor = db
 
-    cursor.execute("SELECT 1 FROM users WHERE id = %s", (user_id,))
-    postExists = cursor.fetchone()
+    await cursor.execute("SELECT 1 FROM users WHERE id = %s", (user_id,))
+    postExists = await cursor.fetchone()
 
     if not postExists:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
                             detail=f"user with id: {user_id} was not found")
     
-    cursor.execute("SELECT filename, filepath FROM profile_pictures WHERE user_id = %s", (user_id,))
-    file = cursor.fetchone()
+    await cursor.execute("SELECT filename, filepath, variants FROM profile_pictures WHERE user_id = %s", (user_id,))
+    file = await cursor.fetchone()
 
     if not file:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, 
                             detail=f"No media associated with user {user_id}")
 
 
-    cursor.close()
-    conn.close()
-
     return {"file": file}
 
 # for updating an existing profile picture
-@router.put("/profile/update/{user_id}", status_code=status.HTTP_201_CREATED)
-async def upload_file(user_id: int, file: UploadFile = File(...), current_user: int = Depends(oauth2.get_current_user)):
-    conn, cursor = get_db()
-    uploaded_urls = []
+@router.put("/profile/update/{user_id}", status_code=status.HTTP_201_CREATED, openapi_extra=form_files_body("file", multiple=False))
+async def upload_file(user_id: int, request: Request, current_user: int = Depends(oauth2.get_current_user)):
 
     # only change own profile picture
     if user_id != current_user.id:
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail=f"Not authorized to perform requested action.")
 
-    if file.content_type not in ALLOWED_CONTENT_TYPES:
-        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
-                            detail=f"Invalid file type")
-
-    # Get current file path before overwriting
-    cursor.execute("SELECT filepath FROM profile_pictures WHERE user_id = %s", (str(user_id),))
-    old = cursor.fetchone()
-    print(f"Fetched row from DB: {old}")  # Log the DB result
-    old_filepath = old["filepath"] if old else None
-    
-    # delete old file from s3
-    if old_filepath:
-            key = old_filepath.split("/")[-1]
-            print(f"Attempting to delete: bucket={BUCKET_NAME}, key={key}")
-            try:
-                s3_client.delete_object(Bucket=BUCKET_NAME, Key=key)
-                print("Delete successful")
-            except Exception as e:
-                print(f"Failed to delete S3 object: {e}")
-    else:
-        print("No filepath found for user, skipping delete.")
-
-    filename = f"{int(datetime.utcnow().timestamp())}_{file.filename}"
-    temp_file_path = f"/tmp/{filename}"
-
-    # save file to disk
-    with open(temp_file_path, "wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
-
     # upload new pic to s3
-    upload_file_to_s3(temp_file_path, BUCKET_NAME, filename)
-    os.remove(temp_file_path)
+    [(filename, variants)] = await upload_form_files(request, 1, images.AVATAR_WIDTHS, square=True)
 
     s3_url = get_s3_url(filename)
-   
-    cursor.execute("""UPDATE profile_pictures SET filename = %s, filepath = %s, uploaded_at = NOW() WHERE user_id = %s RETURNING *""", (filename, s3_url, str(user_id),))
-    updated = cursor.fetchone()
-
-    if not updated:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, 
-                        detail=f"No media associated with user {user_id}")
 
-    conn.commit()
-
-    cursor.close()
-    conn.close()
+    # on any failure (including the 404) the old picture stays and the new one is removed from s3 again
+    try:
+        conn, cursor = await acquire_db()
+        try:
+            # queue the old picture (and its thumbnails) for deletion from s3 - only once the new one is uploaded, so a failed
+            # upload leaves the old picture in place
+            await outbox.enqueue_from(cursor, """SELECT filename FROM profile_pictures WHERE user_id = %s
+                                      UNION ALL
+                                      SELECT variant->>'key' FROM profile_pictures,
+                                      jsonb_array_elements(profile_pictures.variants) AS variant
+                                      WHERE profile_pictures.user_id = %s""", (user_id, user_id))
+
+            await cursor.execute("""UPDATE profile_pictures SET filename = %s, filepath = %s, uploaded_at = NOW(), variants = %s WHERE user_id = %s RETURNING *""", (filename, s3_url, Jsonb(variants), str(user_id),))
+            updated = await cursor.fetchone()
+
+            if not updated:
+                raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, 
+                                detail=f"No media associated with user {user_id}")
+
+            await conn.commit()
+        finally:
+            await release_db(conn, cursor)
+    except Exception:
+        await delete_s3_objects(uploaded_keys([(filename, variants)]))
+        raise
+    await rc.users_changed()
 
     return {"url": s3_url}
\ No newline at end of file
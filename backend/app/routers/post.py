@@ -1,381 +1,188 @@
 # File: post.py
 # Contains path operations related to creating, retrieving, updaing, and deleting posts
 # Author: Caitlin Coulombe
-# Last Updated: 2025-06-26
+# Last Updated: 2025-08-10
 
-import os
 from typing import Optional
 from fastapi import Body, Depends, FastAPI, Response, status, HTTPException, APIRouter
 from app import schema as sch
 from app import oauth2
-from app import utils
+from app import outbox
+from app import ownership
+from app import feed
+from app import pagination
+from app import search as post_search
+from app import timelines
+from app import response_cache as rc
+from app.response_cache import response_cache
 from app.database import get_db
-import boto3
+from app.responses import FastJSONResponse
 
 router = APIRouter(
     tags=['Posts']
 )
 
-s3_client = boto3.client("s3", region_name=os.getenv("AWS_REGION"))
-BUCKET_NAME = os.getenv("AWS_S3_BUCKET")
+# newest first, with the id as a tie breaker so the order matches the (created_at, id) pagination cursor
+FEED_ORDER = "posts.created_at DESC, posts.id DESC"
 
-# TODO: right now the limit is set to 100, but you'll want to keep that a bit lower out of developement and then use pagination to get more posts
 # path operation to get all of the posts
+# pass the next_cursor from the previous page as "after" for keyset pagination, "skip" is kept for older clients
 @router.get("/")
-def get_posts(current_user: int = Depends(oauth2.get_current_user), limit: int = 100, skip: int = 0, published: bool = True, search: Optional[str] = None):
-    conn, cursor = get_db()
-
+async def get_posts(current_user: int = Depends(oauth2.get_current_user), limit: int = 100, skip: int = 0, published: bool = True, search: Optional[str] = None, after: Optional[str] = None, db = Depends(get_db)):
+    conn, cursor = db
+
+    # every user sees the same feed, so pages are cached (searches are too varied to be worth caching)
+    # liked_by_me (the only per-user field) and like_count are added after the cache, so likes don't empty it
+    cached = None
+    if not search:
+        cached = await response_cache.lookup("feed", {"limit": limit, "skip": skip, "published": published, "after": after}, [rc.FEED, rc.USERS])
+        if cached.body is not None:
+            payload = rc.decode(cached.body)
+            await feed.overlay_likes(cursor, payload["data"], current_user.id)
+            return FastJSONResponse(payload)
+
+    where = "posts.published = %s"
+    params = [published]
+
+    # newest first search, use /search for results ranked by relevance
     if search:
-        # create a relationship between the post and the author of the post
-        cursor.execute("""SELECT posts.*,
-                    users.id AS author_id,
-                    users.email AS author_email,
-                    users.created_at AS author_created_at,
-                    users.display_name AS author_display_name,
-                    COALESCE(like_counts.like_count, 0) AS like_count, 
-                    COALESCE(comment_counts.comment_count, 0) AS comment_count 
-                    FROM posts 
-                    LEFT JOIN users ON posts.user_id = users.id
-                    LEFT JOIN (
-                            SELECT post_id, 
-                            COUNT(*) AS like_count 
-                            FROM likes 
-                            GROUP BY post_id) AS like_counts ON posts.id = like_counts.post_id 
-                       LEFT JOIN (
-                            SELECT post_id, 
-                            COUNT(*) AS comment_count 
-                            FROM comments 
-                            GROUP BY post_id) AS comment_counts ON posts.id = comment_counts.post_id 
-                    WHERE posts.published = %s AND posts.content ILIKE %s
-                    GROUP BY posts.id, users.id, users.email, users.created_at
-                    ORDER BY posts.created_at DESC
-                    LIMIT %s OFFSET %s""", (published, f"%{search}%", limit, skip,))
-    else:
-        cursor.execute("""SELECT posts.*, 
-                       users.id AS author_id, 
-                       users.email AS author_email, 
-                       users.created_at AS author_created_at, 
-                       users.display_name AS author_display_name, 
-                       COALESCE(like_counts.like_count, 0) AS like_count, 
-                       COALESCE(comment_counts.comment_count, 0) AS comment_count 
-                       FROM posts 
-                       JOIN users ON posts.user_id = users.id 
-                       LEFT JOIN (
-                            SELECT post_id, 
-                            COUNT(*) AS like_count 
-                            FROM likes 
-                            GROUP BY post_id) AS like_counts ON posts.id = like_counts.post_id 
-                       LEFT JOIN (
-                            SELECT post_id, 
-                            COUNT(*) AS comment_count 
-                            FROM comments 
-                            GROUP BY post_id) AS comment_counts ON posts.id = comment_counts.post_id 
-                       WHERE posts.published = %s
-                       ORDER BY posts.id DESC 
-                       LIMIT %s OFFSET %s""", (published, limit, skip,))
-        
-    posts = cursor.fetchall()
-
-    result = []
-    for post in posts:
-        post_dict = dict(post)
-
-        # get the profile picture for the user
-        cursor.execute("""SELECT filename, filepath FROM profile_pictures WHERE user_id = %s""", (str(post_dict["author_id"]),))
-        # print("AUTHOR_ID:", post_dict["author_id"], type(post_dict["author_id"]))
-
-        profile_pic_row = cursor.fetchone()
-
-        if profile_pic_row:
-            profile_pic = {
-                "filename":profile_pic_row["filename"],
-                "url": profile_pic_row["filepath"]
-            }
-        else:
-            profile_pic = None
-
-        # group the author information
-        author_data = {
-            "id": post_dict["author_id"],
-            "email": post_dict["author_email"],
-            "created_at": post_dict["author_created_at"],
-            "display_name": post_dict["author_display_name"],
-            "profile_pic": profile_pic
-        }
-
-        post_dict["author"] = author_data
-
-        # remove the flattened author fields to avoid conflict
-        del post_dict["author_id"]
-        del post_dict["author_email"]
-        del post_dict["author_created_at"]
-        del post_dict["author_display_name"]
-
-        # get all of the media for the post and then attach it to the output
-        cursor.execute("""SELECT filename, filepath FROM files WHERE post_id = %s""", (post_dict["id"],))
-        media_rows = cursor.fetchall()
-        media_list = [{"filename": row["filename"], "url": row["filepath"]} for row in media_rows]
-        # media_list = [{"filename": row[0], "url": row[1]} for row in media_rows]
-        
-        post_dict["media"] = media_list
-
-        result.append(sch.PostOut(**post_dict))
-
-    cursor.close()
-    conn.close()
-
-    return {"data": result}
+        condition, search_params = post_search.search_filter(search)
+        where += f" AND {condition}"
+        params.extend(search_params)
+
+    if after:
+        created_at, last_id = pagination.decode_cursor(after)
+        where += " AND (posts.created_at, posts.id) < (%s, %s)"
+        params.extend([created_at, last_id])
+        skip = None
+
+    result = await feed.fetch_posts(cursor, where, tuple(params), order_by=FEED_ORDER, limit=limit, offset=skip)
+
+    payload = {"data": result, "next_cursor": pagination.next_cursor(result, limit)}
+    if cached:
+        await response_cache.store(cached, rc.encode(payload))
+
+    await feed.overlay_likes(cursor, payload["data"], current_user.id)
+    return FastJSONResponse(payload)
 
 # path operation to get all of the posts for the current user
 @router.get("/get-user/{user_id}")
-def get_posts(user_id: int, current_user: int = Depends(oauth2.get_current_user), limit: int = 100, skip: int = 0, published: bool = True):
-    conn, cursor = get_db()
+async def get_posts(user_id: int, current_user: int = Depends(oauth2.get_current_user), limit: int = 100, skip: int = 0, published: bool = True, after: Optional[str] = None, db = Depends(get_db)):
+    conn, cursor = db
 
     # check that the user exists
-    cursor.execute("""SELECT 1 FROM users WHERE users.id = %s""", (str(user_id),))
-    userExists = cursor.fetchone()
+    await cursor.execute("""SELECT 1 FROM users WHERE users.id = %s""", (str(user_id),))
+    userExists = await cursor.fetchone()
     if not userExists:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
                             detail=f"user with id: {user_id} was not found")
 
-    cursor.execute("""SELECT posts.*, 
-            users.id AS author_id, 
-            users.email AS author_email, 
-            users.created_at AS author_created_at, 
-            users.display_name AS author_display_name, 
-            COALESCE(like_counts.like_count, 0) AS like_count, 
-            COALESCE(comment_counts.comment_count, 0) AS comment_count 
-            FROM posts 
-            JOIN users ON posts.user_id = users.id 
-            LEFT JOIN (
-                SELECT post_id, 
-                COUNT(*) AS like_count 
-                FROM likes 
-                GROUP BY post_id) AS like_counts ON posts.id = like_counts.post_id 
-            LEFT JOIN (
-                SELECT post_id, 
-                COUNT(*) AS comment_count 
-                FROM comments 
-                GROUP BY post_id) AS comment_counts ON posts.id = comment_counts.post_id 
-            WHERE posts.user_id = %s AND posts.published = %s 
-            ORDER BY posts.id DESC 
-            LIMIT %s OFFSET %s""", (str(user_id), published, limit, skip,))
-        
-    posts = cursor.fetchall()
-
-    result = []
-    for post in posts:
-        post_dict = dict(post)
-        
-        # get the profile picture for the user
-        cursor.execute("""SELECT filename, filepath FROM profile_pictures WHERE user_id = %s""", (str(post_dict["author_id"]),))
-        # print("AUTHOR_ID:", post_dict["author_id"], type(post_dict["author_id"]))
-
-        profile_pic_row = cursor.fetchone()
-
-        if profile_pic_row:
-            profile_pic = {
-                "filename":profile_pic_row["filename"],
-                "url": profile_pic_row["filepath"]
-            }
-        else:
-            profile_pic = None
-
-        # group the author information
-        author_data = {
-            "id": post_dict["author_id"],
-            "email": post_dict["author_email"],
-            "created_at": post_dict["author_created_at"],
-            "display_name": post_dict["author_display_name"],
-            "profile_pic": profile_pic
-        }
-
-        post_dict["author"] = author_data
-
-        # remove the flattened author fields to avoid conflict
-        del post_dict["author_id"]
-        del post_dict["author_email"]
-        del post_dict["author_created_at"]
-        del post_dict["author_display_name"]
-
-        # get all of the media for the post and then attach it to the output
-        cursor.execute("""SELECT filename, filepath FROM files WHERE post_id = %s""", (post_dict["id"],))
-        media_rows = cursor.fetchall()
-        media_list = [{"filename": row["filename"], "url": row["filepath"]} for row in media_rows]
-        # media_list = [{"filename": row[0], "url": row[1]} for row in media_rows]
-        
-        post_dict["media"] = media_list
-
-        result.append(sch.PostOut(**post_dict))
-
-    cursor.close()
-    conn.close()
-
-    return {"data": result}
+    where = "posts.user_id = %s AND posts.published = %s"
+    params = [user_id, published]
 
-# Get a single post based on the passed id and return the username for the creator of the post
-@router.get("/{id}")
-def get_post(id: int, current_user: int = Depends(oauth2.get_current_user)):
-    conn, cursor = get_db()
-
-    # create a relationship between the post and the author of the post
-    cursor.execute("""SELECT posts.*, 
-            users.id AS author_id, 
-            users.email AS author_email, 
-            users.created_at AS author_created_at, 
-            users.display_name AS author_display_name, 
-            COALESCE(like_counts.like_count, 0) AS like_count, 
-            COALESCE(comment_counts.comment_count, 0) AS comment_count 
-            FROM posts 
-            JOIN users ON posts.user_id = users.id 
-            LEFT JOIN (
-                SELECT post_id, 
-                COUNT(*) AS like_count 
-                FROM likes 
-                GROUP BY post_id) AS like_counts ON posts.id = like_counts.post_id 
-            LEFT JOIN (
-                SELECT post_id, 
-                COUNT(*) AS comment_count 
-                FROM comments 
-                GROUP BY post_id) AS comment_counts ON posts.id = comment_counts.post_id 
-            WHERE posts.id = %s""", (str(id),))
-        
-    post = cursor.fetchone()
-    if not post:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
-                            detail=f"post with id: {id} was not found")
-    
-    post_dict = dict(post)
+    if after:
+        created_at, last_id = pagination.decode_cursor(after)
+        where += " AND (posts.created_at, posts.id) < (%s, %s)"
+        params.extend([created_at, last_id])
+        skip = None
 
-    # get the profile picture for the user
-    cursor.execute("""SELECT filename, filepath FROM profile_pictures WHERE user_id = %s""", (str(post_dict["author_id"]),))
-    # print("AUTHOR_ID:", post_dict["author_id"], type(post_dict["author_id"]))
+    result = await feed.fetch_posts(cursor, where, tuple(params), order_by=FEED_ORDER, limit=limit, offset=skip, viewer_id=current_user.id)
 
-    profile_pic_row = cursor.fetchone()
+    return FastJSONResponse({"data": result, "next_cursor": pagination.next_cursor(result, limit)})
 
-    if profile_pic_row:
-        profile_pic = {
-            "filename":profile_pic_row["filename"],
-            "url": profile_pic_row["filepath"]
-        }
-    else:
-        profile_pic = None
-
-    # group the author information
-    author_data = {
-        "id": post_dict["author_id"],
-        "email": post_dict["author_email"],
-        "created_at": post_dict["author_created_at"],
-        "display_name": post_dict["author_display_name"],
-        "profile_pic": profile_pic
-    }
-
-    post_dict["author"] = author_data
-
-    # remove the flattened author fields to avoid conflict
-    del post_dict["author_id"]
-    del post_dict["author_email"]
-    del post_dict["author_created_at"]
-    del post_dict["author_display_name"]
-
-
-    # get all of the media for the post and then attach it to the output
-    cursor.execute("""SELECT filename, filepath FROM files WHERE post_id = %s""", (str(id),))
-    media_rows = cursor.fetchall()
-    media_list = [{"filename": row["filename"], "url": row["filepath"]} for row in media_rows]
-    # media_list = [{"filename": row[0], "url": row[1]} for row in media_rows]
-    
-    post_dict["media"] = media_list
+# full text search over post content, best matches first
+# every word has to match and the last one can be partial, so it also works for search-as-you-type
+@router.get("/search")
+async def search_posts(q: str, current_user: int = Depends(oauth2.get_current_user), limit: int = 20, published: bool = True, after: Optional[str] = None, db = Depends(get_db)):
+    conn, cursor = db
+
+    result, next_cursor = await post_search.search_posts(cursor, q, published=published, limit=limit, after=after, viewer_id=current_user.id)
+
+    return FastJSONResponse({"data": result, "next_cursor": next_cursor})
 
-    print(post_dict)
+# the current user's home timeline: posts of the users they follow and their own, newest first
+# read from the precomputed timeline (see app/timelines.py), pass next_cursor as "after" for the next page
+@router.get("/timeline")
+async def get_timeline(current_user: int = Depends(oauth2.get_current_user), limit: int = 20, after: Optional[str] = None, db = Depends(get_db)):
+    conn, cursor = db
 
-    cursor.close()
-    conn.close()
+    where, params = timelines.timeline_filter(current_user.id, limit, after)
+    result = await feed.fetch_posts(cursor, where, params, order_by=FEED_ORDER, limit=limit, viewer_id=current_user.id)
 
-    return {"data": sch.PostOut(**post_dict)}
+    return FastJSONResponse({"data": result, "next_cursor": pagination.next_cursor(result, limit)})
+
+# Get a single post based on the passed id and return the username for the creator of the post
+@router.get("/{id}")
+async def get_post(id: int, current_user: int = Depends(oauth2.get_current_user), db = Depends(get_db)):
+    conn, cursor = db
+
+    cached = await response_cache.lookup("post", {"id": id}, [rc.post_tag(id), rc.USERS])
+    if cached.body is not None:
+        payload = rc.decode(cached.body)
+    else:
+        result = await feed.fetch_posts(cursor, "posts.id = %s", (id,))
+        if not result:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
+                                detail=f"post with id: {id} was not found")
+
+        payload = {"data": result[0]}
+        await response_cache.store(cached, rc.encode(payload))
+
+    await feed.overlay_likes(cursor, [payload["data"]], current_user.id)
+    return FastJSONResponse(payload)
 
 # Create a brand new post with a dependency on having a valid log in token
 @router.post("/", status_code=status.HTTP_201_CREATED)
-def create_posts(post: sch.PostCreate, current_user: int = Depends(oauth2.get_current_user)):
-    conn, cursor = get_db()
-
-    cursor.execute("""INSERT INTO posts (content, published, user_id) VALUES (%s, %s, %s) RETURNING *""", (post.content, post.published, current_user.id))
-    new_post = cursor.fetchone()
-    conn.commit()   # changes made to the database must be committed deliberately
-    
-    cursor.close()
-    conn.close()
-    print("NEW POST DATA: ", new_post)
+async def create_posts(post: sch.PostCreate, current_user: int = Depends(oauth2.get_current_user), db = Depends(get_db)):
+    conn, cursor = db
+
+    # a published post is queued for the fan-out to its author's followers in the same statement (see app/timelines.py)
+    await cursor.execute("""WITH new_post AS (
+                                INSERT INTO posts (content, published, user_id) VALUES (%s, %s, %s) RETURNING *),
+                            queued AS (
+                                INSERT INTO timeline_fanout (post_id) SELECT id FROM new_post WHERE published)
+                            SELECT * FROM new_post""", (post.content, post.published, current_user.id))
+    new_post = await cursor.fetchone()
+    await conn.commit()   # changes made to the database must be committed deliberately
+    timelines.notify()
+    await rc.post_changed(new_post["id"])
     return {"data": sch.PostCreateOut(**new_post)}
 
 # Delete a post based on the passed id
 @router.delete("/{id}")
-def delete_post(id:int, current_user: int = Depends(oauth2.get_current_user)):
-    conn, cursor = get_db()
-
-    cursor.execute("""SELECT user_id FROM posts WHERE id = %s""", (str(id),))
-    user_id = cursor.fetchone()
-    if not user_id:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
-                            detail=f"post with id: {id} was not found")
+async def delete_post(id:int, current_user: int = Depends(oauth2.get_current_user), db = Depends(get_db)):
+    conn, cursor = db
 
+    # queue the post's media (and its resized variants) for deletion from s3, the worker removes them after the commit
+    # (if the delete below fails the request's transaction is rolled back, queued keys included)
+    await outbox.enqueue_from(cursor, """SELECT filename FROM files WHERE post_id = %s
+                              UNION ALL
+                              SELECT variant->>'key' FROM files, jsonb_array_elements(files.variants) AS variant
+                              WHERE files.post_id = %s""", (id, id))
 
-    if user_id["user_id"] != current_user.id:
-        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail=f"Not authorized to perform requested action.")
-    
-    #  get associated media prior to deleting the post
-    cursor.execute("""SELECT filename FROM files WHERE post_id = %s""", (str(id),))
-    media_files = cursor.fetchall()
-
-    #  delete the post
-    cursor.execute("""DELETE FROM posts WHERE id = %s RETURNING *""", (str(id),))
-    deleted = cursor.fetchone()
-    if not deleted:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
-                            detail=f"post with id: {id} was not found")
-    conn.commit()   # deletion changes the database so it needs to be committed
+    #  delete the post, only if it is the user's
+    await ownership.delete_owned(cursor, "posts", id, current_user.id, "post", returning="id")
+    await conn.commit()   # deletion changes the database so it needs to be committed
+    await rc.comments_changed(id)
 
-    # remove associated media from the disk
-    print("media_files from DB:", media_files)
-
-    for media in media_files:
-        # filename = media["filename"]
-        filename = str(media["filename"]) if media["filename"] is not None else None
-
-        if filename:
-            try:
-                utils.delete_s3_object(filename)
-            except Exception as e:
-                print(f"posts: Error deleting S3 file {filename}: {e}")
-    
-    cursor.close()
-    conn.close()
-    
     return Response(status_code=status.HTTP_204_NO_CONTENT)
 
 # Update a post based on id
 @router.put("/{id}")
-def update_post(id: int, post: sch.PostCreate, current_user: int = Depends(oauth2.get_current_user)):
-    conn, cursor = get_db()
-
-    cursor.execute("""SELECT user_id FROM posts WHERE id = %s""", (str(id),))
-    user_id = cursor.fetchone()
-    if not user_id:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
-                            detail=f"post with id: {id} was not found")
-
-    if user_id["user_id"] != current_user.id:
-        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, 
-                            detail=f"Not authorized to perform requested action.")
-   
-    cursor.execute("""UPDATE posts SET content = %s, published = %s WHERE id = %s RETURNING *""", (post.content, post.published, str(id),))
-    updated = cursor.fetchone()
-    if not updated:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
-                            detail=f"post with id: {id} was not found")
-    conn.commit()
-    
-    cursor.close()
-    conn.close()
+async def update_post(id: int, post: sch.PostCreate, current_user: int = Depends(oauth2.get_current_user), db = Depends(get_db)):
+    conn, cursor = db
+
+    # only the author can edit the post - the subquery reads the row as it was before the update, so a post that was
+    # published or taken down can be added to (or removed from) the timelines
+    updated = await ownership.update_owned(cursor, "posts", id, current_user.id, "content = %s, published = %s",
+                                           (post.content, post.published), "post",
+                                           returning="*, (SELECT previous.published FROM posts AS previous WHERE previous.id = posts.id) AS was_published")
+    publish_changed = updated["published"] != updated["was_published"]
+    if publish_changed:
+        await timelines.publish_changed(cursor, id, updated["published"])
+    await conn.commit()
+    if publish_changed:
+        timelines.notify()
+    await rc.post_changed(id)
     
     return {"data": sch.PostCreate(**updated)}
\ No newline at end of file
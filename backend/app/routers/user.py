@@ -1,15 +1,19 @@
 # File: user.py
 # Path operations concerning users
 # Author: Caitlin Coulombe
-# Last Updated: 2025-06-25
+# Last Updated: 2025-08-10
 
 import os
 from fastapi import Body, Depends, FastAPI, Response, status, HTTPException, APIRouter
 from app import schema as sch
-from app import utils
 from app import oauth2
-from app.database import get_db
-import psycopg2
+from app import outbox
+from app import response_cache as rc
+from app.database import get_db, acquire_db, release_db
+from app.passwords import password_pool
+from app.responses import FastJSONResponse
+from app.feed import media_dict
+import psycopg
 
 router = APIRouter(
     tags=['Users']
@@ -17,119 +21,112 @@ router = APIRouter(
 
 # Create a new user
 @router.post("/", status_code=status.HTTP_201_CREATED)
-def create_user(user: sch.UserCreate):
-    conn, cursor = get_db()
+async def create_user(user: sch.UserCreate):
+    # Hash the password - user.password (before borrowing a connection, so one isn't held while bcrypt runs, and outside
+    # the try so a 429 from a busy hashing pool isn't turned into a 500)
+    user.password = await password_pool.hash(user.password)
+
+    conn, cursor = await acquire_db()
     try:
-        # Hash the password - user.password
-        hashed_password = utils.hash(user.password)
-        user.password = hashed_password
 
         # Adding the pydantic model of the user to the table
-        cursor.execute("""INSERT INTO users (email, password, display_name) VALUES (%s, %s, %s) RETURNING *""", (user.email, user.password, user.display_name))
-        new_user = cursor.fetchone()
-        conn.commit()  
-
-        cursor.close()
-        conn.close()
+        await cursor.execute("""INSERT INTO users (email, password, display_name) VALUES (%s, %s, %s) RETURNING *""", (user.email, user.password, user.display_name))
+        new_user = await cursor.fetchone()
+        await conn.commit()  
         
         return {"data": sch.UserOut(**new_user)}
-    except psycopg2.errors.UniqueViolation:
-        conn.rollback()
+    except psycopg.errors.UniqueViolation:
+        await conn.rollback()
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Email already registered")
     except Exception as e:
-        conn.rollback()
+        await conn.rollback()
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail = f"Unexpected error: {str(e)}")
+    finally:
+        await release_db(conn, cursor)
     
 
 # Find out if there is a user with that email
 @router.get("/get-user/{email}")
-def get_user(email: str):
-    conn, cursor = get_db()
-    cursor.execute("""SELECT 1 FROM users WHERE email = %s""", (email,))
-    user = cursor.fetchone()
+async def get_user(email: str, db = Depends(get_db)):
+    conn, cursor = db
+    await cursor.execute("""SELECT 1 FROM users WHERE email = %s""", (email,))
+    user = await cursor.fetchone()
     if not user:
         return 0
-
-    cursor.close()
-    conn.close()
     
     return 1
 
 # Retreive the information from a specific user based on email
 @router.get("/{id}")
-def get_user(id: int):
-    conn, cursor = get_db()
-    cursor.execute("""SELECT users.*, 
-                   profile_pictures.filename AS filename,
-                   profile_pictures.filepath AS url
+async def get_user(id: int, db = Depends(get_db)):
+    conn, cursor = db
+    await cursor.execute("""SELECT users.id, users.email, users.created_at, users.display_name,
+                   users.follower_count, users.following_count,
+                   profile_pictures.filename,
+                   profile_pictures.filepath,
+                   profile_pictures.variants
                    FROM users 
                    LEFT JOIN profile_pictures ON profile_pictures.user_id = users.id
                    WHERE users.id = %s""", (str(id),))
-    user = cursor.fetchone()
+    user = await cursor.fetchone()
     if not user:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"User with id: {id} does not exist")
-    
-    user_dict = dict(user)
-
-    profile_pic = {
-        "filename": user_dict["filename"],
-        "url": user_dict["url"]
-    }
-
-    user_dict["profile_pic"] = profile_pic
 
-    del user_dict["filename"]
-    del user_dict["url"]
-    
-    cursor.close()
-    conn.close()
-    
-    return {"data": sch.UserOut(**user_dict)}
+    # the fields of sch.UserProfile, built from the row without another validation pass
+    return FastJSONResponse({"data": {
+        "id": user["id"],
+        "email": user["email"],
+        "created_at": user["created_at"],
+        "display_name": user["display_name"],
+        "profile_pic": media_dict(user),
+        "follower_count": user["follower_count"],
+        "following_count": user["following_count"],
+    }})
 
 # update a user's display name based on id
 @router.put("/update_name/{id}")
-def update_post(id: int, user: sch.UserUpdate, current_user: int = Depends(oauth2.get_current_user)):
-    conn, cursor = get_db()
+async def update_post(id: int, user: sch.UserUpdate, current_user: int = Depends(oauth2.get_current_user), db = Depends(get_db)):
+    conn, cursor = db
 
-    cursor.execute("""SELECT 1 FROM users WHERE id = %s""", (str(id),))
-    user_id = cursor.fetchone()
-    if not user_id:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
-                            detail=f"user with id: {id} was not found")
-    
+    # users can only rename themselves, which needs no query to check
     if id != current_user.id:
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, 
                             detail=f"Not authorized to perform requested action.")
     
-    cursor.execute("""UPDATE users SET display_name = %s WHERE id = %s RETURNING *""", (user.display_name, str(id),))
-    updated = cursor.fetchone()
+    await cursor.execute("""UPDATE users SET display_name = %s WHERE id = %s RETURNING *""", (user.display_name, str(id),))
+    updated = await cursor.fetchone()
     if not updated:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, 
-                            detail=f"user with id: {id} was not udpated")
+                            detail=f"user with id: {id} was not found")
     
-    conn.commit()
-
-    cursor.close()
-    conn.close()
+    await conn.commit()
+    oauth2.invalidate_user(id)
+    await rc.users_changed()
 
     return {"user": sch.UserOut(**updated)}
     
 
 # verify just the user's password (used to confirm account deletion)
+# like login, the connection is only borrowed for the hash lookup and is back in the pool before bcrypt runs
 @router.post("/verify-password/{id}")
-def verify_password(id: int, attempt: sch.PasswordAttempt, current_user: int = Depends(oauth2.get_current_user)):
-    conn, cursor = get_db()
-
+async def verify_password(id: int, attempt: sch.PasswordAttempt, current_user: int = Depends(oauth2.get_current_user)):
     if id != current_user.id:
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, 
                             detail=f"Not authorized to perform requested action.")
     
-    cursor.execute("""SELECT password FROM users WHERE id = %s""", (str(id),))
-    password = cursor.fetchone()
+    conn, cursor = await acquire_db()
+    try:
+        await cursor.execute("""SELECT password FROM users WHERE id = %s""", (str(id),))
+        password = await cursor.fetchone()
+    finally:
+        await release_db(conn, cursor)
+
+    if not password:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"User with id: {id} does not exist")
     stored_password = password["password"]
 
     # verify that the attempted password is correct
-    if not utils.verify(attempt.password, stored_password):
+    if not await password_pool.verify(attempt.password, stored_password):
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN,
                             detail=f"Invalid password attempt")
     
@@ -137,55 +134,38 @@ def verify_password(id: int, attempt: sch.PasswordAttempt, current_user: int = D
 
 # delete a users account
 @router.delete("/{id}")
-def delete_user(id: int, current_user: int = Depends(oauth2.get_current_user)):
-    conn, cursor = get_db()
+async def delete_user(id: int, current_user: int = Depends(oauth2.get_current_user), db = Depends(get_db)):
+    conn, cursor = db
 
-    cursor.execute("""SELECT 1 FROM users WHERE id = %s""", (str(id),))
-    user_exists = cursor.fetchone()
-    if not user_exists:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
-                    detail=f"user with id: {id} was not found")
+    # users can only delete their own account (a missing user is reported by the delete below)
+    if id != current_user.id:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, 
+                            detail=f"Not authorized to perform requested action.")
     
-    # get associated media prior to deleting the user
-    cursor.execute("""SELECT filename FROM profile_pictures WHERE user_id = %s""", (str(id),))
-    profile_pic = cursor.fetchone()
-
-    # get media associated with the users posts
-    cursor.execute("""SELECT filename FROM files 
-                   JOIN posts ON files.post_id = posts.id
-                   JOIN users ON posts.user_id = users.id
-                   WHERE users.id = %s""", (str(id),))
-    media_paths = cursor.fetchall()
-
-    # delete the user
-    cursor.execute("""DELETE FROM users WHERE id = %s RETURNING *""", (str(id),))
-    deleted = cursor.fetchone()
+    # queue the profile picture, the media of the user's posts and the resized variants of both for deletion from s3
+    await outbox.enqueue_from(cursor, """SELECT filename FROM profile_pictures WHERE user_id = %s
+                              UNION ALL
+                              SELECT variant->>'key' FROM profile_pictures,
+                              jsonb_array_elements(profile_pictures.variants) AS variant
+                              WHERE profile_pictures.user_id = %s
+                              UNION ALL
+                              SELECT filename FROM files
+                              JOIN posts ON files.post_id = posts.id
+                              WHERE posts.user_id = %s
+                              UNION ALL
+                              SELECT variant->>'key' FROM files
+                              JOIN posts ON files.post_id = posts.id,
+                              jsonb_array_elements(files.variants) AS variant
+                              WHERE posts.user_id = %s""", (id, id, id, id))
+
+    # delete the user (the queued keys are rolled back with the request's transaction if this fails)
+    await cursor.execute("""DELETE FROM users WHERE id = %s RETURNING id""", (str(id),))
+    deleted = await cursor.fetchone()
     if not deleted:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
                             detail=f"user with id: {id} was not found")
-    conn.commit()
-
-    # remove profile picture
-    if profile_pic:
-        pp_filename = str(profile_pic["filename"]) if profile_pic["filename"] is not None else None
-
-        if pp_filename:
-            try:
-                utils.delete_s3_object(pp_filename)
-            except Exception as e:
-                print(f"Error deleting S3 file {pp_filename}: {e}")
-
-    # remove associated media
-    if media_paths:
-        for media in media_paths:
-            m_filename = str(media["filename"]) if media["filename"] is not None else None
-            if m_filename:
-                try:
-                    utils.delete_s3_object(m_filename)
-                except Exception as e:
-                    print(f"Error deleting S3 file {m_filename}: {e}")
-
-    cursor.close()
-    conn.close()
+    await conn.commit()
+    oauth2.invalidate_user(id)
+    await rc.users_changed()
 
     return Response(status_code=status.HTTP_204_NO_CONTENT)
\ No newline at end of file
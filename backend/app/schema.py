@@ -1,7 +1,7 @@
 # File: schema.py
 # Contains schema used for ensuring database is formatted as intended
 # Author: Caitlin Coulombe
-# Last Updated: 2025-06-20
+# Last Updated: 2025-08-09
 
 from datetime import datetime
 from enum import Enum
@@ -9,9 +9,16 @@ from pydantic import BaseModel, EmailStr, conint
 from typing import List, Optional
 
 # ----------------------- MEDIA SCHEMA -----------------------
+# a resized copy of an uploaded image (used to build the img srcset)
+class MediaVariant(BaseModel):
+    url: str
+    width: int
+    format: str
+
 class MediaOut(BaseModel):
     filename: Optional[str] = None
     url: Optional[str] = None
+    srcset: List[MediaVariant] = []
 
 # ----------------------- USER SCHEMA -----------------------
 # schema used to create user data
@@ -28,6 +35,11 @@ class UserOut(BaseModel):
     display_name: str
     profile_pic: Optional[MediaOut] = None
 
+# a user's profile page, with the size of their follow graph
+class UserProfile(UserOut):
+    follower_count: int
+    following_count: int
+
 # schema used to format the required information for a login attempt
 class UserLogin(BaseModel):
     email: EmailStr
@@ -67,6 +79,7 @@ class PostOut(Post):
     like_count: Optional[int] = 0
     comment_count: Optional[int] = 0
     media: List[MediaOut]
+    liked_by_me: bool = False
 
 # ----------------------- TOKEN SCHEMA -----------------------
 # schema used to verify token format
@@ -74,10 +87,19 @@ class Token(BaseModel):
     access_token: str
     token_type: str
     id: int
+    refresh_token: Optional[str] = None
+
+# schema for exchanging (or revoking) a refresh token
+class RefreshRequest(BaseModel):
+    refresh_token: str
 
-# schema used to format the incoming token's data
+# schema used to format the incoming token's data (the profile fields are only present when the user's claims are embedded)
 class TokenData(BaseModel):
     id: Optional[int] = None
+    sid: Optional[str] = None
+    email: Optional[str] = None
+    display_name: Optional[str] = None
+    created_at: Optional[datetime] = None
 
 # ----------------------- LIKE SCHEMA -----------------------
 class VoteDirection(int, Enum):
@@ -88,6 +110,15 @@ class Like(BaseModel):
     post_id: int
     dir: VoteDirection
 
+# ----------------------- FOLLOWS SCHEMA -----------------------
+class Follow(BaseModel):
+    user_id: int
+    dir: VoteDirection
+
+# a user in a followers/following list
+class FollowOut(UserOut):
+    followed_at: datetime
+
 # ----------------------- COMMENTS SCHEMA -----------------------
 class Comment(BaseModel):
     content: str
@@ -105,4 +136,10 @@ class CreateCommentOut(Comment):
     created_at: datetime
 
 class CommentOut(CreateCommentOut):
-    author: UserOut
\ No newline at end of file
+    author: UserOut
+
+# a top level comment with its first replies, replies_cursor is set when there are more replies to load
+class CommentThreadOut(CommentOut):
+    reply_count: int = 0
+    replies: List[CommentOut] = []
+    replies_cursor: Optional[str] = None
\ No newline at end of file
@@ -0,0 +1,56 @@
+# File: search.py
+# Full text search over post content using the posts.search_vector column (see alembic/versions/0004_post_search.py)
+# Author: Caitlin Coulombe
+# Last Updated: 2025-07-26
+
+import re
+from typing import Optional
+from app import feed
+from app import pagination
+
+# every word of the search has to match, and the last word of a search can be a prefix (e.g. "sun flo" finds "sunflowers")
+# only word characters are kept so user input can never inject tsquery operators
+def to_tsquery_text(search: str) -> Optional[str]:
+    words = re.findall(r"\w+", search.lower())
+    if not words:
+        return None
+    return " & ".join(f"{word}:*" for word in words)
+
+# condition (and params) for filtering posts by a search, for endpoints that keep their own ordering
+def search_filter(search: str):
+    query = to_tsquery_text(search)
+    if query is None:
+        return "FALSE", ()
+    return "posts.search_vector @@ to_tsquery('english', %s)", (query,)
+
+
+# posts matching the search, best match first (newest first for equal ranks)
+# returns the assembled page and the cursor for the next one
+async def search_posts(cursor, search: str, published: bool = True, limit: int = 20, after: Optional[str] = None, viewer_id: int = None):
+    query = to_tsquery_text(search)
+    if query is None:
+        return [], None
+
+    rank = "ts_rank(posts.search_vector, to_tsquery('english', %s))"
+    where = "posts.published = %s AND posts.search_vector @@ to_tsquery('english', %s)"
+    params = [query, published, query]
+
+    if after:
+        last_rank, created_at, last_id = pagination.decode_ranked_cursor(after)
+        where += f" AND ({rank}, posts.created_at, posts.id) < (%s, %s, %s)"
+        params.extend([query, last_rank, created_at, last_id])
+
+    await cursor.execute(f"""SELECT {feed.POST_COLUMNS}, {rank} AS rank
+                         FROM posts
+                         JOIN users ON posts.user_id = users.id
+                         WHERE {where}
+                         ORDER BY rank DESC, posts.created_at DESC, posts.id DESC
+                         LIMIT %s""", (*params, limit))
+    rows = await cursor.fetchall()
+
+    next_cursor = None
+    if len(rows) == limit:
+        last = rows[-1]
+        next_cursor = pagination.encode_ranked_cursor(last["rank"], last["created_at"], last["id"])
+
+    return await feed.assemble_posts(cursor, rows, viewer_id), next_cursor
@@ -0,0 +1,181 @@
+# File: slow_queries.py
+# Slow query log: every statement taking longer than slow_query_threshold_ms is appended to a rotating local log (one
+# JSON object per line) with its normalized text, the shape of its parameters (types only, never the values), its
+# duration and the route that ran it. A sample of the slow ones is re-run with EXPLAIN (ANALYZE, BUFFERS) on a separate
+# read-only connection and logged with their plan, so plan regressions (a new seq scan, a sort spilling to disk) show
+# up in the log before users notice them. Statements are reported by TimedCursor (app/database.py).
+# Author: Caitlin Coulombe
+# Last Updated: 2025-08-08
+
+import asyncio
+import json
+import logging
+import os
+import random
+import re
+import time
+from datetime import datetime, timezone
+from logging.handlers import RotatingFileHandler
+import psycopg
+from app.config import settings
+from app import metrics
+
+# the explain connection gives up on a plan after this long
+EXPLAIN_TIMEOUT_MS = 10000
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r"(?<![\w$])\d+(?:\.\d+)?\b")
+_WHITESPACE = re.compile(r"\s+")
+# statements that change data or take row locks are never re-run by the explain connection
+_WRITES = re.compile(r"\b(INSERT|UPDATE|DELETE|MERGE|TRUNCATE|COPY|CREATE|ALTER|DROP|LOCK|CALL|NEXTVAL|SETVAL|FOR (UPDATE|SHARE|NO KEY UPDATE|KEY SHARE))\b", re.I)
+
+
+# one line per statement: literals replaced with ?, whitespace collapsed - the same query always normalizes the same way
+def normalize(query: str) -> str:
+    query = _STRING.sub("?", query)
+    query = _NUMBER.sub("?", query)
+    return _WHITESPACE.sub(" ", query).strip()
+
+# the types of the parameters, e.g. ["int", "str", "list[20]"]
+def param_shape(params):
+    def shape(value):
+        if isinstance(value, (list, tuple)):
+            return f"list[{len(value)}]"
+        return type(value).__name__
+
+    if params is None:
+        return None
+    if isinstance(params, dict):
+        return {key: shape(value) for key, value in params.items()}
+    return [shape(value) for value in params]
+
+def is_read_only(query: str) -> bool:
+    return query.lstrip("( ").upper().startswith(("SELECT", "WITH")) and not _WRITES.search(query)
+
+
+class SlowQueryLog:
+    def __init__(self, threshold_ms: float, path: str, max_bytes: int, backups: int,
+                 explain_sample_rate: float = 0.0, explain_interval: float = 300.0):
+        self.threshold = threshold_ms / 1000 if threshold_ms > 0 else None
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.explain_sample_rate = explain_sample_rate
+        self.explain_interval = explain_interval
+
+        self._logger = None
+        self._connect_kwargs = None       # set by start(), there is no explain connection without it
+        self._conn = None
+        self._capturing = False           # one EXPLAIN at a time, slow statements arriving meanwhile are logged without a plan
+        self._explained = {}              # normalized statement -> time.monotonic() of its last EXPLAIN
+        self._tasks = set()
+        self.logged = 0
+        self.explained = 0
+        self.explain_failures = 0
+
+    def is_slow(self, seconds: float) -> bool:
+        return self.threshold is not None and seconds >= self.threshold
+
+    # called by the cursor after a statement took longer than the threshold (failed is set when it raised)
+    def record(self, conn, query, params, seconds: float, failed: bool = False):
+        if isinstance(query, bytes):
+            query = query.decode()
+        elif not isinstance(query, str):
+            query = query.as_string(conn)     # psycopg.sql.Composed
+
+        normalized = normalize(query)
+        entry = {
+            "time": datetime.now(timezone.utc).isoformat(),
+            "duration_ms": round(seconds * 1000, 2),
+            "route": metrics.current_route() or "background",
+            "query": normalized,
+            "params": param_shape(params),
+        }
+        if failed:
+            entry["failed"] = True
+
+        if self._should_explain(normalized, query):
+            self._capturing = True
+            self._explained[normalized] = time.monotonic()
+            task = asyncio.create_task(self._explain_and_write(entry, query, params, analyze=not failed))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+        else:
+            self._write(entry)
+
+    def _should_explain(self, normalized: str, query: str) -> bool:
+        if self._connect_kwargs is None or self._capturing or random.random() >= self.explain_sample_rate:
+            return False
+        last = self._explained.get(normalized)
+        if last is not None and time.monotonic() - last < self.explain_interval:
+            return False
+        return is_read_only(query)
+
+    # a failed statement (a timeout, a cancel) would fail again under ANALYZE, so it only gets the estimated plan
+    async def _explain_and_write(self, entry: dict, query: str, params, analyze: bool):
+        options = "ANALYZE, BUFFERS, FORMAT JSON" if analyze else "FORMAT JSON"
+        try:
+            if self._conn is None or self._conn.closed:
+                self._conn = await psycopg.AsyncConnection.connect(**self._connect_kwargs)
+            async with self._conn.cursor() as cursor:
+                await cursor.execute(f"EXPLAIN ({options}) {query}", params)
+                entry["plan"] = (await cursor.fetchone())[0][0]
+            self.explained += 1
+        except Exception as e:
+            self.explain_failures += 1
+            entry["explain_error"] = str(e).strip()
+            print(f"slow_queries: Failed to explain a slow statement: {e}")
+        finally:
+            self._capturing = False
+        self._write(entry)
+
+    def _write(self, entry: dict):
+        if self._logger is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            handler = RotatingFileHandler(self.path, maxBytes=self.max_bytes, backupCount=self.backups, encoding="utf-8")
+            handler.setFormatter(logging.Formatter("%(message)s"))
+            self._logger = logging.getLogger("slow_queries")
+            self._logger.setLevel(logging.INFO)
+            self._logger.propagate = False
+            self._logger.addHandler(handler)
+        self._logger.info(json.dumps(entry, default=str))
+        self.logged += 1
+
+    # enable the EXPLAIN capture with the database settings of the pool (its cursor factory is left out, so the
+    # EXPLAINs are not timed and reported themselves)
+    def start(self, connect_kwargs: dict):
+        if self.threshold is None or self.explain_sample_rate <= 0:
+            return
+        kwargs = {key: value for key, value in connect_kwargs.items() if key != "cursor_factory"}
+        kwargs["autocommit"] = True
+        kwargs["options"] = f"-c default_transaction_read_only=on -c statement_timeout={EXPLAIN_TIMEOUT_MS}"
+        self._connect_kwargs = kwargs
+
+    async def stop(self):
+        self._connect_kwargs = None
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+        if self._conn is not None:
+            await self._conn.close()
+            self._conn = None
+
+    def stats(self) -> dict:
+        return {
+            "threshold_ms": self.threshold * 1000 if self.threshold is not None else None,
+            "path": self.path,
+            "logged": self.logged,
+            "explained": self.explained,
+            "explain_failures": self.explain_failures,
+        }
+
+
+slow_query_log = SlowQueryLog(
+    threshold_ms=settings.slow_query_threshold_ms,
+    path=settings.slow_query_log_path,
+    max_bytes=settings.slow_query_log_max_bytes,
+    backups=settings.slow_query_log_backups,
+    explain_sample_rate=settings.slow_query_explain_sample_rate,
+    explain_interval=settings.slow_query_explain_interval,
+)
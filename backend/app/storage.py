@@ -0,0 +1,198 @@
+# File: storage.py
+# Streams uploaded files from the request body straight into S3, without staging them on local disk or reading a
+# whole file into memory
+# iter_form_files parses a multipart/form-data body as it arrives, and each file's data is fed into an S3Upload, which
+# sends it as a multipart upload whose parts go out concurrently while the next part is still being read from the
+# request. Small files are sent with a single put_object.
+# The s3 client is passed in so the pipeline can be pointed at a local stand-in (see bench/upload_check.py)
+# Author: Caitlin Coulombe
+# Last Updated: 2025-08-10
+
+import asyncio
+from fastapi import Request, status, HTTPException
+from fastapi.concurrency import run_in_threadpool
+from python_multipart.multipart import MultipartParser, parse_options_header
+from python_multipart.exceptions import MultipartParseError
+from app.config import settings
+
+# S3 rejects multipart parts smaller than 5 MiB (except the last one)
+MIN_PART_SIZE = 5 * 1024 * 1024
+
+
+# one object being uploaded to bucket/key, written chunk by chunk as the request body arrives
+# chunks are buffered up to part_size and each full part is sent as a multipart upload part, with at most
+# max_concurrency parts in flight - write waits for a free slot, so reading the request slows down to the pace of s3
+# and memory stays at about (max_concurrency + 2) parts: those in flight, the buffer and the part being cut from it
+# an object that never fills a part is sent with a single put_object on close
+class S3Upload:
+    def __init__(self, client, bucket: str, key: str, content_type: str = None, part_size: int = None, max_concurrency: int = None):
+        self.client = client
+        self.bucket = bucket
+        self.key = key
+        self.part_size = max(part_size or settings.s3_upload_part_size, MIN_PART_SIZE)
+        self.extra = {"ContentType": content_type} if content_type else {}
+        self.size = 0
+        self._buffer = bytearray()
+        self._upload_id = None
+        self._tasks = []
+        self._slots = asyncio.Semaphore(max(max_concurrency or settings.s3_upload_max_concurrency, 1))
+
+    async def write(self, data: bytes):
+        self._buffer += data
+        self.size += len(data)
+        while len(self._buffer) >= self.part_size:
+            with memoryview(self._buffer) as view:
+                part = bytes(view[:self.part_size])
+            del self._buffer[:self.part_size]
+            await self._send_part(part)
+
+    # finish the object, aborting the multipart upload if that fails
+    async def close(self):
+        try:
+            if self._upload_id is None:
+                await run_in_threadpool(self.client.put_object, Bucket=self.bucket, Key=self.key, Body=bytes(self._buffer), **self.extra)
+                return
+
+            if self._buffer:
+                await self._send_part(bytes(self._buffer))
+            parts = await asyncio.gather(*self._tasks)
+            await run_in_threadpool(self.client.complete_multipart_upload, Bucket=self.bucket, Key=self.key,
+                                    UploadId=self._upload_id, MultipartUpload={"Parts": parts})
+        except BaseException:
+            await self.abort()
+            raise
+        finally:
+            self._buffer = bytearray()
+
+    # stop the upload and drop the parts sent so far, so no orphaned parts are left behind in the bucket
+    async def abort(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._buffer = bytearray()
+
+        if self._upload_id is not None:
+            upload_id, self._upload_id = self._upload_id, None
+            try:
+                await run_in_threadpool(self.client.abort_multipart_upload, Bucket=self.bucket, Key=self.key, UploadId=upload_id)
+            except Exception as e:
+                print(f"storage: Failed to abort multipart upload {upload_id} for {self.key}: {e}")
+
+    async def _send_part(self, part: bytes):
+        # stop reading the request as soon as any part has failed
+        for task in self._tasks:
+            if task.done() and task.exception():
+                raise task.exception()
+
+        if self._upload_id is None:
+            upload = await run_in_threadpool(self.client.create_multipart_upload, Bucket=self.bucket, Key=self.key, **self.extra)
+            self._upload_id = upload["UploadId"]
+
+        # wait for a free slot before buffering another part
+        await self._slots.acquire()
+        self._tasks.append(asyncio.create_task(self._upload_part(len(self._tasks) + 1, part)))
+
+    async def _upload_part(self, part_number: int, part: bytes) -> dict:
+        try:
+            response = await run_in_threadpool(self.client.upload_part, Bucket=self.bucket, Key=self.key,
+                                               UploadId=self._upload_id, PartNumber=part_number, Body=part)
+            return {"ETag": response["ETag"], "PartNumber": part_number}
+        finally:
+            self._slots.release()
+
+
+# a file of a multipart/form-data request, as described by its part headers
+class FormFile:
+    def __init__(self, field_name: str, filename: str, content_type: str = None):
+        self.field_name = field_name
+        self.filename = filename
+        self.content_type = content_type
+
+
+def _decode(value: bytes) -> str:
+    try:
+        return value.decode("utf-8")
+    except UnicodeDecodeError:
+        return value.decode("latin-1")
+
+# collects the file events of the chunks passed to write (python-multipart calls back synchronously)
+# fields that aren't files are skipped
+class _FormFileParser:
+    def __init__(self, boundary: bytes):
+        self.complete = False
+        self._events = []
+        self._headers = {}
+        self._header_field = b""
+        self._header_value = b""
+        self._file = None
+        self._parser = MultipartParser(boundary, {
+            "on_part_begin": self.on_part_begin,
+            "on_header_field": self.on_header_field,
+            "on_header_value": self.on_header_value,
+            "on_header_end": self.on_header_end,
+            "on_headers_finished": self.on_headers_finished,
+            "on_part_data": self.on_part_data,
+            "on_part_end": self.on_part_end,
+            "on_end": self.on_end,
+        })
+
+    def write(self, chunk: bytes) -> list:
+        self._parser.write(chunk)
+        events, self._events = self._events, []
+        return events
+
+    def on_part_begin(self):
+        self._headers = {}
+        self._file = None
+
+    def on_header_field(self, data: bytes, start: int, end: int):
+        self._header_field += data[start:end]
+
+    def on_header_value(self, data: bytes, start: int, end: int):
+        self._header_value += data[start:end]
+
+    def on_header_end(self):
+        self._headers[self._header_field.lower()] = self._header_value
+        self._header_field = b""
+        self._header_value = b""
+
+    def on_headers_finished(self):
+        _, options = parse_options_header(self._headers.get(b"content-disposition", b""))
+        if b"filename" in options:
+            content_type = _decode(self._headers.get(b"content-type", b"")).strip()
+            self._file = FormFile(_decode(options.get(b"name", b"")), _decode(options[b"filename"]), content_type or None)
+            # announce the file before any of its data, so it can be checked first
+            self._events.append((self._file, b""))
+
+    def on_part_data(self, data: bytes, start: int, end: int):
+        if self._file is not None:
+            self._events.append((self._file, data[start:end]))
+
+    def on_part_end(self):
+        if self._file is not None:
+            self._events.append((self._file, None))
+            self._file = None
+
+    def on_end(self):
+        self.complete = True
+
+# the files of a multipart/form-data request, parsed while the body is still arriving
+# yields (file, data) pairs: (file, b"") when the file's headers have been read, (file, chunk) for each piece of its
+# content and (file, None) once the file is complete - only one file is open at a time, in the order they were sent
+async def iter_form_files(request: Request):
+    content_type, options = parse_options_header(request.headers.get("content-type", ""))
+    if content_type != b"multipart/form-data" or not options.get(b"boundary"):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Expected a multipart/form-data upload")
+
+    parser = _FormFileParser(options[b"boundary"])
+    async for chunk in request.stream():
+        try:
+            events = parser.write(chunk)
+        except MultipartParseError as e:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Malformed upload: {e}")
+        for event in events:
+            yield event
+
+    if not parser.complete:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="The upload ended before all files were received")
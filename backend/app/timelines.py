@@ -0,0 +1,186 @@
+# File: timelines.py
+# Precomputed home timelines: the posts of the users someone follows, plus their own, newest first
+# Publishing a post queues it in timeline_fanout (in the same statement as the post insert, see routers/post.py) and
+# the fan-out worker copies the queued posts into the timelines table, one row per follower, so reading a home timeline
+# is a range read on the timelines primary key instead of a join over everyone the reader follows.
+# Authors with timeline_pull_threshold followers or more are not fanned out (one post would mean that many rows) -
+# their recent posts are pulled into the page when it is read: the pull starts from the few users over the threshold
+# (users_follower_count_idx) and probes follows by primary key for each, so it costs the same for a reader who follows
+# thousands of accounts as for one who follows ten.
+# An author who drops back below the threshold only has the posts made after that (and the follow backfill, see
+# app/follows.py) in their followers' timelines.
+# The worker runs inside the api (timeline_fanout_worker_enabled), or can be drained on its own with: python -m app.timelines
+# Author: Caitlin Coulombe
+# Last Updated: 2025-08-10
+
+import asyncio
+from app.config import settings
+from app.database import pool, acquire_db, release_db
+from app import pagination
+
+
+# the posts of one page of the user's home timeline, as a filter for feed.fetch_posts (which sorts the fanned out and
+# pulled posts together and cuts the page to the limit)
+# the follows probe is a LATERAL with LIMIT 1 so the planner can't flatten it into a join over the reader's follows
+def timeline_filter(user_id: int, limit: int, after: str = None, pull_threshold: int = settings.timeline_pull_threshold):
+    fanned_out = ""
+    pulled = ""
+    cursor_params = []
+    if after:
+        created_at, last_id = pagination.decode_cursor(after)
+        fanned_out = "AND (timelines.created_at, timelines.post_id) < (%s, %s)"
+        pulled = "AND (authored.created_at, authored.id) < (%s, %s)"
+        cursor_params = [created_at, last_id]
+
+    where = f"""posts.published AND posts.id IN (
+                    (SELECT timelines.post_id FROM timelines
+                     WHERE timelines.user_id = %s {fanned_out}
+                     ORDER BY timelines.created_at DESC, timelines.post_id DESC
+                     LIMIT %s)
+                    UNION
+                    (SELECT recent.id FROM users AS pulled_authors
+                     CROSS JOIN LATERAL (
+                        SELECT 1 FROM follows
+                        WHERE follows.follower_id = %s AND follows.followee_id = pulled_authors.id
+                        LIMIT 1) AS followed
+                     CROSS JOIN LATERAL (
+                        SELECT authored.id FROM posts AS authored
+                        WHERE authored.user_id = pulled_authors.id AND authored.published {pulled}
+                        ORDER BY authored.created_at DESC, authored.id DESC
+                        LIMIT %s) AS recent
+                     WHERE pulled_authors.follower_count >= %s))"""
+    params = (user_id, *cursor_params, limit, user_id, *cursor_params, limit, pull_threshold)
+    return where, params
+
+
+# keep the timelines in step with a post being published or taken down after it was created
+async def publish_changed(cursor, post_id: int, published: bool):
+    if published:
+        await cursor.execute("""INSERT INTO timeline_fanout (post_id) VALUES (%s) ON CONFLICT DO NOTHING""", (post_id,))
+    else:
+        await cursor.execute("""WITH dequeued AS (DELETE FROM timeline_fanout WHERE post_id = %s)
+                             DELETE FROM timelines WHERE post_id = %s""", (post_id, post_id))
+
+
+# copy up to batch_size queued posts into their followers' timelines (and the author's own) and dequeue them
+# returns how many posts were claimed and how many timeline rows were written
+async def fan_out(cursor, batch_size: int, pull_threshold: int) -> dict:
+    await cursor.execute("""WITH claimed AS (
+                                DELETE FROM timeline_fanout
+                                WHERE post_id IN (
+                                    SELECT post_id FROM timeline_fanout
+                                    ORDER BY post_id
+                                    LIMIT %s
+                                    FOR UPDATE SKIP LOCKED)
+                                RETURNING post_id),
+                            fanned_out AS (
+                                INSERT INTO timelines (user_id, created_at, post_id, author_id)
+                                SELECT follows.follower_id, posts.created_at, posts.id, posts.user_id
+                                FROM claimed
+                                JOIN posts ON posts.id = claimed.post_id
+                                JOIN users AS authors ON authors.id = posts.user_id
+                                JOIN follows ON follows.followee_id = posts.user_id
+                                WHERE posts.published AND authors.follower_count < %s
+                                UNION ALL
+                                SELECT posts.user_id, posts.created_at, posts.id, posts.user_id
+                                FROM claimed
+                                JOIN posts ON posts.id = claimed.post_id
+                                WHERE posts.published
+                                ON CONFLICT DO NOTHING
+                                RETURNING 1)
+                         SELECT (SELECT COUNT(*) FROM claimed) AS posts, (SELECT COUNT(*) FROM fanned_out) AS rows""",
+                         (batch_size, pull_threshold))
+    return await cursor.fetchone()
+
+
+# copies queued posts into their followers' timelines (and the author's own), batch_size posts per statement
+# claiming, copying and dequeuing happen in one statement, so a failed batch stays queued as a whole and is retried on
+# the next poll, and rows are locked with SKIP LOCKED so several workers never fan out the same post
+class FanoutWorker:
+    def __init__(self, batch_size: int = 50, poll_interval: float = 1.0, pull_threshold: int = 5000):
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.pull_threshold = pull_threshold
+        self._wakeup = asyncio.Event()
+        self._task = None
+        self.posts = 0
+        self.rows = 0
+        self.failures = 0
+
+    # process one batch of queued posts, returns how many were claimed
+    async def run_once(self) -> int:
+        conn, cursor = await acquire_db()
+        try:
+            counts = await fan_out(cursor, self.batch_size, self.pull_threshold)
+            await conn.commit()
+        finally:
+            await release_db(conn, cursor)
+
+        self.posts += counts["posts"]
+        self.rows += counts["rows"]
+        return counts["posts"]
+
+    # keep fanning out until the queue is empty, returns how many posts were processed
+    async def drain(self) -> int:
+        total = 0
+        while True:
+            claimed = await self.run_once()
+            total += claimed
+            if claimed < self.batch_size:
+                return total
+
+    # called after a post was queued, so it reaches the timelines without waiting for the next poll
+    def wake(self):
+        self._wakeup.set()
+
+    async def _run(self):
+        while True:
+            self._wakeup.clear()
+            try:
+                await self.drain()
+            except Exception as e:
+                # the posts stay queued and are fanned out on the next poll
+                self.failures += 1
+                print(f"timelines: Fan-out batch failed: {e}")
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def stats(self) -> dict:
+        return {"posts": self.posts, "rows": self.rows, "failures": self.failures}
+
+
+def default_worker() -> FanoutWorker:
+    return FanoutWorker(batch_size=settings.timeline_fanout_batch_size, poll_interval=settings.timeline_fanout_poll_interval,
+                        pull_threshold=settings.timeline_pull_threshold)
+
+fanout_worker = default_worker() if settings.timeline_fanout_worker_enabled else None
+
+# wake the in-process worker after queueing posts (when the worker runs on its own, it picks them up on its next poll)
+def notify():
+    if fanout_worker is not None:
+        fanout_worker.wake()
+
+
+# fan out everything queued once against the configured database
+async def main():
+    try:
+        processed = await default_worker().drain()
+        print(f"Fanned out {processed} queued post(s)")
+    finally:
+        await pool.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
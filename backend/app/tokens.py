@@ -0,0 +1,143 @@
+# File: tokens.py
+# Refresh tokens, so access tokens can be short lived without sending users back through the (bcrypt) login
+# Refresh tokens are random strings stored as sha256 hashes (they are long and random, so a fast hash is enough) and
+# are rotated on every use: each refresh marks the old token as used and issues a new one in the same family.
+# Presenting a used token again means it was copied, so the whole family is revoked.
+# Access tokens carry their family as "sid", and get_current_user rejects those of revoked families with a set lookup
+# Author: Caitlin Coulombe
+# Last Updated: 2025-08-03
+
+import asyncio
+import hashlib
+import secrets
+import time
+import uuid
+from fastapi import status, HTTPException
+from app.config import settings
+from app.database import acquire_db, release_db
+
+
+def hash_token(token: str) -> str:
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+# families revoked recently enough that access tokens issued to them may not have expired yet
+# revocations made by this worker apply immediately, the ones made by other workers are picked up from the database
+# every revocation_refresh_interval seconds
+class RevocationList:
+    def __init__(self, lifetime: float, refresh_interval: float = 15.0):
+        self.lifetime = lifetime                    # seconds an entry is kept, the lifetime of an access token
+        self.refresh_interval = refresh_interval
+        self._revoked = {}                          # family -> time.monotonic() after which it can be forgotten
+        self._task = None
+        self.rejected = 0
+        self.refreshes = 0
+        self.failures = 0
+
+    def add(self, family: str):
+        self._revoked[str(family)] = time.monotonic() + self.lifetime
+
+    def is_revoked(self, family: str) -> bool:
+        expires = self._revoked.get(family)
+        if expires is None:
+            return False
+        if expires <= time.monotonic():
+            self._revoked.pop(family, None)
+            return False
+        self.rejected += 1
+        return True
+
+    # replace the list with the families revoked within the last access token lifetime
+    async def refresh(self):
+        conn, cursor = await acquire_db()
+        try:
+            await cursor.execute("""SELECT family, MIN(EXTRACT(EPOCH FROM NOW() - revoked_at)) AS age
+                                 FROM refresh_tokens
+                                 WHERE revoked_at > NOW() - make_interval(secs => %s)
+                                 GROUP BY family""", (self.lifetime,))
+            rows = await cursor.fetchall()
+        finally:
+            await release_db(conn, cursor)
+
+        now = time.monotonic()
+        revoked = {str(row["family"]): now + self.lifetime - float(row["age"]) for row in rows}
+        # keep local revocations that were not committed yet when the query ran
+        for family, expires in self._revoked.items():
+            if expires > now:
+                revoked.setdefault(family, expires)
+        self._revoked = revoked
+        self.refreshes += 1
+
+    async def _run(self):
+        while True:
+            try:
+                await self.refresh()
+            except Exception as e:
+                self.failures += 1
+                print(f"tokens: Failed to refresh the revocation list: {e}")
+            await asyncio.sleep(self.refresh_interval)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def stats(self) -> dict:
+        return {"revoked": len(self._revoked), "rejected": self.rejected, "refreshes": self.refreshes, "failures": self.failures}
+
+
+revocations = RevocationList(lifetime=settings.access_token_expire_minutes * 60, refresh_interval=settings.revocation_refresh_interval)
+
+invalid_refresh_token = HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid or expired refresh token",
+                                      headers={"WWW-Authenticate": "Bearer"})
+
+
+# store a new refresh token for the user, in a new family unless one is passed - returns (token, family)
+async def issue_refresh_token(cursor, user_id: int, family: str = None):
+    token = secrets.token_urlsafe(32)
+    family = family or str(uuid.uuid4())
+
+    await cursor.execute("""INSERT INTO refresh_tokens (token_hash, family, user_id, expires_at)
+                         VALUES (%s, %s, %s, NOW() + make_interval(days => %s))""",
+                         (hash_token(token), family, user_id, settings.refresh_token_expire_days))
+    return token, family
+
+# exchange a refresh token for the user it belongs to and a new token of the same family - returns (user, token, family)
+# the caller commits; an unknown, expired or revoked token raises a 401, and a reused one revokes its family first
+async def rotate_refresh_token(conn, cursor, token: str):
+    token_hash = hash_token(token)
+
+    await cursor.execute("""WITH used AS (
+                                UPDATE refresh_tokens SET used_at = NOW()
+                                WHERE token_hash = %s AND used_at IS NULL AND revoked_at IS NULL AND expires_at > NOW()
+                                RETURNING family, user_id)
+                            SELECT used.family, users.id, users.email, users.display_name, users.created_at
+                            FROM used JOIN users ON users.id = used.user_id""", (token_hash,))
+    user = await cursor.fetchone()
+
+    if not user:
+        await cursor.execute("""UPDATE refresh_tokens SET revoked_at = NOW()
+                             WHERE revoked_at IS NULL
+                             AND family = (SELECT family FROM refresh_tokens WHERE token_hash = %s AND used_at IS NOT NULL)
+                             RETURNING family""", (token_hash,))
+        reused = await cursor.fetchone()
+        if reused:
+            await conn.commit()
+            revocations.add(reused["family"])
+        raise invalid_refresh_token
+
+    new_token, family = await issue_refresh_token(cursor, user["id"], str(user["family"]))
+    return user, new_token, family
+
+# revoke the family of the passed token (logout) - returns the family, or None for an unknown token
+async def revoke_refresh_token(cursor, token: str):
+    await cursor.execute("""UPDATE refresh_tokens SET revoked_at = COALESCE(revoked_at, NOW())
+                         WHERE family = (SELECT family FROM refresh_tokens WHERE token_hash = %s)
+                         RETURNING family""", (hash_token(token),))
+    row = await cursor.fetchone()
+    return str(row["family"]) if row else None
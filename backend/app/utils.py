@@ -1,8 +1,10 @@
 # Includes utility functions such as hashing
 from passlib.context import CryptContext
+from app.config import settings
 
 # defining the setting for hashing passwords
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# hashes made with a different cost factor are replaced on the next successful login (see routers/auth.py)
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=settings.bcrypt_rounds)
 
 # hash the incoming password
 def hash(password: str):
@@ -15,8 +17,9 @@ def verify(plain_password, hashed_password):
 # S3 HELPER
 import boto3
 import os
+from app import metrics
 
-s3_client = boto3.client("s3", region_name=os.getenv("AWS_REGION"))
+s3_client = metrics.instrument_s3(boto3.client("s3", region_name=os.getenv("AWS_REGION")))
 BUCKET_NAME = os.getenv("S3_BUCKET_NAME")
 
 # helper function to delete a file from s3 by its key
@@ -31,6 +34,5 @@ def delete_s3_object(filename: str):
 
     try:
         s3_client.delete_object(Bucket=BUCKET_NAME, Key=filename)
-        print(f"Deleted S3 object: {filename}")
     except Exception as e:
         print(f"utils: Failed to delete S3 object: {e}")
@@ -0,0 +1,78 @@
+# File: bench_serialization.py
+# Compares rendering a 100 post feed page the old way (PostOut objects -> jsonable_encoder -> json) with the current
+# path (plain dicts -> orjson, see app/responses.py). No database or network needed.
+# Run from the backend directory with: python -m bench.bench_serialization [--posts 100] [--rounds 200]
+# Author: Caitlin Coulombe
+# Last Updated: 2025-08-01
+
+import argparse
+import json
+import timeit
+from datetime import datetime, timedelta, timezone
+from fastapi.encoders import jsonable_encoder
+from app import schema as sch
+from app import responses
+
+
+# a feed page shaped like app.feed.assemble_posts output: every post has an author with an avatar and 3 images
+def make_page(posts: int) -> list:
+    now = datetime.now(timezone.utc)
+    srcset = [{"url": f"https://bucket.s3.amazonaws.com/img_w{width}.webp", "width": width, "format": "webp"} for width in (320, 640, 1080, 1600)]
+
+    page = []
+    for i in range(posts):
+        author_id = i % 25
+        page.append({
+            "id": 100000 - i,
+            "content": f"post number {i} " * 8,
+            "published": True,
+            "created_at": now - timedelta(minutes=i),
+            "user_id": author_id,
+            "author": {
+                "id": author_id,
+                "email": f"user{author_id}@example.com",
+                "created_at": now - timedelta(days=author_id),
+                "display_name": f"User {author_id}",
+                "profile_pic": {"filename": f"avatar{author_id}.png", "url": f"https://bucket.s3.amazonaws.com/avatar{author_id}.png", "srcset": srcset[:2]},
+            },
+            "like_count": i * 3,
+            "comment_count": i,
+            "media": [{"filename": f"img{i}_{n}.jpg", "url": f"https://bucket.s3.amazonaws.com/img{i}_{n}.jpg", "srcset": srcset} for n in range(3)],
+            "liked_by_me": i % 2 == 0,
+        })
+    return page
+
+
+# what the feed endpoint did before: validate every post into PostOut, then let FastAPI encode and dump the response
+def render_models(page: list) -> bytes:
+    posts = [sch.PostOut(**post) for post in page]
+    return json.dumps(jsonable_encoder({"data": posts, "next_cursor": None})).encode()
+
+# the current path: the dicts go straight to orjson
+def render_dicts(page: list) -> bytes:
+    return responses.dumps({"data": page, "next_cursor": None})
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Feed page serialization benchmark")
+    parser.add_argument("--posts", type=int, default=100)
+    parser.add_argument("--rounds", type=int, default=200)
+    args = parser.parse_args()
+
+    page = make_page(args.posts)
+
+    # both paths must produce the same document
+    assert json.loads(render_models(page)) == json.loads(render_dicts(page)), "renderers disagree"
+
+    results = {}
+    for name, render in (("pydantic + jsonable_encoder + json", render_models), ("dicts + orjson", render_dicts)):
+        seconds = min(timeit.repeat(lambda: render(page), number=args.rounds, repeat=5)) / args.rounds
+        results[name] = seconds
+        print(f"{name:<36} {seconds * 1000:8.3f} ms per {args.posts} post page")
+
+    old, new = results.values()
+    print(f"speedup: {old / new:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,172 @@
+# File: explain_queries.py
+# Checks that the hot queries are served by indexes: runs the feed, timeline, post, search, like, comment and follow code paths against
+# the configured database through a cursor that EXPLAINs every statement before running it, and fails if any plan
+# reads one of the app's tables with a sequential scan. Sequential scans are disabled for the session, so on a small
+# (or empty) database the planner still picks an index whenever one fits - a seq scan that remains means none does.
+# Every write runs in a transaction that is rolled back, and the foreign keys' ON DELETE CASCADE lookups are checked too.
+# Run from the backend directory (after alembic upgrade head) with: python -m bench.explain_queries [--verbose]
+# Author: Caitlin Coulombe
+# Last Updated: 2025-08-10
+
+import argparse
+import asyncio
+import sys
+from datetime import datetime, timezone
+import psycopg
+from psycopg.rows import dict_row
+from fastapi import HTTPException
+from app.database import pool
+from app import feed
+from app import search
+from app import comments
+from app import likes
+from app import ownership
+from app import follows
+from app import timelines
+from app import pagination
+# the order the feed endpoints actually use, so the plans checked here are the plans they get
+from app.routers.post import FEED_ORDER
+
+TABLES = {"users", "posts", "likes", "comments", "files", "profile_pictures", "refresh_tokens", "s3_deletions",
+          "follows", "timelines", "timeline_fanout"}
+
+
+# wraps a cursor: every statement is EXPLAINed, then run for real so the code path continues with real rows
+class ExplainingCursor:
+    def __init__(self, cursor):
+        self.cursor = cursor
+        self.label = None
+        self.plans = []      # (label, query, plan)
+
+    async def execute(self, query, params=()):
+        await self.cursor.execute(f"EXPLAIN (FORMAT JSON) {query}", params)
+        plan = (await self.cursor.fetchone())["QUERY PLAN"][0]["Plan"]
+        self.plans.append((self.label, query, plan))
+        await self.cursor.execute(query, params)
+
+    async def fetchone(self):
+        return await self.cursor.fetchone()
+
+    async def fetchall(self):
+        return await self.cursor.fetchall()
+
+
+# every node of a plan
+def plan_nodes(plan: dict):
+    yield plan
+    for child in plan.get("Plans", []):
+        yield from plan_nodes(child)
+
+def seq_scans(plan: dict) -> list:
+    return [node["Relation Name"] for node in plan_nodes(plan)
+            if node["Node Type"] == "Seq Scan" and node.get("Relation Name") in TABLES]
+
+def indexes_used(plan: dict) -> list:
+    return sorted({node["Index Name"] for node in plan_nodes(plan) if "Index Name" in node})
+
+
+# ids of existing rows to run the queries with (any id works for the plans, real ones exercise the follow up queries)
+async def sample_ids(cursor) -> dict:
+    await cursor.execute("""SELECT
+                         (SELECT id FROM posts ORDER BY id DESC LIMIT 1) AS post_id,
+                         (SELECT user_id FROM posts ORDER BY id DESC LIMIT 1) AS user_id,
+                         (SELECT id FROM users ORDER BY id LIMIT 1) AS other_user_id,
+                         (SELECT id FROM comments WHERE parent_id IS NULL ORDER BY id DESC LIMIT 1) AS comment_id""")
+    ids = await cursor.fetchone()
+    return {key: value or 1 for key, value in ids.items()}
+
+
+async def run_paths(cursor, ids: dict):
+    post_id, user_id, comment_id, other_user_id = ids["post_id"], ids["user_id"], ids["comment_id"], ids["other_user_id"]
+    now = datetime.now(timezone.utc)
+    timeline, timeline_params = timelines.timeline_filter(user_id, 20)
+    timeline_after, timeline_after_params = timelines.timeline_filter(user_id, 20, pagination.encode_cursor(now, post_id))
+
+    paths = [
+        ("feed page", lambda: feed.fetch_posts(cursor, "posts.published = %s", (True,), order_by=FEED_ORDER, limit=20, offset=0, viewer_id=user_id)),
+        ("feed page after cursor", lambda: feed.fetch_posts(cursor, "posts.published = %s AND (posts.created_at, posts.id) < (%s, %s)",
+                                                    (True, now, post_id), order_by=FEED_ORDER, limit=20, offset=0, viewer_id=user_id)),
+        ("user's posts", lambda: feed.fetch_posts(cursor, "posts.user_id = %s AND posts.published = %s", (user_id, True),
+                                          order_by=FEED_ORDER, limit=20, offset=0, viewer_id=user_id)),
+        ("home timeline", lambda: feed.fetch_posts(cursor, timeline, timeline_params, order_by=FEED_ORDER, limit=20, viewer_id=user_id)),
+        ("home timeline after cursor", lambda: feed.fetch_posts(cursor, timeline_after, timeline_after_params, order_by=FEED_ORDER, limit=20, viewer_id=user_id)),
+        ("single post", lambda: feed.fetch_posts(cursor, "posts.id = %s", (post_id,), viewer_id=user_id)),
+        ("search", lambda: search.search_posts(cursor, "post", viewer_id=user_id)),
+        ("liked post ids", lambda: feed.liked_post_ids(cursor, user_id, [post_id, post_id - 1])),
+        ("like overlay", lambda: feed.overlay_likes(cursor, [{"id": post_id, "like_count": 0}, {"id": post_id - 1, "like_count": 0}], user_id)),
+        ("comments", lambda: comments.fetch_comments(cursor, "comments.post_id = %s", (post_id,), 100)),
+        ("comment threads", lambda: comments.fetch_threads(cursor, post_id, 20, 3)),
+        ("replies", lambda: comments.fetch_comments(cursor, "comments.parent_id = %s", (comment_id,), 20)),
+        ("followers", lambda: follows.fetch_follow_list(cursor, "followee_id", user_id, 50)),
+        ("following", lambda: follows.fetch_follow_list(cursor, "follower_id", user_id, 50, pagination.encode_cursor(now, other_user_id))),
+        ("follow status", lambda: follows.is_following(cursor, user_id, other_user_id)),
+        # writes, rolled back afterwards
+        ("like", lambda: likes.add_like(cursor, post_id, user_id)),
+        ("unlike", lambda: likes.remove_like(cursor, post_id, user_id)),
+        ("reply", lambda: comments.insert_reply(cursor, "explain", post_id, comment_id, user_id)),
+        ("edit post", lambda: ownership.update_owned(cursor, "posts", post_id, user_id, "content = content", (), "post")),
+        ("delete comment", lambda: comments.delete_comment(cursor, comment_id, user_id)),
+        ("follow", lambda: follows.follow(cursor, other_user_id, user_id)),
+        ("unfollow", lambda: follows.unfollow(cursor, other_user_id, user_id)),
+        ("take down post", lambda: timelines.publish_changed(cursor, post_id, False)),
+        ("queue post", lambda: timelines.publish_changed(cursor, post_id, True)),
+        ("fan out", lambda: timelines.fan_out(cursor, 50, 5000)),
+    ]
+
+    # each path runs in a savepoint, so one that fails on the sample rows (a foreign key, a 403) doesn't abort the rest
+    # - its statements were still explained
+    for label, path in paths:
+        cursor.label = label
+        await cursor.cursor.execute("SAVEPOINT path")
+        try:
+            await path()
+        except (HTTPException, psycopg.errors.IntegrityError) as e:
+            print(f"  note: {label} stopped early ({type(e).__name__})")
+            await cursor.cursor.execute("ROLLBACK TO SAVEPOINT path")
+
+
+# the lookups postgres runs for ON DELETE CASCADE / foreign key checks, one per referencing column
+async def explain_foreign_keys(cursor):
+    await cursor.cursor.execute("""SELECT conrelid::regclass::text AS table_name, attname AS column_name
+                                FROM pg_constraint
+                                JOIN pg_attribute ON attrelid = conrelid AND attnum = ANY(conkey)
+                                WHERE contype = 'f' AND array_length(conkey, 1) = 1""")
+    for row in await cursor.cursor.fetchall():
+        cursor.label = f"foreign key {row['table_name']}.{row['column_name']}"
+        await cursor.execute(f"""SELECT 1 FROM {row['table_name']} WHERE {row['column_name']} = %s""", (1,))
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="EXPLAIN the hot queries and fail on sequential scans")
+    parser.add_argument("--verbose", action="store_true", help="print the indexes used by every statement")
+    args = parser.parse_args()
+
+    conn = await pool.acquire()
+    try:
+        # client side binding, so the statements can be EXPLAINed with their parameters
+        cursor = ExplainingCursor(psycopg.AsyncClientCursor(conn, row_factory=dict_row))
+        await cursor.cursor.execute("SET LOCAL enable_seqscan = off")
+        ids = await sample_ids(cursor.cursor)
+        await run_paths(cursor, ids)
+        await explain_foreign_keys(cursor)
+        plans = cursor.plans
+    finally:
+        await conn.rollback()
+        await pool.release(conn)
+        await pool.close()
+
+    failures = 0
+    for label, query, plan in plans:
+        scanned = seq_scans(plan)
+        if scanned:
+            failures += 1
+            print(f"SEQ SCAN  {label}: {', '.join(scanned)}\n{query}\n")
+        elif args.verbose:
+            print(f"ok        {label}: {', '.join(indexes_used(plan)) or '-'}")
+
+    print(f"{len(plans)} statement(s) explained, {failures} with sequential scans")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
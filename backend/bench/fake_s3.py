@@ -0,0 +1,80 @@
+# File: fake_s3.py
+# In-memory stand-in for the boto3 s3 client, covering the calls the app makes (single and multipart uploads and
+# deletes), so the benchmarks can drive the upload and delete endpoints without a bucket or credentials
+# latency adds a fixed delay to every call (it runs on the threadpool like the real client), to model a remote S3
+# Author: Caitlin Coulombe
+# Last Updated: 2025-08-10
+
+import threading
+import time
+import uuid
+from collections import Counter
+
+
+class FakeS3:
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.objects = {}       # key -> size in bytes
+        self.calls = Counter()
+        self._uploads = {}      # upload id -> {part number: size}
+        self._lock = threading.Lock()
+
+    def _call(self, operation: str):
+        if self.latency:
+            time.sleep(self.latency)
+        with self._lock:
+            self.calls[operation] += 1
+
+    def put_object(self, Bucket: str, Key: str, Body: bytes, **extra):
+        self._call("put_object")
+        with self._lock:
+            self.objects[Key] = len(Body)
+        return {"ETag": uuid.uuid4().hex}
+
+    def create_multipart_upload(self, Bucket: str, Key: str, **extra):
+        self._call("create_multipart_upload")
+        upload_id = uuid.uuid4().hex
+        with self._lock:
+            self._uploads[upload_id] = {}
+        return {"UploadId": upload_id}
+
+    def upload_part(self, Bucket: str, Key: str, UploadId: str, PartNumber: int, Body: bytes):
+        self._call("upload_part")
+        with self._lock:
+            self._uploads[UploadId][PartNumber] = len(Body)
+        return {"ETag": uuid.uuid4().hex}
+
+    def complete_multipart_upload(self, Bucket: str, Key: str, UploadId: str, MultipartUpload: dict):
+        self._call("complete_multipart_upload")
+        with self._lock:
+            parts = self._uploads.pop(UploadId)
+            self.objects[Key] = sum(parts.values())
+        return {"Key": Key}
+
+    def abort_multipart_upload(self, Bucket: str, Key: str, UploadId: str):
+        self._call("abort_multipart_upload")
+        with self._lock:
+            self._uploads.pop(UploadId, None)
+
+    def delete_object(self, Bucket: str, Key: str):
+        self._call("delete_object")
+        with self._lock:
+            self.objects.pop(Key, None)
+
+    def delete_objects(self, Bucket: str, Delete: dict):
+        self._call("delete_objects")
+        with self._lock:
+            for item in Delete["Objects"]:
+                self.objects.pop(item["Key"], None)
+        return {"Errors": []}
+
+
+# point every s3 client of the app at the stand-in
+def install(fake: FakeS3):
+    from app import main, utils
+    from app.routers import media
+
+    media.s3_client = fake
+    utils.s3_client = fake
+    if main.deletion_worker is not None:
+        main.deletion_worker.client = fake
@@ -0,0 +1,74 @@
+# File: like_buffer_check.py
+# Checks that the write-behind like buffer (app/likes.py) loses no likes when it is stopped or cancelled in the middle
+# of writing a batch. The database write is replaced by a slow in-memory one, so no database is needed.
+# Run from the backend directory with: python -m bench.like_buffer_check
+# Author: Caitlin Coulombe
+# Last Updated: 2025-08-10
+
+import asyncio
+import sys
+from app.likes import LikeBuffer
+
+WRITE_SECONDS = 0.2
+
+
+# a LikeBuffer whose writes take WRITE_SECONDS and land in a dict instead of the database
+class CheckedBuffer(LikeBuffer):
+    def __init__(self):
+        super().__init__(flush_interval=0.01, max_size=500)
+        self.stored = {}
+        self.writing = asyncio.Event()
+
+    async def _write(self, batch: dict) -> list:
+        self.writing.set()
+        await asyncio.sleep(WRITE_SECONDS)
+        self.stored.update(batch)
+        return []
+
+
+# stopping while the flusher is writing a batch has to finish that batch and flush what came in meanwhile
+async def check_stop_during_write(found: list):
+    buffer = CheckedBuffer()
+    buffer.start()
+    buffer.add(1, 1, True)
+    buffer.add(1, 2, True)
+    await buffer.writing.wait()
+    buffer.add(2, 1, True)
+    buffer.add(1, 2, False)
+    await buffer.stop()
+
+    expected = {(1, 1): True, (1, 2): False, (2, 1): True}
+    if buffer.stored != expected:
+        found.append(f"stop during a write: stored {buffer.stored}, expected {expected}")
+    if buffer.stats()["pending"]:
+        found.append(f"stop during a write: {buffer.stats()['pending']} like(s) left in the buffer")
+
+# a flush cancelled in the middle of its write has to put the batch back, without overriding newer clicks
+async def check_cancelled_write(found: list):
+    buffer = CheckedBuffer()
+    buffer.add(1, 1, True)
+    buffer.add(1, 2, True)
+    flush = asyncio.create_task(buffer.flush())
+    await buffer.writing.wait()
+    buffer.add(1, 2, False)
+    flush.cancel()
+    await asyncio.gather(flush, return_exceptions=True)
+
+    expected = {(1, 1): True, (1, 2): False}
+    if buffer._pending != expected:
+        found.append(f"cancelled write: buffer holds {buffer._pending}, expected {expected}")
+
+
+async def main():
+    found = []
+    for check in (check_stop_during_write, check_cancelled_write):
+        await check(found)
+
+    for problem in found:
+        print(f"FAILED  {problem}")
+    print(f"{len(found)} problem(s)")
+    sys.exit(1 if found else 0)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
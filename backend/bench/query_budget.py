@@ -0,0 +1,312 @@
+# File: query_budget.py
+# Query budget check: calls each endpoint in BUDGETS below in-process (httpx over ASGI, like bench.run) against a scratch
+# database and fails if a request runs more SQL statements or borrows more pool connections than its budget, or if a
+# list endpoint runs more statements for a bigger page - the sign of an N+1 query (one statement per row) creeping back.
+# The counts come from the Server-Timing header of each response (app/metrics.py), and every cache is turned off so
+# each request runs all of its statements.
+# The scratch database (<DATABASE_NAME>_query_budget) is created on the configured server, migrated, seeded with a small
+# bench.seed data set and dropped afterwards, so the configured database is never touched. The user needs CREATEDB.
+# Run from the backend directory with: python -m bench.query_budget [--keep] [--verbose]
+# Author: Caitlin Coulombe
+# Last Updated: 2025-08-10
+
+import os
+from dotenv import load_dotenv
+
+# point the app at the scratch database with its caches off - set before the app modules below read their settings
+load_dotenv()
+BASE_DATABASE = os.environ.get("DATABASE_NAME", "")
+SCRATCH_DATABASE = f"{BASE_DATABASE}_query_budget"
+os.environ.update({
+    "DATABASE_NAME": SCRATCH_DATABASE,
+    "RESPONSE_CACHE_SIZE": "0",
+    "RESPONSE_CACHE_URL": "",
+    "PRINCIPAL_CACHE_SIZE": "0",
+    "LIKE_BUFFER_ENABLED": "false",
+    "S3_DELETE_WORKER_ENABLED": "false",
+    "SERVER_TIMING_ENABLED": "true",
+    "SLOW_QUERY_THRESHOLD_MS": "0",
+})
+
+import argparse
+import asyncio
+import io
+import re
+import subprocess
+import sys
+import httpx
+import psycopg
+from PIL import Image
+from app.main import app
+from app.database import pool, acquire_db, release_db
+from bench import fake_s3
+from bench.seed import BENCH_PASSWORD, seed
+
+# small and large page of every list endpoint - both have to fit in the seeded data for the comparison to mean anything
+PAGE_SIZES = (2, 10)
+
+# endpoint -> (max statements, max connections, paged). Paged endpoints are called once per page size and have to run
+# the same number of statements for both. Writes run in this order, each on what the previous ones created.
+# A request that authenticates spends one statement and one connection on loading the user (get_current_user, with the
+# principal cache off) - that connection goes back to the pool before the handler borrows its own, so one is held at a time.
+# Login borrows a connection twice, before and after bcrypt, and an upload once to authenticate, once to check the
+# post's owner and once to save the files, so none is held while the password is checked or the files go to s3
+BUDGETS = {
+    "feed": (5, 2, True),
+    "feed after cursor": (5, 2, True),
+    "search": (5, 2, True),
+    "user's posts": (6, 2, True),
+    "timeline": (5, 2, True),
+    "post": (5, 2, False),
+    "comments": (3, 2, True),
+    "top level comments": (3, 2, True),
+    "comment threads": (3, 2, True),
+    "replies": (3, 2, True),
+    "liked posts": (2, 2, True),
+    "user": (1, 1, False),
+    "user by email": (1, 1, False),
+    "post media": (2, 1, False),
+    "followers": (2, 2, True),
+    "following": (2, 2, True),
+    "follow status": (2, 2, False),
+    "user media": (2, 1, False),
+    "create post": (2, 2, False),
+    "edit post": (2, 2, False),
+    "upload media": (3, 3, True),
+    "comment": (2, 2, False),
+    "reply": (2, 2, False),
+    "edit comment": (2, 2, False),
+    "delete comment": (2, 2, False),
+    "like": (2, 2, False),
+    "unlike": (2, 2, False),
+    "delete post": (3, 2, False),
+    "follow": (2, 2, False),
+    "unfollow": (2, 2, False),
+    "login": (2, 2, False),
+    "refresh": (2, 1, False),
+    "logout": (1, 1, False),
+}
+
+SERVER_TIMING = re.compile(r'db;dur=[\d.]+;desc="(\d+) queries, (\d+) conn"')
+
+
+# create (or recreate) the scratch database next to the configured one and run the migrations on it
+async def create_database():
+    conn = await psycopg.AsyncConnection.connect(**{**server_kwargs(), "autocommit": True})
+    try:
+        await conn.execute(f'DROP DATABASE IF EXISTS "{SCRATCH_DATABASE}"')
+        await conn.execute(f'CREATE DATABASE "{SCRATCH_DATABASE}"')
+    finally:
+        await conn.close()
+
+    # alembic reads DATABASE_NAME from the environment set above
+    migration = subprocess.run([sys.executable, "-m", "alembic", "upgrade", "head"], capture_output=True, text=True)
+    if migration.returncode != 0:
+        sys.exit(f"migrating {SCRATCH_DATABASE} failed:\n{migration.stderr}")
+
+async def drop_database():
+    conn = await psycopg.AsyncConnection.connect(**{**server_kwargs(), "autocommit": True})
+    try:
+        await conn.execute(f'DROP DATABASE IF EXISTS "{SCRATCH_DATABASE}"')
+    finally:
+        await conn.close()
+
+# the pool's connection settings, for the configured database
+def server_kwargs() -> dict:
+    kwargs = {key: value for key, value in pool.connect_kwargs.items() if key != "cursor_factory"}
+    kwargs["dbname"] = BASE_DATABASE
+    return kwargs
+
+
+# seed a small data set, plus a comment with enough replies for a large page of them
+async def prepare(client: httpx.AsyncClient) -> dict:
+    conn, cursor = await acquire_db()
+    try:
+        await seed(cursor, users=20, posts=100, likes=500, comments=600, media=60, follows=150)
+        await cursor.execute("""SELECT user_id FROM posts WHERE published GROUP BY user_id ORDER BY COUNT(*) DESC LIMIT 1""")
+        author_id = (await cursor.fetchone())["user_id"]
+        await cursor.execute("""SELECT post_id, id FROM comments WHERE parent_id IS NULL
+                             ORDER BY COUNT(*) OVER (PARTITION BY post_id) DESC, id LIMIT 1""")
+        thread = await cursor.fetchone()
+        await cursor.execute("""INSERT INTO comments (content, post_id, user_id, parent_id)
+                             SELECT 'reply ' || n, %s, 1 + n %% 20, %s FROM generate_series(1, %s) AS n""",
+                             (thread["post_id"], thread["id"], PAGE_SIZES[1]))
+        await cursor.execute("""SELECT post_id FROM files ORDER BY post_id LIMIT 1""")
+        media_post_id = (await cursor.fetchone())["post_id"]
+        await cursor.execute("""SELECT id FROM posts WHERE published ORDER BY id DESC LIMIT %s""", (PAGE_SIZES[1],))
+        post_ids = [row["id"] for row in await cursor.fetchall()]
+        await cursor.execute("""SELECT id FROM users ORDER BY follower_count DESC, id LIMIT 1""")
+        popular_id = (await cursor.fetchone())["id"]
+        await cursor.execute("""SELECT id FROM users ORDER BY following_count DESC, id LIMIT 1""")
+        follower_id = (await cursor.fetchone())["id"]
+        await cursor.execute("""SELECT id FROM users WHERE id <> 1 ORDER BY id DESC LIMIT 1""")
+        other_user_id = (await cursor.fetchone())["id"]
+        await conn.commit()
+    finally:
+        await release_db(conn, cursor)
+
+    response = await client.post("/api/login/", data={"username": "user1@bench.example", "password": BENCH_PASSWORD})
+    response.raise_for_status()
+    token = response.json()["token"]
+
+    first_page = await client.get("/api/posts/", params={"limit": PAGE_SIZES[1]}, headers={"Authorization": f"Bearer {token['access_token']}"})
+    first_page.raise_for_status()
+
+    image = io.BytesIO()
+    Image.linear_gradient("L").resize((320, 240)).convert("RGB").save(image, format="JPEG")
+
+    return {"headers": {"Authorization": f"Bearer {token['access_token']}"}, "refresh_token": token["refresh_token"],
+            "author_id": author_id, "thread_post_id": thread["post_id"], "thread_comment_id": thread["id"],
+            "media_post_id": media_post_id, "post_ids": post_ids, "cursor": first_page.json()["next_cursor"],
+            "popular_id": popular_id, "follower_id": follower_id, "other_user_id": other_user_id,
+            "image": image.getvalue()}
+
+
+# one request to an endpoint, size is the page size of paged endpoints - writes keep the ids they create in ctx
+async def request(client: httpx.AsyncClient, name: str, ctx: dict, size: int) -> httpx.Response:
+    headers = ctx["headers"]
+
+    if name == "feed":
+        return await client.get("/api/posts/", params={"limit": size}, headers=headers)
+    if name == "feed after cursor":
+        return await client.get("/api/posts/", params={"limit": size, "after": ctx["cursor"]}, headers=headers)
+    if name == "search":
+        return await client.get("/api/posts/search", params={"q": "coffee", "limit": size}, headers=headers)
+    if name == "user's posts":
+        return await client.get(f"/api/posts/get-user/{ctx['author_id']}", params={"limit": size}, headers=headers)
+    if name == "timeline":
+        return await client.get("/api/posts/timeline", params={"limit": size}, headers=headers)
+    if name == "post":
+        return await client.get(f"/api/posts/{ctx['media_post_id']}", headers=headers)
+    if name == "comments":
+        return await client.get(f"/api/comment/{ctx['thread_post_id']}", params={"limit": size}, headers=headers)
+    if name == "top level comments":
+        return await client.get(f"/api/comment/parent/{ctx['thread_post_id']}", params={"limit": size}, headers=headers)
+    if name == "comment threads":
+        return await client.get(f"/api/comment/thread/{ctx['thread_post_id']}", params={"limit": size, "replies": size}, headers=headers)
+    if name == "replies":
+        return await client.get(f"/api/comment/replies/{ctx['thread_comment_id']}", params={"limit": size}, headers=headers)
+    if name == "liked posts":
+        return await client.get("/api/likes/", params={"post_ids": ctx["post_ids"][:size]}, headers=headers)
+    if name == "user":
+        return await client.get(f"/api/users/{ctx['author_id']}")
+    if name == "user by email":
+        return await client.get("/api/users/get-user/user1@bench.example")
+    if name == "post media":
+        return await client.get(f"/api/media/by-id/{ctx['media_post_id']}")
+    if name == "user media":
+        return await client.get("/api/media/by-user/1")
+    if name == "followers":
+        return await client.get(f"/api/follows/followers/{ctx['popular_id']}", params={"limit": size}, headers=headers)
+    if name == "following":
+        return await client.get(f"/api/follows/following/{ctx['follower_id']}", params={"limit": size}, headers=headers)
+    if name == "follow status":
+        return await client.get(f"/api/follows/{ctx['popular_id']}", headers=headers)
+
+    if name == "create post":
+        response = await client.post("/api/posts/", json={"content": "query budget", "published": True}, headers=headers)
+        ctx["new_post_id"] = response.json()["data"]["id"] if response.status_code == 201 else None
+        return response
+    if name == "edit post":
+        return await client.put(f"/api/posts/{ctx['new_post_id']}", json={"content": "query budget, edited", "published": True}, headers=headers)
+    if name == "upload media":
+        return await client.post(f"/api/media/upload-s3/{ctx['new_post_id']}", headers=headers,
+                                 files=[("files", (f"budget_{size}_{n}.jpg", ctx["image"], "image/jpeg")) for n in range(size // 2)])
+    if name == "comment":
+        response = await client.post(f"/api/comment/{ctx['new_post_id']}", json={"content": "query budget"}, headers=headers)
+        ctx["new_comment_id"] = response.json()["data"]["id"] if response.status_code == 201 else None
+        return response
+    if name == "reply":
+        return await client.post(f"/api/comment/{ctx['new_post_id']}/{ctx['new_comment_id']}", json={"content": "reply"}, headers=headers)
+    if name == "edit comment":
+        return await client.put(f"/api/comment/{ctx['new_comment_id']}", json={"content": "query budget, edited"}, headers=headers)
+    if name == "delete comment":
+        return await client.delete(f"/api/comment/{ctx['new_comment_id']}", headers=headers)
+    if name == "like":
+        return await client.post("/api/likes/", json={"post_id": ctx["new_post_id"], "dir": 1}, headers=headers)
+    if name == "unlike":
+        return await client.post("/api/likes/", json={"post_id": ctx["new_post_id"], "dir": 0}, headers=headers)
+    if name == "delete post":
+        return await client.delete(f"/api/posts/{ctx['new_post_id']}", headers=headers)
+    if name == "follow":
+        return await client.post("/api/follows/", json={"user_id": ctx["other_user_id"], "dir": 1}, headers=headers)
+    if name == "unfollow":
+        return await client.post("/api/follows/", json={"user_id": ctx["other_user_id"], "dir": 0}, headers=headers)
+
+    if name == "login":
+        return await client.post("/api/login/", data={"username": "user1@bench.example", "password": BENCH_PASSWORD})
+    if name == "refresh":
+        response = await client.post("/api/login/refresh", json={"refresh_token": ctx["refresh_token"]})
+        if response.status_code == 200:
+            ctx["refresh_token"] = response.json()["token"]["refresh_token"]
+        return response
+    if name == "logout":
+        return await client.post("/api/login/logout", json={"refresh_token": ctx["refresh_token"]})
+    raise ValueError(f"unknown endpoint {name}")
+
+
+# (statements, connections) a response reports in its Server-Timing header
+def measure(response: httpx.Response) -> tuple:
+    match = SERVER_TIMING.search(response.headers.get("server-timing", ""))
+    if match is None:
+        raise RuntimeError("the response has no Server-Timing database entry")
+    return int(match.group(1)), int(match.group(2))
+
+
+# every problem found with one endpoint, given its (size, status, statements, connections) for each call
+def problems(name: str, calls: list) -> list:
+    statements, connections, paged = BUDGETS[name]
+    found = []
+    for size, status, used, borrowed in calls:
+        page = f" (page of {size})" if paged else ""
+        if status >= 400:
+            found.append(f"{name}{page}: status {status}")
+        if used > statements:
+            found.append(f"{name}{page}: {used} statements, budget {statements}")
+        if borrowed > connections:
+            found.append(f"{name}{page}: {borrowed} connections, budget {connections}")
+    counts = {used for _, _, used, _ in calls}
+    if paged and len(counts) > 1:
+        found.append(f"{name}: statements grow with the page size ({', '.join(f'{used} for {size}' for size, _, used, _ in calls)})")
+    return found
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Check the SQL statements and connections every endpoint uses per request")
+    parser.add_argument("--keep", action="store_true", help="leave the scratch database in place afterwards")
+    parser.add_argument("--verbose", action="store_true", help="print the counts of every endpoint")
+    args = parser.parse_args()
+
+    try:
+        await create_database()
+    except psycopg.Error as e:
+        sys.exit(f"could not create the scratch database {SCRATCH_DATABASE}: {e}")
+
+    fake_s3.install(fake_s3.FakeS3())
+    found = []
+    try:
+        async with app.router.lifespan_context(app):
+            transport = httpx.ASGITransport(app=app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://budget", timeout=60) as client:
+                ctx = await prepare(client)
+                for name, (statements, connections, paged) in BUDGETS.items():
+                    calls = []
+                    for size in PAGE_SIZES if paged else (None,):
+                        response = await request(client, name, ctx, size)
+                        calls.append((size, response.status_code, *measure(response)))
+                    found.extend(problems(name, calls))
+                    if args.verbose:
+                        counts = "/".join(str(used) for _, _, used, _ in calls)
+                        print(f"{name:<20} {counts:>7} statements (budget {statements}), {max(c[3] for c in calls)} connection(s)")
+    finally:
+        if not args.keep:
+            await drop_database()
+
+    for problem in found:
+        print(f"OVER BUDGET  {problem}")
+    print(f"{len(BUDGETS)} endpoint(s) checked, {len(found)} problem(s)")
+    sys.exit(1 if found else 0)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,199 @@
+# File: run.py
+# End-to-end benchmark: drives the real FastAPI app in-process (httpx over ASGI, so routing, auth, the connection pool,
+# the response cache and serialization all run as in production) against the database filled by bench.seed, with S3
+# replaced by the in-memory stand-in from bench.fake_s3. Reports throughput and p50/p95/p99 latency per scenario, and
+# can store the results as a baseline and compare later runs against it (exiting with an error on a regression).
+# Run from the backend directory with:
+#   python -m bench.run [--requests 500] [--concurrency 10] [--scenarios feed,post,...] [--s3-latency 0.02]
+#                       [--save bench/baseline.json] [--compare bench/baseline.json] [--tolerance 0.25]
+# Baselines are only comparable on the same machine and the same seed volumes. Set RESPONSE_CACHE_SIZE=0 to measure
+# the uncached paths, and re-run bench.seed for a clean baseline (likes and uploads change the data).
+# Author: Caitlin Coulombe
+# Last Updated: 2025-08-09
+
+import argparse
+import asyncio
+import io
+import json
+import platform
+import statistics
+import sys
+import time
+from datetime import datetime, timezone
+import httpx
+from PIL import Image
+from app.main import app
+from app.database import acquire_db, release_db
+from bench import fake_s3
+from bench.seed import BENCH_PASSWORD
+
+SCENARIOS = ["feed", "feed_page", "timeline", "post", "threads", "like", "login", "upload"]
+
+# a scenario is slower than the baseline when p95 grew or throughput dropped by more than the tolerance
+COMPARED = {"p95_ms": 1, "rps": -1}
+
+
+# ids and tokens the scenarios need, read from the seeded database and logged in once up front
+async def prepare(client: httpx.AsyncClient, users: int) -> dict:
+    conn, cursor = await acquire_db()
+    try:
+        await cursor.execute("""SELECT id FROM posts WHERE published ORDER BY created_at DESC, id DESC LIMIT 200""")
+        post_ids = [row["id"] for row in await cursor.fetchall()]
+        await cursor.execute("""SELECT post_id FROM comments WHERE parent_id IS NULL GROUP BY post_id ORDER BY COUNT(*) DESC LIMIT 50""")
+        thread_ids = [row["post_id"] for row in await cursor.fetchall()]
+        await cursor.execute("""SELECT DISTINCT ON (user_id) user_id, id FROM posts WHERE user_id <= %s ORDER BY user_id, id""", (users,))
+        owned = {row["user_id"]: row["id"] for row in await cursor.fetchall()}
+    finally:
+        await release_db(conn, cursor)
+
+    if not post_ids:
+        sys.exit("the database is empty, run python -m bench.seed --reset first")
+
+    sessions = []
+    for user_id in range(1, users + 1):
+        response = await client.post("/api/login/", data={"username": f"user{user_id}@bench.example", "password": BENCH_PASSWORD})
+        response.raise_for_status()
+        token = response.json()["token"]
+        sessions.append({"user_id": user_id, "headers": {"Authorization": f"Bearer {token['access_token']}"},
+                         "own_post": owned.get(user_id)})
+
+    first_page = await client.get("/api/posts/", params={"limit": 20}, headers=sessions[0]["headers"])
+    first_page.raise_for_status()
+
+    # a photo sized jpeg: a gradient with some grain (pure noise would make resizing and encoding unrealistically slow)
+    image = io.BytesIO()
+    gradient = Image.linear_gradient("L").resize((640, 480)).convert("RGB")
+    grain = Image.effect_noise((640, 480), 64).convert("RGB")
+    Image.blend(gradient, grain, 0.2).save(image, format="JPEG", quality=85)
+
+    return {"post_ids": post_ids, "thread_ids": thread_ids or post_ids, "sessions": sessions,
+            "cursor": first_page.json()["next_cursor"], "image": image.getvalue()}
+
+
+# one request of each scenario - i numbers the request, so each scenario walks through users and posts in turn
+async def request(client: httpx.AsyncClient, scenario: str, ctx: dict, i: int) -> httpx.Response:
+    session = ctx["sessions"][i % len(ctx["sessions"])]
+    headers = session["headers"]
+
+    if scenario == "feed":
+        return await client.get("/api/posts/", params={"limit": 20}, headers=headers)
+    if scenario == "feed_page":
+        return await client.get("/api/posts/", params={"limit": 20, "after": ctx["cursor"]}, headers=headers)
+    if scenario == "timeline":
+        return await client.get("/api/posts/timeline", params={"limit": 20}, headers=headers)
+    if scenario == "post":
+        return await client.get(f"/api/posts/{ctx['post_ids'][i % len(ctx['post_ids'])]}", headers=headers)
+    if scenario == "threads":
+        return await client.get(f"/api/comment/thread/{ctx['thread_ids'][i % len(ctx['thread_ids'])]}", headers=headers)
+    if scenario == "like":
+        # every user likes then unlikes the same post, so the run leaves the likes as it found them
+        post_id = ctx["post_ids"][(i // (2 * len(ctx["sessions"]))) % len(ctx["post_ids"])]
+        return await client.post("/api/likes/", json={"post_id": post_id, "dir": 1 if (i // len(ctx["sessions"])) % 2 == 0 else 0},
+                                 headers=headers)
+    if scenario == "login":
+        return await client.post("/api/login/", data={"username": f"user{session['user_id']}@bench.example", "password": BENCH_PASSWORD})
+    if scenario == "upload":
+        if session["own_post"] is None:
+            raise RuntimeError(f"bench user {session['user_id']} has no post to upload to")
+        return await client.post(f"/api/media/upload-s3/{session['own_post']}", headers=headers,
+                                 files=[("files", (f"bench_{i}.jpg", ctx["image"], "image/jpeg"))])
+    raise ValueError(f"unknown scenario {scenario}")
+
+
+async def run_scenario(client: httpx.AsyncClient, scenario: str, ctx: dict, requests: int, concurrency: int, warmup: int) -> dict:
+    for i in range(warmup):
+        await request(client, scenario, ctx, i)
+
+    latencies = []
+    errors = 0
+    counter = iter(range(warmup, warmup + requests))
+
+    async def worker():
+        nonlocal errors
+        for i in counter:
+            started = time.perf_counter()
+            response = await request(client, scenario, ctx, i)
+            latencies.append(time.perf_counter() - started)
+            if response.status_code >= 400:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    percentiles = statistics.quantiles(latencies, n=100, method="inclusive")
+    return {
+        "requests": requests,
+        "errors": errors,
+        "rps": round(requests / elapsed, 1),
+        "p50_ms": round(percentiles[49] * 1000, 2),
+        "p95_ms": round(percentiles[94] * 1000, 2),
+        "p99_ms": round(percentiles[98] * 1000, 2),
+    }
+
+
+# the scenarios that got worse than the baseline by more than the tolerance
+def regressions(results: dict, baseline: dict, tolerance: float) -> list:
+    found = []
+    for scenario, result in results.items():
+        before = baseline.get("scenarios", {}).get(scenario)
+        if not before:
+            continue
+        for metric, direction in COMPARED.items():
+            change = (result[metric] - before[metric]) / before[metric] if before[metric] else 0.0
+            if change * direction > tolerance:
+                found.append(f"{scenario} {metric}: {before[metric]} -> {result[metric]} ({change:+.0%})")
+    return found
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="End-to-end API benchmark against the seeded database")
+    parser.add_argument("--requests", type=int, default=500, help="measured requests per scenario")
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--warmup", type=int, default=20)
+    parser.add_argument("--users", type=int, default=20, help="bench users logged in and taking turns")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS))
+    parser.add_argument("--s3-latency", type=float, default=0.0, help="seconds added to every s3 call")
+    parser.add_argument("--save", help="write the results to this baseline file")
+    parser.add_argument("--compare", help="compare the results with this baseline file")
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    args = parser.parse_args()
+
+    scenarios = args.scenarios.split(",")
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        sys.exit(f"unknown scenario(s): {', '.join(sorted(unknown))} (choose from {', '.join(SCENARIOS)})")
+
+    s3 = fake_s3.FakeS3(latency=args.s3_latency)
+    fake_s3.install(s3)
+
+    results = {}
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=60) as client:
+            ctx = await prepare(client, args.users)
+            print(f"{'scenario':<10} {'req/s':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'errors':>7}")
+            for scenario in scenarios:
+                result = await run_scenario(client, scenario, ctx, args.requests, args.concurrency, args.warmup)
+                results[scenario] = result
+                print(f"{scenario:<10} {result['rps']:>9} {result['p50_ms']:>9} {result['p95_ms']:>9} {result['p99_ms']:>9} {result['errors']:>7}")
+
+    if args.save:
+        with open(args.save, "w") as baseline:
+            json.dump({"created_at": datetime.now(timezone.utc).isoformat(), "machine": platform.node(),
+                       "requests": args.requests, "concurrency": args.concurrency, "scenarios": results}, baseline, indent=2)
+        print(f"baseline written to {args.save}")
+
+    failed = any(result["errors"] for result in results.values())
+    if args.compare:
+        with open(args.compare) as baseline:
+            found = regressions(results, json.load(baseline), args.tolerance)
+        for regression in found:
+            print(f"REGRESSION  {regression}")
+        failed = failed or bool(found)
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
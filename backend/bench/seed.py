@@ -0,0 +1,191 @@
+# File: seed.py
+# Fills the configured database with synthetic users, posts, likes, comment threads, post media, profile pictures and
+# follows for the benchmarks, using COPY so a few million rows load in seconds. The data is deterministic for a given --seed.
+# Every user's password is BENCH_PASSWORD, the like/comment/follow counters are reconciled after loading, and the home
+# timelines are filled as if every follow had just been made (see app/follows.py).
+# Seeding replaces everything in the database, so it refuses to run unless --reset is passed.
+# Run from the backend directory (after alembic upgrade head) with:
+#   python -m bench.seed --reset [--users 1000] [--posts 20000] [--likes 100000] [--comments 40000] [--media 10000]
+#                        [--follows 20000]
+# Author: Caitlin Coulombe
+# Last Updated: 2025-08-10
+
+import argparse
+import asyncio
+import random
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+from psycopg.types.json import Jsonb
+from app.database import pool, acquire_db, release_db
+from app import counters
+from app import follows as follow_graph
+from app import images
+from app import utils
+
+BENCH_PASSWORD = "benchmark"
+BUCKET_URL = "https://bench-bucket.s3.us-east-1.amazonaws.com"
+
+TABLES = ["timeline_fanout", "timelines", "follows", "s3_deletions", "refresh_tokens", "files", "profile_pictures", "likes", "comments", "posts", "users"]
+
+WORDS = ("coffee morning sunset weekend project garden hiking music photo city river bread travel friends puppy "
+         "concert coding rain summer winter lake mountain recipe book movie market street beach garden festival").split()
+
+
+def sentence(rng: random.Random, words: int) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(words))
+
+def variants(filename: str, widths: list) -> Jsonb:
+    keys = [(width, images.variant_key(filename, width, "webp")) for width in widths]
+    return Jsonb([{"key": key, "url": f"{BUCKET_URL}/{key}", "width": width, "format": "webp"} for width, key in keys])
+
+
+async def copy_rows(cursor, table: str, columns: tuple, rows):
+    async with cursor.copy(f"COPY {table} ({', '.join(columns)}) FROM STDIN") as copy:
+        for row in rows:
+            await copy.write_row(row)
+
+
+async def seed(cursor, users: int, posts: int, likes: int, comments: int, media: int, follows: int = 0, seed: int = 1):
+    rng = random.Random(seed)
+    now = datetime.now(timezone.utc)
+    start = now - timedelta(days=365)
+    timings = {}
+
+    def since(step: str, began: float):
+        timings[step] = time.perf_counter() - began
+
+    await cursor.execute(f"""TRUNCATE {", ".join(TABLES)} RESTART IDENTITY CASCADE""")
+
+    # one hash for everyone, bcrypt is far too slow to run per user
+    password = utils.hash(BENCH_PASSWORD)
+
+    began = time.perf_counter()
+    await copy_rows(cursor, "users", ("id", "email", "password", "display_name", "created_at"),
+                    ((i, f"user{i}@bench.example", password, f"Bench User {i}", start + timedelta(minutes=i)) for i in range(1, users + 1)))
+    # most users have an avatar
+    await copy_rows(cursor, "profile_pictures", ("filename", "filepath", "user_id", "variants"),
+                    ((f"avatar_{i}.png", f"{BUCKET_URL}/avatar_{i}.png", i, variants(f"avatar_{i}.png", images.AVATAR_WIDTHS))
+                     for i in range(1, users + 1) if i % 5))
+    since("users", began)
+
+    # posts are spread evenly over the year, authors are skewed so a few users post a lot
+    began = time.perf_counter()
+    step = (now - start) / max(posts, 1)
+    post_times = [start + step * i for i in range(1, posts + 1)]
+    await copy_rows(cursor, "posts", ("id", "content", "published", "created_at", "user_id"),
+                    ((i, sentence(rng, rng.randint(5, 40)), rng.random() > 0.05, post_times[i - 1],
+                      min(int(rng.paretovariate(1.2)), users) if rng.random() < 0.3 else rng.randint(1, users))
+                     for i in range(1, posts + 1)))
+    since("posts", began)
+
+    # likes favour recent posts, duplicates are dropped
+    began = time.perf_counter()
+    liked = set()
+    while len(liked) < min(likes, users * posts):
+        post_id = posts - min(int(rng.expovariate(3 / posts)), posts - 1)
+        liked.add((post_id, rng.randint(1, users)))
+    await copy_rows(cursor, "likes", ("post_id", "user_id"), sorted(liked))
+    since("likes", began)
+
+    # about a third of the comments are replies to an earlier top level comment of the same post
+    began = time.perf_counter()
+    parents = []
+    rows = []
+    for i in range(1, comments + 1):
+        if parents and rng.random() < 0.35:
+            parent_id, post_id, created_at = rng.choice(parents)
+            rows.append((i, sentence(rng, rng.randint(2, 15)), post_id, rng.randint(1, users), parent_id,
+                         created_at + timedelta(minutes=rng.randint(1, 600))))
+        else:
+            post_id = posts - min(int(rng.expovariate(5 / posts)), posts - 1)
+            created_at = post_times[post_id - 1] + timedelta(minutes=rng.randint(1, 600))
+            rows.append((i, sentence(rng, rng.randint(2, 15)), post_id, rng.randint(1, users), None, created_at))
+            parents.append((i, post_id, created_at))
+    await copy_rows(cursor, "comments", ("id", "content", "post_id", "user_id", "parent_id", "created_at"), rows)
+    since("comments", began)
+
+    # media: up to 4 images on a random selection of posts
+    began = time.perf_counter()
+    rows = []
+    while len(rows) < media:
+        post_id = rng.randint(1, posts)
+        for n in range(rng.randint(1, 4)):
+            filename = f"post_{post_id}_{n}.jpg"
+            rows.append((filename, f"{BUCKET_URL}/{filename}", post_id, variants(filename, images.POST_WIDTHS)))
+    await copy_rows(cursor, "files", ("filename", "filepath", "post_id", "variants"), rows[:media])
+    since("media", began)
+
+    # follows: half of them go to a few popular users, the rest are spread evenly
+    began = time.perf_counter()
+    followed = set()
+    while len(followed) < min(follows, users * (users - 1)):
+        follower_id = rng.randint(1, users)
+        followee_id = min(int(rng.paretovariate(1.0)), users) if rng.random() < 0.5 else rng.randint(1, users)
+        if follower_id != followee_id:
+            followed.add((follower_id, followee_id))
+    await copy_rows(cursor, "follows", ("follower_id", "followee_id", "created_at"),
+                    ((follower_id, followee_id, start + timedelta(seconds=rng.randint(0, 365 * 86400))) for follower_id, followee_id in sorted(followed)))
+    # every user's own posts, and the latest posts of everyone they follow
+    await cursor.execute("""INSERT INTO timelines (user_id, created_at, post_id, author_id)
+                         SELECT follows.follower_id, recent.created_at, recent.id, recent.user_id
+                         FROM follows
+                         CROSS JOIN LATERAL (
+                            SELECT posts.id, posts.created_at, posts.user_id FROM posts
+                            WHERE posts.user_id = follows.followee_id AND posts.published
+                            ORDER BY posts.created_at DESC, posts.id DESC
+                            LIMIT %s) AS recent
+                         UNION ALL
+                         SELECT posts.user_id, posts.created_at, posts.id, posts.user_id FROM posts WHERE posts.published
+                         ON CONFLICT DO NOTHING""", (follow_graph.BACKFILL_POSTS,))
+    since("follows", began)
+
+    # the explicit ids above don't advance the sequences
+    for table in ("users", "posts", "comments"):
+        await cursor.execute(f"""SELECT setval(pg_get_serial_sequence('{table}', 'id'), GREATEST((SELECT MAX(id) FROM {table}), 1))""")
+
+    began = time.perf_counter()
+    await counters.reconcile(cursor)
+    await counters.reconcile_follows(cursor)
+    since("counters", began)
+
+    return timings
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Seed the database with synthetic data for the benchmarks")
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--posts", type=int, default=20000)
+    parser.add_argument("--likes", type=int, default=100000)
+    parser.add_argument("--comments", type=int, default=40000)
+    parser.add_argument("--media", type=int, default=10000)
+    parser.add_argument("--follows", type=int, default=20000)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--reset", action="store_true", help="required: every table is truncated before seeding")
+    args = parser.parse_args()
+
+    if not args.reset:
+        sys.exit("seeding deletes everything in the database, pass --reset to confirm")
+    if args.users < 1 or args.posts < 1:
+        sys.exit("at least one user and one post are needed")
+
+    conn, cursor = await acquire_db()
+    try:
+        timings = await seed(cursor, args.users, args.posts, args.likes, args.comments, args.media, args.follows, args.seed)
+        await conn.commit()
+        # fresh statistics, so the planner sees the new volumes
+        await conn.set_autocommit(True)
+        await cursor.execute("ANALYZE")
+        await conn.set_autocommit(False)
+    finally:
+        await release_db(conn, cursor)
+        await pool.close()
+
+    for step, seconds in timings.items():
+        print(f"{step:<10} {seconds:7.2f}s")
+    print(f"seeded {args.users} users, {args.posts} posts, {args.likes} likes, {args.comments} comments, {args.media} media files, "
+          f"{args.follows} follows")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,206 @@
+# File: upload_check.py
+# Checks the streaming upload pipeline (app/storage.py and media.upload_form_files) against the in-memory S3 stand-in
+# from bench.fake_s3: multipart bodies are sent in-process (httpx over ASGI) to a route that runs upload_form_files,
+# and the check fails if an object doesn't arrive intact, a large file isn't sent as a bounded multipart upload,
+# anything is staged in a temporary file, or a failed upload leaves objects or open multipart uploads behind.
+# No database or bucket is needed.
+# Run from the backend directory with: python -m bench.upload_check
+# Author: Caitlin Coulombe
+# Last Updated: 2025-08-10
+
+import os
+
+# small parts, so a few parts are enough to show the memory bound - set before the app modules read their settings
+os.environ.update({
+    "S3_UPLOAD_PART_SIZE": str(5 * 1024 * 1024),
+    "S3_UPLOAD_MAX_CONCURRENCY": "2",
+    "S3_DELETE_WORKER_ENABLED": "false",
+})
+
+import asyncio
+import hashlib
+import io
+import sys
+import tracemalloc
+import httpx
+import starlette.formparsers
+from fastapi import FastAPI, Request
+from PIL import Image
+from app.config import settings
+from app import images
+from app.routers import media
+from bench import fake_s3
+
+LARGE_FILE_SIZE = 48 * 1024 * 1024
+
+# every multipart part and put_object body is hashed (not kept), so the objects can be compared with what was sent
+class CheckedS3(fake_s3.FakeS3):
+    def __init__(self, fail_part: int = None):
+        super().__init__()
+        self.fail_part = fail_part
+        self.digests = {}       # key -> [sha256 of each part, in order]
+        self._parts = {}        # upload id -> {part number: sha256}
+
+    def put_object(self, Bucket: str, Key: str, Body: bytes, **extra):
+        self.digests[Key] = [hashlib.sha256(Body).hexdigest()]
+        return super().put_object(Bucket, Key, Body, **extra)
+
+    def upload_part(self, Bucket: str, Key: str, UploadId: str, PartNumber: int, Body: bytes):
+        if PartNumber == self.fail_part:
+            raise RuntimeError(f"part {PartNumber} failed")
+        self._parts.setdefault(UploadId, {})[PartNumber] = hashlib.sha256(Body).hexdigest()
+        return super().upload_part(Bucket, Key, UploadId, PartNumber, Body)
+
+    def complete_multipart_upload(self, Bucket: str, Key: str, UploadId: str, MultipartUpload: dict):
+        parts = self._parts.pop(UploadId)
+        self.digests[Key] = [parts[part["PartNumber"]] for part in MultipartUpload["Parts"]]
+        return super().complete_multipart_upload(Bucket, Key, UploadId, MultipartUpload)
+
+    def open_uploads(self) -> int:
+        return len(self._uploads)
+
+
+# a file of size bytes of a repeating pattern, generated as it is read so the sender never holds it in memory
+class PatternFile(io.RawIOBase):
+    def __init__(self, size: int):
+        self.size = size
+        self.position = 0
+
+    def readable(self):
+        return True
+
+    def read(self, n: int = -1) -> bytes:
+        n = self.size - self.position if n is None or n < 0 else min(n, self.size - self.position)
+        data = pattern(self.position, n)
+        self.position += n
+        return data
+
+def pattern(offset: int, n: int) -> bytes:
+    block = bytes(range(251)) * 4
+    start = offset % 251
+    repeated = block[start:] + block * (n // len(block) + 1)
+    return repeated[:n]
+
+# the sha256 of each part_size piece of the pattern file, as they should arrive in s3
+def pattern_digests(size: int, part_size: int) -> list:
+    return [hashlib.sha256(pattern(offset, min(part_size, size - offset))).hexdigest() for offset in range(0, size, part_size)]
+
+
+check_app = FastAPI()
+
+@check_app.post("/upload")
+async def upload(request: Request):
+    results = await media.upload_form_files(request, 3, images.POST_WIDTHS)
+    return {"files": [filename for filename, variants in results]}
+
+# starlette's own form parsing would stage files over 1 MB in a temporary file - make sure it never runs
+def no_spooling(*args, **kwargs):
+    raise AssertionError("an upload was staged in a temporary file")
+
+
+async def post(files: list = None, content: bytes = None, headers: dict = None) -> httpx.Response:
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=check_app), base_url="http://check", timeout=120) as client:
+        return await client.post("/upload", files=files, content=content, headers=headers)
+
+def install(s3: CheckedS3) -> CheckedS3:
+    fake_s3.install(s3)
+    return s3
+
+
+async def check_small_image(found: list):
+    s3 = install(CheckedS3())
+    image = io.BytesIO()
+    Image.linear_gradient("L").resize((1200, 900)).convert("RGB").save(image, format="JPEG")
+    response = await post(files=[("files", ("small.jpg", image.getvalue(), "image/jpeg"))])
+    if response.status_code != 200:
+        found.append(f"small image: status {response.status_code} {response.text}")
+        return
+    key = response.json()["files"][0]
+    if s3.calls["put_object"] < 2 or s3.calls["create_multipart_upload"]:
+        found.append(f"small image: expected one put_object for the original plus its variants, got {dict(s3.calls)}")
+    if s3.digests.get(key) != [hashlib.sha256(image.getvalue()).hexdigest()]:
+        found.append("small image: the object in s3 differs from the upload")
+
+# cat.jpg and cat.png in one request get the same timestamp - their variants must not overwrite each other
+async def check_same_name(found: list):
+    s3 = install(CheckedS3())
+    files = []
+    for fmt, content_type in (("JPEG", "image/jpeg"), ("PNG", "image/png")):
+        image = io.BytesIO()
+        Image.linear_gradient("L").resize((400, 300)).convert("RGB").save(image, format=fmt)
+        files.append(("files", (f"cat.{fmt.lower()}", image.getvalue(), content_type)))
+    response = await post(files=files)
+    if response.status_code != 200:
+        found.append(f"same name: status {response.status_code} {response.text}")
+        return
+    variants = [key for key in s3.objects if key not in response.json()["files"]]
+    if s3.calls["put_object"] != 2 + len(variants) or not variants:
+        found.append(f"same name: {s3.calls['put_object']} put_object call(s) for {len(s3.objects)} object(s), variants were overwritten")
+
+async def check_large_file(found: list):
+    s3 = install(CheckedS3())
+    part_size = settings.s3_upload_part_size
+    tracemalloc.start()
+    response = await post(files=[("files", ("large.gif", PatternFile(LARGE_FILE_SIZE), "image/gif"))])
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    if response.status_code != 200:
+        found.append(f"large file: status {response.status_code} {response.text}")
+        return
+    key = response.json()["files"][0]
+    if s3.digests.get(key) != pattern_digests(LARGE_FILE_SIZE, part_size):
+        found.append("large file: the parts in s3 differ from the upload")
+    # the parts in flight, the buffer and the part being cut from it (see storage.S3Upload), plus the parser and the client
+    limit = (settings.s3_upload_max_concurrency + 2) * part_size + 2 * 1024 * 1024
+    if peak > limit:
+        found.append(f"large file: peak memory {peak / 2**20:.1f} MiB for a {LARGE_FILE_SIZE / 2**20:.0f} MiB file, limit {limit / 2**20:.0f} MiB")
+    print(f"large file: {len(s3.digests.get(key, []))} parts, peak memory {peak / 2**20:.1f} MiB")
+
+async def check_failed_part(found: list):
+    s3 = install(CheckedS3(fail_part=3))
+    response = await post(files=[("files", ("first.gif", b"GIF89a" * 100, "image/gif")),
+                                 ("files", ("failing.gif", PatternFile(LARGE_FILE_SIZE), "image/gif"))])
+    if response.status_code != 500:
+        found.append(f"failed part: expected status 500, got {response.status_code}")
+    if s3.objects or s3.open_uploads() or not s3.calls["abort_multipart_upload"]:
+        found.append(f"failed part: left {len(s3.objects)} object(s) and {s3.open_uploads()} open upload(s) behind")
+
+async def check_rejected_file(found: list):
+    s3 = install(CheckedS3())
+    response = await post(files=[("files", ("first.gif", b"GIF89a" * 100, "image/gif")),
+                                 ("files", ("notes.txt", b"not an image", "text/plain"))])
+    if response.status_code != 400:
+        found.append(f"rejected file: expected status 400, got {response.status_code}")
+    if s3.objects:
+        found.append(f"rejected file: left {len(s3.objects)} object(s) behind")
+
+    s3 = install(CheckedS3())
+    response = await post(files=[("files", (f"{n}.gif", b"GIF89a", "image/gif")) for n in range(4)])
+    if response.status_code != 400 or s3.objects:
+        found.append(f"too many files: status {response.status_code}, {len(s3.objects)} object(s) left behind")
+
+async def check_truncated_body(found: list):
+    s3 = install(CheckedS3())
+    body = (b"--boundary\r\nContent-Disposition: form-data; name=\"files\"; filename=\"cut.gif\"\r\n"
+            b"Content-Type: image/gif\r\n\r\n" + b"GIF89a" * 1000)
+    response = await post(content=body, headers={"Content-Type": "multipart/form-data; boundary=boundary"})
+    if response.status_code != 400:
+        found.append(f"truncated body: expected status 400, got {response.status_code}")
+    if s3.objects or s3.open_uploads():
+        found.append(f"truncated body: left {len(s3.objects)} object(s) behind")
+
+
+async def main():
+    starlette.formparsers.SpooledTemporaryFile = no_spooling
+    found = []
+    for check in (check_small_image, check_same_name, check_large_file, check_failed_part, check_rejected_file, check_truncated_body):
+        await check(found)
+
+    for problem in found:
+        print(f"FAILED  {problem}")
+    print(f"{len(found)} problem(s)")
+    sys.exit(1 if found else 0)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
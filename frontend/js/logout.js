@@ -3,19 +3,38 @@
  * Description: Handles user logout and erases the previous session token
  * Author: Caitlin Coulombe
  * Created: 2025-05-24
- * Last Updated: 2025-05-24
+ * Last Updated: 2025-08-03
  */
 
 "use strict";
 
 /**
  * Handles logout button press.
- * Removes the access token from local storage and refreshes the page.
+ * Revokes the session, removes the tokens from local storage and refreshes the page.
  *
+ * @async
  * @function logoutUser
  */
-function logoutUser() {
+async function logoutUser() {
+    const refresh_token = localStorage.getItem("refresh_token");
+
+    if(refresh_token) {
+        try {
+            await fetch(`${sessionPrefix}/logout`, {
+                method: "POST",
+                headers: {
+                    "Content-Type": "application/json"
+                },
+                body: JSON.stringify({ refresh_token })
+            });
+        }
+        catch (error) {
+            console.error("Could not revoke the session: " + error.message);
+        }
+    }
+
     localStorage.removeItem("access_token");
+    localStorage.removeItem("refresh_token");
     localStorage.removeItem("current_user");
 
     window.location.href="/frontend/index.html"
@@ -3,7 +3,7 @@
  * Description: Handles all the logic for when the page is refreshed (i.e. persist login, load ui, &c.)
  * Author: Caitlin Coulombe
  * Created: 2025-05-21
- * Last Updated: 2025-06-20
+ * Last Updated: 2025-08-10
  */
 
 "use strict";
@@ -15,10 +15,29 @@ let current_user;
 let user_id;
 const token_type = "bearer";
 
+// localhost
+// const sessionPrefix = "http://localhost:9000/api/login"
+
+// Render
+const sessionPrefix = "https://social-media-backend-z6jf.onrender.com/api/login"
+
+// refresh this long before the access token expires
+const REFRESH_MARGIN_MS = 60 * 1000;
+// every tab shares the stored refresh token, so only the tab holding this lock may exchange it
+const REFRESH_LOCK = "refresh_token";
+let refreshInFlight = null;
+
+// pick up the access token when another tab refreshes it
+window.addEventListener("storage", (event) => {
+    if(event.key === "access_token" && event.newValue) {
+        access_token = event.newValue;
+    }
+});
+
 /**
  * when the dom is loaded, retrieve the access token from storage
  */
-document.addEventListener("DOMContentLoaded", () => {
+document.addEventListener("DOMContentLoaded", async () => {
     access_token = localStorage.getItem("access_token");
     current_user = localStorage.getItem("current_user");
     user_id = localStorage.getItem("user_id");
@@ -27,8 +46,14 @@ document.addEventListener("DOMContentLoaded", () => {
     console.log("Current user: " + current_user);
     console.log("User id: " + user_id);
 
+    // an expired access token is replaced using the refresh token instead of logging in again
+    if(access_token && isTokenExpired(access_token)) {
+        await refreshAccessToken();
+    }
+
     if(access_token && !isTokenExpired(access_token) && current_user) {
         console.log("Token exists: " + access_token + ", current user is " + current_user);
+        scheduleTokenRefresh();
         const accountLink = document.getElementById("myAccountLink");
         if (accountLink) {
             accountLink.href = "user.html?user_id=" + user_id;
@@ -61,6 +86,111 @@ function isTokenExpired(token) {
     return isExpired;
 }
 
+/**
+ * Exchanges the stored refresh token for a new access token (and refresh token).
+ * Concurrent callers share one request, and tabs take turns (see withRefreshLock), since each refresh token can only be
+ * used once - sending one that another tab already exchanged would end the session in every tab.
+ *
+ * @async
+ * @function refreshAccessToken
+ * @returns {Promise<Boolean>} Resolves to true if a new access token was stored
+ */
+async function refreshAccessToken() {
+    if(refreshInFlight) {
+        return refreshInFlight;
+    }
+
+    refreshInFlight = withRefreshLock(async () => {
+        // another tab may have refreshed while this one waited for the lock, use its token instead of refreshing again
+        const stored_access_token = localStorage.getItem("access_token");
+        if(stored_access_token && !needsRefresh(stored_access_token)) {
+            access_token = stored_access_token;
+            return true;
+        }
+
+        const refresh_token = localStorage.getItem("refresh_token");
+        if(!refresh_token) {
+            return false;
+        }
+
+        try {
+            const response = await fetch(`${sessionPrefix}/refresh`, {
+                method: "POST",
+                headers: {
+                    "Content-Type": "application/json"
+                },
+                body: JSON.stringify({ refresh_token })
+            });
+
+            if(!response.ok) {
+                throw new Error(`Response status: ${response.status}`);
+            }
+
+            const json = await response.json();
+            access_token = json.token.access_token;
+            localStorage.setItem("access_token", access_token);
+            localStorage.setItem("refresh_token", json.token.refresh_token);
+            return true;
+        }
+        catch (error) {
+            console.error("Could not refresh the session: " + error.message);
+            // only forget the token this tab sent, never one another tab has stored since
+            if(localStorage.getItem("refresh_token") === refresh_token) {
+                localStorage.removeItem("refresh_token");
+            }
+            return false;
+        }
+    }).finally(() => {
+        refreshInFlight = null;
+    });
+
+    return refreshInFlight;
+}
+
+/**
+ * Determines if the access token is within REFRESH_MARGIN_MS of expiring (or already expired)
+ *
+ * @function needsRefresh
+ * @param {string} token - The access token being checked
+ * @returns {Boolean} Returns true if the token should be refreshed now
+ */
+function needsRefresh(token) {
+    const payload = JSON.parse(atob(token.split(".")[1]));
+    return Date.now() >= payload.exp * 1000 - REFRESH_MARGIN_MS;
+}
+
+/**
+ * Runs the callback while holding a lock shared by every tab of the site (Web Locks API), so only one tab at a time
+ * uses the stored refresh token. Browsers without the API run the callback straight away.
+ *
+ * @async
+ * @function withRefreshLock
+ * @param {Function} callback - The async function to run while holding the lock
+ * @returns {Promise<*>} Resolves to the callback's result
+ */
+async function withRefreshLock(callback) {
+    if(navigator.locks) {
+        return navigator.locks.request(REFRESH_LOCK, callback);
+    }
+    return callback();
+}
+
+/**
+ * Refreshes the access token shortly before it expires, so requests made later on the page keep working
+ *
+ * @function scheduleTokenRefresh
+ */
+function scheduleTokenRefresh() {
+    const payload = JSON.parse(atob(access_token.split(".")[1]));
+    const delay = Math.max(payload.exp * 1000 - Date.now() - REFRESH_MARGIN_MS, 0);
+
+    setTimeout(async () => {
+        if(await refreshAccessToken()) {
+            scheduleTokenRefresh();
+        }
+    }, delay);
+}
+
 /**
  * ensures the posts for the proper page are rendered
  *
@@ -3,7 +3,7 @@
  * Description: Handles like path operations which involves adding or removing a like from the passed post
  * Author: Caitlin Coulombe
  * Created: 2025-06-26
- * Last Updated: 2025-06-29
+ * Last Updated: 2025-07-30
  */
 
 
@@ -84,6 +84,76 @@ async function getComments(post_id) {
     }
 }
 
+/**
+ * Retrieves the comment threads for a single post: the parent comments, each with its first replies already nested
+ * Sends a GET request to the /comment/thread endpoint
+ *
+ * @async
+ * @function getCommentThreads
+ * @param {int} post_id - the post to load the comments of
+ * @param {int} replies - how many replies to include with each parent comment
+ * @returns {Promise<Array>} the parent comments, with replies, reply_count and replies_cursor on each one
+ * @throws {Error} If the network request fails or response is not OK.
+ */
+async function getCommentThreads(post_id, replies = 3) {
+    const url = commentPrefix + "/thread/" + post_id + "?limit=100&replies=" + replies;
+
+    try {
+        const get_response = await fetch(url, {
+            method: "GET",
+            headers: {
+                "Authorization": `Bearer ${access_token}`
+            }
+        });
+
+        if(!get_response.ok) {
+            throw new Error(`Get Reponse status: ${get_response.status}`);
+        }
+
+        const json = await get_response.json();
+        return json.data;
+    }
+    catch (error) {
+        console.error(error.message);
+    }
+}
+
+/**
+ * Retrieves the next page of replies to a comment
+ * Sends a GET request to the /comment/replies endpoint with the cursor of the last reply already shown
+ *
+ * @async
+ * @function getReplies
+ * @param {int} comment_id - the parent comment
+ * @param {string} after - the replies_cursor of the thread (or next_cursor of the previous page of replies)
+ * @returns {Promise<Object>} the replies (data) and the cursor for the page after them (next_cursor)
+ * @throws {Error} If the network request fails or response is not OK.
+ */
+async function getReplies(comment_id, after) {
+    let url = commentPrefix + "/replies/" + comment_id + "?limit=20";
+    if(after) {
+        url += `&after=${encodeURIComponent(after)}`;
+    }
+
+    try {
+        const get_response = await fetch(url, {
+            method: "GET",
+            headers: {
+                "Authorization": `Bearer ${access_token}`
+            }
+        });
+
+        if(!get_response.ok) {
+            throw new Error(`Get Reponse status: ${get_response.status}`);
+        }
+
+        return await get_response.json();
+    }
+    catch (error) {
+        console.error(error.message);
+    }
+}
+
 /**
  * Handles logic for creating and storing a new post.
  * Sends a POST request to the /posts endpoint containing the content for a new post.
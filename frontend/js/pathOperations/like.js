@@ -3,7 +3,7 @@
  * Description: Handles like path operations which involves adding or removing a like from the passed post
  * Author: Caitlin Coulombe
  * Created: 2025-05-19
- * Last Updated: 2025-05-20
+ * Last Updated: 2025-08-10
  */
 
 
@@ -16,36 +16,21 @@
 const likePrefix= "https://social-media-backend-z6jf.onrender.com/api/likes"
 
 /**
- * Determines if a like is to be added to or removed from the post.
+ * Adds a like to or removes a like from the post.
  * Sends a POST request to the /likes endpoint with the id of the post and whether a like should be added or removed.
  *
  * @async
  * @function likePost
- * @returns {Promise<void>} Resolves when the like is added or removed and the message is displayed on the page.
+ * @param {int} post_id - the post to like or unlike
+ * @param {Boolean} isLiked - whether the user currently likes the post (the like is removed if so)
+ * @returns {Promise<Boolean>} Resolves to true once the like has been added or removed.
  * @throws {Error} If the network request fails or response is not OK.
  */
-async function likePost(post_id) {   
-    const get_url = likePrefix + "/" + post_id;
+async function likePost(post_id, isLiked) {
     const post_url = likePrefix;
+    const dir = isLiked ? 0 : 1;
 
     try {
-        // check if the user is adding or removing a like (based on if it is already liked or not)
-        const get_response = await fetch(get_url, {
-            method: "GET",
-            headers: {
-                "Authorization": `Bearer ${access_token}`
-            }
-        });
-
-        if(!get_response.ok) {
-            throw new Error('Get Reponse status: ${get_response.status}');
-        }
-
-        const data = await get_response.json();
-        const dir = 1 - data.liked;
-        console.log(dir);
-
-        // actually add/remove the like
         const post_response = await fetch(post_url, {
             method: "POST",
             headers: {
@@ -56,71 +41,55 @@ async function likePost(post_id) {
         });
 
         if(!post_response.ok) {
-            throw new Error('Post Reponse status: ${post_response.status}');
+            throw new Error(`Post Reponse status: ${post_response.status}`);
         }
 
         const json = await post_response.json();
         console.log(json);
+        return true;
     }
     catch (error) {
         console.error(error.message);
+        return false;
     }
 }
 
 /**
- * Determines if a like is to be added to or removed from the post.
- * Sends a POST request to the /likes endpoint with the id of the post and whether a like should be added or removed.
+ * Finds which of the passed posts the user has liked with a single request.
+ * Sends a GET request to the /likes endpoint with the ids of the posts.
  *
  * @async
- * @function getIsLiked
- * @returns {Boolean} returns true if this user has already liked the post
+ * @function getLikedPosts
+ * @param {int[]} post_ids - the posts to check
+ * @returns {Promise<Set>} the ids of the posts the user has liked
  * @throws {Error} If the network request fails or response is not OK.
  */
-async function getIsLiked(post_id) {
-    const url = likePrefix + "/" + post_id;
+async function getLikedPosts(post_ids) {
+    if(post_ids.length === 0) {
+        return new Set();
+    }
+
+    const params = new URLSearchParams();
+    post_ids.forEach((id) => params.append("post_ids", id));
+    const url = likePrefix + "/?" + params.toString();
 
     try {
-        // check if the user is adding or removing a like (based on if it is already liked or not)
-        const get_response = await fetch(url, {
+        const response = await fetch(url, {
             method: "GET",
             headers: {
                 "Authorization": `Bearer ${access_token}`
             }
         });
 
-        if(!get_response.ok) {
-            throw new Error('Reponse status: ${get_response.status}');
+        if(!response.ok) {
+            throw new Error(`Reponse status: ${response.status}`);
         }
 
-        const data = await get_response.json();
-        const isLiked = data.liked;
-        // console.log("Is liked method: post " + post_id + " is liked? " + isLiked);
-        return isLiked;
+        const data = await response.json();
+        return new Set(data.liked);
     }
     catch (error) {
         console.error(error.message);
+        return new Set();
     }
 }
-
-
-/**
- * Determines if a like is to be added to or removed from the post.
- * Sends a POST request to the /likes endpoint with the id of the post and whether a like should be added or removed.
- *
- * @async
- * @function getLikeCount
- * @returns {Boolean} returns true if this user has already liked the post
- * @throws {Error} If the network request fails or response is not OK.
- */
-async function getLikeCount(post_id) {
-    const url = likePrefix + "/" + post_id;
-
-    try {
-        const post = await getPost(post_id);
-        const numLikes = post.like_count;
-        return numLikes;
-    }
-    catch (error) {
-        console.error(error.message);
-    }
-}
\ No newline at end of file
@@ -53,6 +53,7 @@ async function loginUser(email, password) {
         access_token = json.token.access_token;
         const user_id = json.token.id;
         localStorage.setItem("access_token", access_token);  // stores is so it can be called on refresh
+        localStorage.setItem("refresh_token", json.token.refresh_token);  // exchanged for a new access token once it expires
         localStorage.setItem("current_user", email);  
         localStorage.setItem("user_id", user_id);
         console.log("User id: ",user_id);
@@ -17,26 +17,33 @@ console.log("Posts.js loaded");
 // Render
 const postPrefix= "https://social-media-backend-z6jf.onrender.com/api/posts"
 
+// cursor for the next page of the home feed (null once the last page has been loaded)
+let nextPostCursor = null;
+let loadingPosts = false;
+
 /**
- * Handles logic for retrieving all posts.
- * Sends a GET request to the /posts endpoint, receiving all posts from the database that match the query parameters.
+ * Handles logic for retrieving a page of posts.
+ * Sends a GET request to the /posts endpoint, receiving the next page of posts from the database that match the query parameters.
+ * The first page replaces the feed, later pages (requested with the cursor from the previous page) are appended to it.
  *
  * @async
  * @function getPosts
+ * @param {string} after - the next_cursor returned with the previous page, or null for the first page
  * @returns {Promise<void>} Resolves when posts are retrieved and displayed on page.
  * @throws {Error} If the network request fails or response is not OK.
  */
-async function getPosts() {
+async function getPosts(after = null) {
     // query parameters
-    // TODO: Update limit/skip to support pagination dynamically
-    const limit = 100;  
-    const skip = 0;
+    const limit = 20;
     const search = "";
     let published = current_user !== "demo@example.com"
 
-    // const url = postPrefix + "?limit=" + limit + "&skip=" + skip + "&search=" + search + "&published=" + published;
-    const url = `${postPrefix}/?limit=${limit}&skip=${skip}&published=${published}&search=${search}`;
+    let url = `${postPrefix}/?limit=${limit}&published=${published}&search=${search}`;
+    if(after) {
+        url += `&after=${encodeURIComponent(after)}`;
+    }
 
+    loadingPosts = true;
     try {
         const response = await fetch(url, {
             method: "GET",
@@ -51,14 +58,30 @@ async function getPosts() {
 
         const json = await response.json();
         const posts = json.data;
+        nextPostCursor = json.next_cursor;
         // render posts - probably move this somewhere else?
-        await renderMultiplePosts(posts)
+        await renderMultiplePosts(posts, after !== null)
     }
     catch (error) {
         console.error(error.message);
     }
+    finally {
+        loadingPosts = false;
+    }
 }
 
+/**
+ * Infinite scroll for the home feed: loads the next page of posts when the user nears the bottom of the page
+ */
+window.addEventListener("scroll", () => {
+    const onHomePage = !new URLSearchParams(window.location.search).get("user_id");
+    const nearBottom = window.innerHeight + window.scrollY >= document.body.offsetHeight - 800;
+
+    if(onHomePage && nearBottom && nextPostCursor && !loadingPosts) {
+        getPosts(nextPostCursor);
+    }
+});
+
 /**
  * Handles logic for retrieving a single posts.
  * Sends a GET request to the /posts/{id} endpoint, receiving a single post based on the send id.
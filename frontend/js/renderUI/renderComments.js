@@ -91,7 +91,7 @@ async function renderParentComment(comment, container){
     const profilePic =  clone.querySelector(".profilePic");
     if(comment.author.profile_pic) {
         // console.log("Has a profile pic: " + post.author.profile_pic.url)
-        profilePic.src = comment.author.profile_pic.url;
+        setImageSources(profilePic, comment.author.profile_pic, "96px");
         profilePic.alt = comment.author.profile_pic.filename;
     } else {
         profilePic.src = "/../res/img/default_icon.png";
@@ -175,7 +175,7 @@ async function renderChildComment(comment, container){
     const profilePic =  clone.querySelector(".profilePic");
     if(comment.author.profile_pic) {
         // console.log("Has a profile pic: " + post.author.profile_pic.url)
-        profilePic.src = comment.author.profile_pic.url;
+        setImageSources(profilePic, comment.author.profile_pic, "96px");
         // profilePic.src = "http://localhost:9000/" + comment.author.profile_pic.url;
         profilePic.alt = comment.author.profile_pic.filename;
     } else {
@@ -3,7 +3,7 @@
  * Description: Uses the template in index.html to create a post. Contains all of the logic related to rendering a post
  * Author: Caitlin Coulombe
  * Created: 2025-05-20
- * Last Updated: 2025-06-29
+ * Last Updated: 2025-07-30
  */
 
 "use strict";
@@ -21,14 +21,34 @@ async function loadPostTemplate() {
     }
 }
 
+/**
+ * Points an img at the resized variants of an uploaded image so the browser downloads the smallest one that fits.
+ * The original upload stays as the src fallback.
+ *
+ * @function setImageSources
+ * @param {Element} img - the image element to update
+ * @param {json} media - the media (or profile picture) json returned by the api
+ * @param {string} sizes - how wide the image is displayed (img sizes attribute)
+ */
+function setImageSources(img, media, sizes) {
+    img.src = media.url;
+
+    const variants = (media.srcset || []).filter((variant) => variant.format === "webp");
+    if(variants.length > 0) {
+        img.srcset = variants.map((variant) => `${variant.url} ${variant.width}w`).join(", ");
+        img.sizes = sizes;
+    }
+}
+
 /**
  * Uses template.html to generate multiple post
  *
  * @async
  * @function renderMultiplePost
  * @param {json} posts - the posts that are to be rendered
+ * @param {Boolean} append - true to add the posts below the ones already rendered (next page of the feed)
  */
-async function renderMultiplePosts(posts) {
+async function renderMultiplePosts(posts, append = false) {
     console.log("from render multiple posts:",posts);
 
     await loadPostTemplate();
@@ -36,10 +56,12 @@ async function renderMultiplePosts(posts) {
     const container = document.getElementById("postsContainer");
 
     // clear any old posts
-    container.innerHTML = "";
+    if(!append) {
+        container.innerHTML = "";
+    }
 
     // add warning for demo users
-    if(current_user === "demo@example.com") {
+    if(!append && current_user === "demo@example.com") {
         console.log("This is the demo user");
         const demoWarningMsg = `
             Welcome to my social media application!<br>
@@ -53,6 +75,13 @@ async function renderMultiplePosts(posts) {
         container.appendChild(demoWarningContainer);
     }
 
+    // posts from the api carry liked_by_me, anything else is checked with a single request for the whole page
+    const unchecked = posts.filter((post) => post.liked_by_me === undefined).map((post) => post.id);
+    const likedPosts = await getLikedPosts(unchecked);
+    unchecked.forEach((id) => {
+        posts.find((post) => post.id === id).liked_by_me = likedPosts.has(id);
+    });
+
     for (const post of posts) {
         // clone the template
         const clone = postTemplate.content.cloneNode(true);
@@ -68,7 +97,7 @@ async function renderMultiplePosts(posts) {
         if(post.author.profile_pic) {
             // console.log("Has a profile pic: " + post.author.profile_pic.url)
             
-            profilePic.src = post.author.profile_pic.url;
+            setImageSources(profilePic, post.author.profile_pic, "96px");
 
             profilePic.alt = post.author.profile_pic.filename;
         } else {
@@ -161,27 +190,18 @@ async function renderPost_likeButton(post, postElement, likeCount) {
     let heartImg = document.createElement("img");
     heartImg.classList.add("likeButtonImg")
 
-    if(await getIsLiked(post.id)) {
-        // console.log("is liked");
-        heartImg.src = "/../../res/img/full_heart.png";
-    } else {
-        // console.log("is NOT liked");
-        heartImg.src = "/../../res/img/empty_heart_red.png";
-    }
+    let isLiked = post.liked_by_me;
+    heartImg.src = isLiked ? "/../../res/img/full_heart.png" : "/../../res/img/empty_heart_red.png";
 
     likeButton.appendChild(heartImg);
 
-        likeButton.addEventListener("click", async () => {
-        await likePost(post.id);
-        const isLiked = await getIsLiked(post.id);
-        if(isLiked) {
-            // console.log("is liked");
-            heartImg.src = "/../../res/img/full_heart.png";
-        } else {
-            // console.log("is NOT liked");
-            heartImg.src = "/../../res/img/empty_heart_red.png";
+    likeButton.addEventListener("click", async () => {
+        if(!await likePost(post.id, isLiked)) {
+            return;
         }
-        likeCount.textContent = await getLikeCount(post.id);
+        isLiked = !isLiked;
+        heartImg.src = isLiked ? "/../../res/img/full_heart.png" : "/../../res/img/empty_heart_red.png";
+        likeCount.textContent = Number(likeCount.textContent) + (isLiked ? 1 : -1);
     });
 }
 
@@ -236,7 +256,7 @@ async function renderPost_media(post, postElement) {
             // console.log(mediaItem.url);
             
             // console.log('Media URL:', mediaItem.url);
-            img.src = mediaItem.url;
+            setImageSources(img, mediaItem, "(max-width: 700px) 100vw, 700px");
 
             // console.log(img.src);
             img.alt = mediaItem.filename;
@@ -360,7 +380,7 @@ async function renderPost_allComments(post, postElement, parent_id) {
     // show the first three parent comments
     const commentContainer = postElement.querySelector(".commentContainer");
     commentContainer.innerHTML = "";
-    const comments = await getComments(post.id)
+    const threads = await getCommentThreads(post.id)
     
     // console.log("IN RENDER UI, FROM GET ALL COMMENTS: ", comments);
 
@@ -394,31 +414,9 @@ async function renderPost_allComments(post, postElement, parent_id) {
     newCommentForm.appendChild(commentContent);
     newCommentForm.appendChild(submitComment);
 
-    // render parent comments
-    if(comments && comments.length > 0) {
-        // split the comments into parents and children
-        const parents = [];
-        const children = [];
-
-        for(const comment of comments) {
-            if(comment.parent_id === null || comment.parent_id === undefined) {
-                // console.log("This is a parent: ", comment);
-                parents.push(comment);
-            } else {
-                // console.log("This is a child: ", comment)
-                children.push(comment);
-            }
-        }
-
-        // sort chronologically
-        parents.sort((a, b) => new Date(a.created_at) - new Date(b.created_at));
-        children.sort((a, b) => new Date(a.created_at) - new Date(b.created_at));
-
-        // console.log("Parents: ", parents);
-        // console.log("Children: ", children);
-
-        // for each parent: load it, get its child container, give it all its children
-        for (const parent of parents) {
+    // render parent comments, each one comes with its first replies already nested
+    if(threads && threads.length > 0) {
+        for (const parent of threads) {
             // console.log("Rendering parent: ", parent);
             const commentElement = await renderParentComment(parent, commentContainer);
             
@@ -444,30 +442,31 @@ async function renderPost_allComments(post, postElement, parent_id) {
                 // await renderPost_allComments(post, postElement, null);
             };
             
-            // console.log("Need to append children now");
             const childContainer = commentElement.querySelector(".childContainer");
+            await renderPost_replies(post, postElement, parent.replies, childContainer);
 
-            for (const child of children) {
-                // console.log(`Checking if child ${child.id} belongs to parent ${parent.id}`);
-                // console.log("child.parent_id type:", typeof child.parent_id, "value:", child.parent_id);
-                // console.log("parent.id type:", typeof parent.id, "value:", parent.id);
-
-                if (Number(child.parent_id) === Number(parent.id)) {
-                    // console.log(`Match found! child ${child.id} belongs to parent ${parent.id}`);
-                    const childElement = await renderChildComment(child, childContainer);
-                    childContainer.style.display = "block";
-                            
-                    // EDIT BUTTON LISTENER
-                    const editButton = childElement.querySelector(".editButton");
-                    editButton.onclick = async (event) => {
-                        event.preventDefault();
-                        console.log("Editting a child");
-                        // console.log("Reply clicked for comment ID:", parent.id);
-                        await createCommentUpdateForm(post, postElement, childElement, child.id);
-
-                        // await renderPost_allComments(post, postElement, null);
-                    };
-                }
+            // the rest of the replies are loaded a page at a time
+            if(parent.replies_cursor) {
+                const moreRepliesButton = document.createElement("button");
+                moreRepliesButton.classList.add("loadCommentsButton", "text-center");
+                moreRepliesButton.textContent = "Show more replies";
+                childContainer.appendChild(moreRepliesButton);
+
+                let repliesCursor = parent.replies_cursor;
+                moreRepliesButton.onclick = async (event) => {
+                    event.preventDefault();
+                    const page = await getReplies(parent.id, repliesCursor);
+                    if(!page) {
+                        return;
+                    }
+
+                    moreRepliesButton.remove();
+                    await renderPost_replies(post, postElement, page.data, childContainer);
+                    repliesCursor = page.next_cursor;
+                    if(repliesCursor) {
+                        childContainer.appendChild(moreRepliesButton);
+                    }
+                };
             }
 
             if(parent_id != null && parent_id == parent.id) {
@@ -483,6 +482,31 @@ async function renderPost_allComments(post, postElement, parent_id) {
     }
 }
 
+/**
+ * Renders replies into the child container of their parent comment
+ *
+ * @async
+ * @function renderPost_replies
+ * @param {*} post - the current json data for the post that is being rendered
+ * @param {*} postElement - the post element that is currently being created to append to the page
+ * @param {Array} replies - the replies to render (oldest first)
+ * @param {*} childContainer - the child container of the parent comment
+ */
+async function renderPost_replies(post, postElement, replies, childContainer) {
+    for (const child of replies) {
+        const childElement = await renderChildComment(child, childContainer);
+        childContainer.style.display = "block";
+
+        // EDIT BUTTON LISTENER
+        const editButton = childElement.querySelector(".editButton");
+        editButton.onclick = async (event) => {
+            event.preventDefault();
+            console.log("Editting a child");
+            await createCommentUpdateForm(post, postElement, childElement, child.id);
+        };
+    }
+}
+
 /**
  * Fills in the existing value for the content and makes the form visible.
  *